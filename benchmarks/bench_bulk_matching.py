@@ -0,0 +1,64 @@
+""" Сравнение оценки "один против всех": цикл по множествам (как раньше в users_with_similar_interests)
+против битовой матрицы InterestMatrix.
+
+Запуск: python -m benchmarks.bench_bulk_matching [10000 100000 1000000]
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+from project.bulk_matching import InterestMatrix
+
+NUM_TERMS = 500
+TERMS_PER_USER = (2, 8)
+
+
+def generate(num_users: int, seed: int = 0):
+    """ Интересы распределены неравномерно: популярные встречаются чаще """
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(NUM_TERMS)]
+    return [set(rng.choices(range(NUM_TERMS), weights, k=rng.randint(*TERMS_PER_USER))) for _ in range(num_users)]
+
+
+def set_loop(term_sets, query: int):
+    own = term_sets[query]
+    scores = []
+    for other, terms in enumerate(term_sets):
+        if other != query:
+            common = len(own & terms)
+            scores.append(common / (len(own) + len(terms) - common))
+    return scores
+
+
+def main(sizes):
+    print(f"{'users':>10} {'set loop, ms':>14} {'matrix, ms':>12} {'build, s':>10} {'speedup':>9}")
+    for size in sizes:
+        term_sets = generate(size)
+
+        start = time.perf_counter()
+        matrix = InterestMatrix(range(size), term_sets)
+        build = time.perf_counter() - start
+
+        queries = random.Random(1).sample(range(size), 5)
+        start = time.perf_counter()
+        for query in queries:
+            set_loop(term_sets, query)
+        loop_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+        start = time.perf_counter()
+        for query in queries:
+            matrix.one_vs_all(query)
+        matrix_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+        # Проверяем, что оценки совпадают
+        expected = np.array(set_loop(term_sets, queries[0]))
+        got = np.delete(matrix.one_vs_all(queries[0]), queries[0])
+        assert np.allclose(expected, got)
+
+        print(f"{size:>10} {loop_ms:>14.1f} {matrix_ms:>12.1f} {build:>10.2f} {loop_ms / matrix_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
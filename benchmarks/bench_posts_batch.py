@@ -0,0 +1,48 @@
+""" Скорость загрузки постов: по одному INSERT на пост (crud.push_post) против пачек (crud.push_posts).
+
+Нужна живая БД со схемой из migrations. Создаёт временного пользователя и удаляет его вместе с постами.
+Запуск: python -m benchmarks.bench_posts_batch [число постов] [URL базы]
+"""
+import asyncio
+import sys
+import time
+
+from databases import Database
+
+from project import crud, schemas
+from project.config import SQLALCHEMY_DATABASE_URL, POSTS_BATCH_CHUNK
+from project.models.models import users_table
+
+
+async def main(count: int, url: str):
+    db = Database(url)
+    await db.connect()
+    user_id = await db.execute(users_table.insert().values(
+        email="bench-posts@example.com", name="Bench Posts", hashed_password="-", is_superuser=False
+    ))
+    posts_in = [schemas.PostsIn(title=f"post {i}", content="x" * 200) for i in range(count)]
+    try:
+        start = time.perf_counter()
+        for post in posts_in:
+            await crud.push_post(db=db, user_id=user_id, post=post)
+        single = time.perf_counter() - start
+        await crud.delete_posts(db=db, user_id=user_id)
+
+        start = time.perf_counter()
+        async with db.transaction():
+            for i in range(0, count, POSTS_BATCH_CHUNK):
+                await crud.push_posts(db=db, user_id=user_id, posts_in=posts_in[i:i + POSTS_BATCH_CHUNK])
+        batch = time.perf_counter() - start
+    finally:
+        await crud.delete_posts(db=db, user_id=user_id)
+        await db.execute(users_table.delete().where(users_table.c.id == user_id))
+        await db.disconnect()
+
+    print(f"posts: {count}")
+    print(f"single INSERT per post: {count / single:>10.0f} posts/s")
+    print(f"batches of {POSTS_BATCH_CHUNK}:       {count / batch:>10.0f} posts/s ({single / batch:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000,
+                     sys.argv[2] if len(sys.argv) > 2 else SQLALCHEMY_DATABASE_URL))
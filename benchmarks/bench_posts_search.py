@@ -0,0 +1,87 @@
+""" Полнотекстовый поиск по постам: crud.search_posts (posts.search_vector + GIN-индекс) против ILIKE по
+заголовку и тексту и против того же ранжирования в памяти процесса (project.posts.search.PostsSearchIndex).
+
+Нужна живая БД со схемой из migrations. Создаёт временного пользователя, генерирует ему посты из случайных слов
+одним INSERT ... SELECT generate_series и удаляет их в конце. Индекс в памяти строится по первым 100 000 постам.
+Запуск: python -m benchmarks.bench_posts_search [число постов] [URL базы]
+"""
+import asyncio
+import sys
+import time
+
+import sqlalchemy
+from databases import Database
+
+from project import crud
+from project.config import SQLALCHEMY_DATABASE_URL
+from project.models.models import users_table
+from project.posts.posts import posts_table
+from project.posts.search import PostsSearchIndex
+
+WORDS = 5000
+IN_MEMORY_POSTS = 100_000
+RUNS = 20
+# Частое слово, редкое слово и два слова сразу
+QUERIES = ["w1", "w4999", "w10 w20"]
+
+_GENERATE_POSTS = sqlalchemy.text("""
+    INSERT INTO posts (user_id, created_at, title, content)
+    SELECT :user_id, now(),
+           'w' || floor(power(random(), 3) * :words)::int || ' w' || floor(power(random(), 3) * :words)::int,
+           (SELECT string_agg('w' || floor(power(random(), 3) * :words)::int, ' ')
+            FROM generate_series(1, 30) WHERE g > 0)
+    FROM generate_series(1, :count) AS g
+""")
+
+
+async def timed(func, *args):
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        await func(*args)
+    return (time.perf_counter() - start) / RUNS * 1000
+
+
+async def main(count: int, url: str):
+    db = Database(url)
+    await db.connect()
+    user_id = await db.execute(users_table.insert().values(
+        email="bench-search@example.com", name="Bench Search", hashed_password="-", is_superuser=False
+    ))
+    try:
+        start = time.perf_counter()
+        await db.execute(_GENERATE_POSTS.bindparams(user_id=user_id, words=WORDS, count=count))
+        await db.execute("ANALYZE posts")
+        print(f"posts: {count}, generated and indexed in {time.perf_counter() - start:.1f} s")
+
+        start = time.perf_counter()
+        index = PostsSearchIndex()
+        index.load(await db.fetch_all(
+            posts_table.select().where(posts_table.c.user_id == user_id).limit(IN_MEMORY_POSTS)
+        ))
+        print(f"in-memory index over {len(index)} posts built in {time.perf_counter() - start:.1f} s")
+
+        for text in QUERIES:
+            like = sqlalchemy.and_(*[
+                sqlalchemy.or_(posts_table.c.title.ilike(f"% {word} %"), posts_table.c.content.ilike(f"% {word} %"))
+                for word in text.split()
+            ])
+            found = await db.fetch_val(
+                sqlalchemy.select([sqlalchemy.func.count()]).select_from(posts_table).where(like)
+            )
+            gin = await timed(crud.search_posts, db, text, 20)
+            scan = await timed(db.fetch_all, posts_table.select().where(like).limit(20))
+
+            async def in_memory():
+                index.search(text, limit=20)
+            memory = await timed(in_memory)
+            print(f"{text!r:>10} ~{found} matches: GIN {gin:8.2f} ms | ILIKE, unranked {scan:8.2f} ms | "
+                  f"in-memory ({len(index)} posts) {memory:8.2f} ms")
+    finally:
+        await crud.delete_posts(db=db, user_id=user_id)
+        await db.execute(users_table.delete().where(users_table.c.id == user_id))
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+                     sys.argv[2] if len(sys.argv) > 2 else SQLALCHEMY_DATABASE_URL))
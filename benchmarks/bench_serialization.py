@@ -0,0 +1,63 @@
+""" Сериализация списков пользователей: обычный путь FastAPI (проверка response_model + jsonable_encoder + json)
+против быстрого (project.serialization.RowSerializer, orjson если установлен).
+
+БД не нужна: строки генерируются в памяти в том виде, в каком их отдают crud.get_users и crud.get_admin_all_users.
+Запуск: python -m benchmarks.bench_serialization [число строк]
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from project import schemas, serialization
+
+REPEATS = 5
+
+
+def make_rows(count: int):
+    expires = datetime.now() + timedelta(weeks=2)
+    users = [{"id": i, "email": f"user{i}@example.com", "name": f"first{i} last{i}",
+              "interests": "art, books, golf, music"} for i in range(count)]
+    admin = [{"id": i, "email": f"user{i}@example.com", "name": f"first{i} last{i}", "is_active": True,
+              "is_superuser": False,
+              "token": {"token": f"00000000-0000-0000-0000-{i:012d}", "expires": expires, "token_type": "bearer"}}
+             for i in range(count)]
+    return users, admin
+
+
+async def fastapi_path(schema, rows, exclude_unset: bool) -> bytes:
+    """ То, что делает FastAPI с возвращённым списком: валидация response_model, jsonable_encoder, json.dumps """
+    field = create_response_field(name="Response", type_=List[schema])
+    content = await serialize_response(field=field, response_content=rows, exclude_unset=exclude_unset)
+    return JSONResponse(content).body
+
+
+def best_of(func) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(count: int):
+    users, admin = make_rows(count)
+    print(f"rows: {count}, encoder: {'orjson' if serialization.orjson is not None else 'json'}")
+    for title, schema, serializer, rows, exclude_unset in [
+        ("List[UserBase]", schemas.UserBase, schemas.user_base_serializer, users, False),
+        ("List[FullUser]", schemas.FullUser, schemas.full_user_serializer, admin, True),
+    ]:
+        slow = best_of(lambda: asyncio.run(fastapi_path(schema, rows, exclude_unset)))
+        fast = best_of(lambda: serializer.dumps_many(rows))
+        print(f"{title}: response_model + jsonable_encoder {slow * 1000:>8.1f} ms, "
+              f"RowSerializer {fast * 1000:>6.1f} ms ({slow / fast:.0f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
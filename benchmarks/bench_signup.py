@@ -0,0 +1,87 @@
+""" Скорость регистрации: прежняя последовательность запросов (проверка email, INSERT в users, interests,
+user_interests и tokens по отдельности) против одного запроса crud.insert_user, и полный crud.create_user
+вместе с хешированием пароля.
+
+Нужна живая БД со схемой из migrations. Создаёт временных пользователей bench-signup-* и удаляет их в конце.
+Запуск: python -m benchmarks.bench_signup [число регистраций] [параллельность] [URL базы]
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+
+from databases import Database
+
+from project import crud, schemas
+from project.config import SQLALCHEMY_DATABASE_URL
+from project.hashing import hashing_executor
+from project.interests.interests_model import interests_table, user_interests_table
+from project.matching import split_interests
+from project.models.models import users_table, tokens_table
+
+HASHED_PASSWORD = "salt$" + "0" * 64
+
+
+def make_user(prefix: str, i: int) -> schemas.UserCreate:
+    return schemas.UserCreate(email=f"bench-signup-{prefix}-{i}@example.com", name="Bench Signup", password="pw",
+                              repeating_password="pw", interests="bench music, bench golf, bench chess")
+
+
+async def sequential(db: Database, user: schemas.UserCreate):
+    """ Регистрация так, как она работала раньше: пять запросов без транзакции """
+    if await crud.get_user_by_email(db=db, email=user.email):
+        return
+    user_id = await db.execute(users_table.insert().values(
+        email=user.email, name=user.name, hashed_password=HASHED_PASSWORD, is_superuser=False,
+    ))
+    await db.execute(interests_table.insert().values(interests=user.interests, user_id=user_id))
+    term_ids = await crud.intern_terms(db=db, terms=split_interests(user.interests))
+    await db.execute(user_interests_table.insert().values([
+        {"user_id": user_id, "term_id": term_id} for term_id in term_ids
+    ]))
+    await db.fetch_one(tokens_table.insert().values(
+        expires=datetime.now() + timedelta(weeks=2), user_id=user_id, token=str(crud.uuid_generate_v4())
+    ).returning(tokens_table.c.token, tokens_table.c.expires))
+
+
+async def single_statement(db: Database, user: schemas.UserCreate):
+    term_ids = await crud.intern_terms(db=db, terms=split_interests(user.interests))
+    await crud.insert_user(db=db, user=user, hashed_password=HASHED_PASSWORD, term_ids=term_ids)
+
+
+async def run(func, db: Database, users, concurrency: int) -> float:
+    queue = list(reversed(users))
+
+    async def worker():
+        while queue:
+            await func(db, queue.pop())
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return len(users) / (time.perf_counter() - start)
+
+
+async def main(count: int, concurrency: int, url: str):
+    db = Database(url, min_size=concurrency, max_size=concurrency)
+    await db.connect()
+    hashing_executor.start()
+    try:
+        old = await run(sequential, db, [make_user("old", i) for i in range(count)], concurrency)
+        new = await run(single_statement, db, [make_user("new", i) for i in range(count)], concurrency)
+        full = await run(lambda db, user: crud.create_user(db=db, user=user), db,
+                         [make_user("full", i) for i in range(count)], concurrency)
+    finally:
+        await db.execute(users_table.delete().where(users_table.c.email.like("bench-signup-%")))
+        hashing_executor.shutdown()
+        await db.disconnect()
+
+    print(f"sign-ups: {count}, concurrency: {concurrency}")
+    print(f"sequential queries:        {old:>8.0f} sign-ups/s")
+    print(f"single CTE statement:      {new:>8.0f} sign-ups/s ({new / old:.1f}x)")
+    print(f"create_user with hashing:  {full:>8.0f} sign-ups/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+                     sys.argv[3] if len(sys.argv) > 3 else SQLALCHEMY_DATABASE_URL))
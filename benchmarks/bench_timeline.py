@@ -0,0 +1,83 @@
+""" Домашняя лента: задержка публикации поста с раскладкой по лентам (crud.push_post), усиление записи
+(строк timelines на пост) и чтение ленты одним запросом (crud.get_timeline) против N+1 - запроса постов
+каждого автора по имени и слияния на клиенте.
+
+Нужна живая БД со схемой из migrations. Создаёт временных пользователей с общим интересом и удаляет их вместе
+с постами. Индекс интересов заполняется в памяти, словарь интересов в БД не меняется.
+Запуск: python -m benchmarks.bench_timeline [число читателей] [число авторов] [URL базы]
+"""
+import asyncio
+import sys
+import time
+
+import sqlalchemy
+from databases import Database
+
+from project import crud, schemas
+from project.config import SQLALCHEMY_DATABASE_URL, TIMELINE_FANOUT_MAX_DEGREE
+from project.matching import interest_index
+from project.models.models import users_table
+from project.posts.posts import posts_table, timelines_table
+from project.posts import timeline
+
+POSTS_PER_AUTHOR = 20
+PAGE = 20
+
+
+async def main(readers: int, authors: int, url: str):
+    db = Database(url)
+    await db.connect()
+    rows = await db.fetch_all(users_table.insert().values([
+        {"email": f"bench-tl-{i}@example.com", "name": f"bench-tl-{i}", "hashed_password": "-", "is_superuser": False}
+        for i in range(readers + authors)
+    ]).returning(users_table.c.id, users_table.c.name))
+    ids = [row["id"] for row in rows]
+    names = [row["name"] for row in rows[readers:]]
+    for uid in ids:
+        interest_index.set_user(uid, frozenset({-1}))
+    await crud.load_fanout_on_read_authors(db=db)
+    post = schemas.PostsIn(title="bench", content="x" * 200)
+    try:
+        latencies = []
+        for author in ids[readers:]:
+            for _ in range(POSTS_PER_AUTHOR):
+                start = time.perf_counter()
+                await crud.push_post(db=db, user_id=author, post=post)
+                latencies.append(time.perf_counter() - start)
+        stored = await db.fetch_val(sqlalchemy.select([sqlalchemy.func.count()]).select_from(timelines_table).
+                                    where(timelines_table.c.author_id.in_(ids)))
+
+        reader = ids[0]
+        start = time.perf_counter()
+        for _ in range(100):
+            await crud.get_timeline(db=db, user_id=reader, limit=PAGE)
+        one_query = (time.perf_counter() - start) / 100
+
+        start = time.perf_counter()
+        for _ in range(100):
+            feeds = [await crud.get_posts_of_user_name(db=db, name=name, limit=PAGE) for name in names]
+            timeline.merge_feeds(feeds, PAGE)
+        n_plus_one = (time.perf_counter() - start) / 100
+    finally:
+        await db.execute(posts_table.delete().where(posts_table.c.user_id.in_(ids)))
+        await db.execute(users_table.delete().where(users_table.c.id.in_(ids)))
+        for uid in ids:
+            interest_index.remove_user(uid)
+            timeline.fanout_on_read_authors.discard(uid)
+        await db.disconnect()
+
+    degree = readers + authors - 1
+    latencies.sort()
+    mode = "fan-out-on-write" if degree <= TIMELINE_FANOUT_MAX_DEGREE else "fan-out-on-read"
+    print(f"readers: {readers}, authors: {authors}, degree: {degree} ({mode})")
+    print(f"push_post p50: {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"p99: {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+    print(f"timeline rows per post: {stored / len(latencies):.1f}")
+    print(f"get_timeline:         {one_query * 1000:>8.2f} ms")
+    print(f"N+1 by author name:   {n_plus_one * 1000:>8.2f} ms ({n_plus_one / one_query:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+                     sys.argv[3] if len(sys.argv) > 3 else SQLALCHEMY_DATABASE_URL))
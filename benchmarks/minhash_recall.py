@@ -0,0 +1,56 @@
+""" Полнота и задержка приближённого поиска (MinHash + LSH) относительно точного InterestIndex.
+
+Для каждого сочетания bands x rows считается recall@K: доля точного top-K по Жаккару,
+которую нашёл приближённый поиск, и среднее время запроса.
+
+Запуск: python -m benchmarks.minhash_recall [число пользователей]
+"""
+import random
+import sys
+import time
+
+from project.matching import InterestIndex
+from project.minhash import LSHIndex
+
+NUM_TERMS = 300
+TOP_K = 20
+CONFIGS = [(8, 2), (16, 2), (16, 4), (32, 2), (32, 4), (64, 4)]
+
+
+def generate(index: InterestIndex, num_users: int, seed: int = 0):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(NUM_TERMS)]
+    for user_id in range(num_users):
+        index.set_user(user_id, set(rng.choices(range(NUM_TERMS), weights, k=rng.randint(3, 10))), name=str(user_id))
+
+
+def main(num_users: int):
+    index = InterestIndex()
+    generate(index, num_users)
+    queries = random.Random(1).sample(range(num_users), 200)
+
+    start = time.perf_counter()
+    exact = {query: [uid for uid, _ in index.top_k(query, TOP_K)[0]] for query in queries}
+    exact_ms = (time.perf_counter() - start) / len(queries) * 1000
+    print(f"users: {num_users}, exact top-{TOP_K}: {exact_ms:.2f} ms/query")
+    print(f"{'bands':>6} {'rows':>5} {'recall':>8} {'candidates':>11} {'ms/query':>9}")
+
+    for bands, rows in CONFIGS:
+        lsh = LSHIndex(bands=bands, rows=rows)
+        for user_id, terms in index.terms_by_user.items():
+            lsh.set_user(user_id, lsh.hasher.signature(terms))
+
+        found = total = candidates = 0
+        start = time.perf_counter()
+        for query in queries:
+            query_candidates = lsh.candidates(query)
+            candidates += len(query_candidates)
+            approx = {uid for uid, _ in index.top_k(query, TOP_K, candidates=query_candidates)[0]}
+            found += len(approx & set(exact[query]))
+            total += len(exact[query])
+        approx_ms = (time.perf_counter() - start) / len(queries) * 1000
+        print(f"{bands:>6} {rows:>5} {found / total:>8.3f} {candidates // len(queries):>11} {approx_ms:>9.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,26 @@
+"""Add updated_at and version to posts
+
+Revision ID: 061528795599
+Revises: 334f8417a5be
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '061528795599'
+down_revision = '334f8417a5be'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.add_column('posts', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('posts', 'version')
+    op.drop_column('posts', 'updated_at')
@@ -0,0 +1,40 @@
+"""Add timelines
+
+Revision ID: 1208f0be84c2
+Revises: 66e25d19c5a2
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1208f0be84c2'
+down_revision = '66e25d19c5a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('timelines',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'post_id')
+    )
+    op.create_index('ix_timelines_user_id_created_at', 'timelines',
+                    ['user_id', sa.text('created_at DESC'), sa.text('post_id DESC')], unique=False)
+    op.create_index('ix_timelines_post_id', 'timelines', ['post_id'], unique=False)
+    op.add_column('users', sa.Column('fanout_on_read', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+
+
+def downgrade():
+    op.drop_column('users', 'fanout_on_read')
+    op.drop_index('ix_timelines_post_id', table_name='timelines')
+    op.drop_index('ix_timelines_user_id_created_at', table_name='timelines')
+    op.drop_table('timelines')
@@ -0,0 +1,36 @@
+"""Add user_matches table
+
+Revision ID: 334f8417a5be
+Revises: ae237c517184
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '334f8417a5be'
+down_revision = 'ae237c517184'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Таблица заполняется командой python -m project.recommendations и фоновой задачей приложения
+    op.create_table('user_matches',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('match_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['match_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'rank')
+    )
+    op.create_index(op.f('ix_user_matches_match_id'), 'user_matches', ['match_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_user_matches_match_id'), table_name='user_matches')
+    op.drop_table('user_matches')
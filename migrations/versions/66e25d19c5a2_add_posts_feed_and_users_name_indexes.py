@@ -0,0 +1,27 @@
+"""Add posts feed and users name indexes
+
+Revision ID: 66e25d19c5a2
+Revises: 061528795599
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '66e25d19c5a2'
+down_revision = '061528795599'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_posts_user_id_created_at', 'posts',
+                    ['user_id', sa.text('created_at DESC'), sa.text('id DESC')], unique=False)
+    op.create_index(op.f('ix_users_name'), 'users', ['name'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_users_name'), table_name='users')
+    op.drop_index('ix_posts_user_id_created_at', table_name='posts')
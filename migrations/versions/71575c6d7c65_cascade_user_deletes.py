@@ -0,0 +1,50 @@
+"""Cascade user deletes and add users.deleted_at
+
+Revision ID: 71575c6d7c65
+Revises: fbf3f580188b
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '71575c6d7c65'
+down_revision = 'fbf3f580188b'
+branch_labels = None
+depends_on = None
+
+# (таблица, колонка) внешних ключей на users.id
+USER_FOREIGN_KEYS = [
+    ('tokens', 'user_id'),
+    ('posts', 'user_id'),
+    ('interests', 'user_id'),
+    ('user_interests', 'user_id'),
+    ('interest_signatures', 'user_id'),
+    ('user_matches', 'user_id'),
+    ('user_matches', 'match_id'),
+]
+
+
+def _recreate_foreign_keys(ondelete):
+    for table, column in USER_FOREIGN_KEYS:
+        name = f'{table}_{column}_fkey'
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, 'users', [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    _recreate_foreign_keys('CASCADE')
+    op.add_column('users', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_users_deleted_at', 'users', ['deleted_at'], unique=False,
+                    postgresql_where=sa.text('deleted_at IS NOT NULL'))
+    # Записи лент по автору удаляются вместе с ним (каскад и мягкое удаление)
+    op.create_index('ix_timelines_author_id', 'timelines', ['author_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_timelines_author_id', table_name='timelines')
+    op.drop_index('ix_users_deleted_at', table_name='users')
+    op.drop_column('users', 'deleted_at')
+    _recreate_foreign_keys(None)
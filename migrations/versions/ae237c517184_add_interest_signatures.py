@@ -0,0 +1,30 @@
+"""Add interest_signatures table
+
+Revision ID: ae237c517184
+Revises: b82cab12c5d5
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ae237c517184'
+down_revision = 'b82cab12c5d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Сигнатуры заполняются приложением при старте (crud.load_lsh_index), если включён LSH_ENABLED
+    op.create_table('interest_signatures',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('signature', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('interest_signatures')
@@ -0,0 +1,89 @@
+"""Add interest_terms and user_interests tables
+
+Revision ID: b82cab12c5d5
+Revises: 7b983f08ba91
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b82cab12c5d5'
+down_revision = '7b983f08ba91'
+branch_labels = None
+depends_on = None
+
+# Сколько строк interests переносим за один проход
+BATCH_SIZE = 1000
+# Размер колонки interest_terms.term: более длинные интересы в словарь не переносятся
+MAX_TERM_LENGTH = 100
+
+
+def split_interests(stroke):
+    terms = []
+    for item in stroke.split(","):
+        term = item.strip().lower()
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def upgrade():
+    op.create_table('interest_terms',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('term', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_interest_terms_term'), 'interest_terms', ['term'], unique=True)
+    op.create_table('user_interests',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('term_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['term_id'], ['interest_terms.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'term_id')
+    )
+    op.create_index('ix_user_interests_term_id', 'user_interests', ['term_id'], unique=False)
+
+    # Переносим строки interests в словарь пачками по BATCH_SIZE (keyset по interests.id)
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.text("SELECT id, user_id, interests FROM interests "
+                    "WHERE id > :last_id AND user_id IS NOT NULL ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": BATCH_SIZE},
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        pairs = [(user_id, term) for _, user_id, stroke in rows for term in split_interests(stroke)
+                 if len(term) <= MAX_TERM_LENGTH]
+        terms = sorted({term for _, term in pairs})
+        if not terms:
+            continue
+        conn.execute(
+            sa.text("INSERT INTO interest_terms (term) SELECT unnest(CAST(:terms AS varchar[])) "
+                    "ON CONFLICT DO NOTHING"),
+            {"terms": terms},
+        )
+        term_ids = dict(
+            (term, term_id) for term_id, term in conn.execute(
+                sa.text("SELECT id, term FROM interest_terms WHERE term = ANY(:terms)"), {"terms": terms}
+            )
+        )
+        conn.execute(
+            sa.text("INSERT INTO user_interests (user_id, term_id) "
+                    "SELECT unnest(CAST(:user_ids AS integer[])), unnest(CAST(:term_ids AS integer[])) "
+                    "ON CONFLICT DO NOTHING"),
+            {"user_ids": [user_id for user_id, _ in pairs], "term_ids": [term_ids[term] for _, term in pairs]},
+        )
+
+
+def downgrade():
+    op.drop_index('ix_user_interests_term_id', table_name='user_interests')
+    op.drop_table('user_interests')
+    op.drop_index(op.f('ix_interest_terms_term'), table_name='interest_terms')
+    op.drop_table('interest_terms')
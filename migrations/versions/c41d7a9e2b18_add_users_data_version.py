@@ -0,0 +1,24 @@
+"""Add users.data_version
+
+Revision ID: c41d7a9e2b18
+Revises: 71575c6d7c65
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d7a9e2b18'
+down_revision = '71575c6d7c65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('data_version', sa.BigInteger(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('users', 'data_version')
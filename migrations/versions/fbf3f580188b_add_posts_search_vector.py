@@ -0,0 +1,49 @@
+"""Add posts search vector
+
+Revision ID: fbf3f580188b
+Revises: 1208f0be84c2
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'fbf3f580188b'
+down_revision = '1208f0be84c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.execute("""
+        CREATE FUNCTION posts_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(NEW.content, '')), 'B');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER posts_search_vector_update
+        BEFORE INSERT OR UPDATE OF title, content ON posts
+        FOR EACH ROW EXECUTE FUNCTION posts_search_vector_update()
+    """)
+    op.execute("""
+        UPDATE posts SET search_vector =
+            setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(content, '')), 'B')
+    """)
+    op.create_index('ix_posts_search_vector', 'posts', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_posts_search_vector', table_name='posts')
+    op.execute("DROP TRIGGER posts_search_vector_update ON posts")
+    op.execute("DROP FUNCTION posts_search_vector_update()")
+    op.drop_column('posts', 'search_vector')
@@ -0,0 +1,91 @@
+""" Массовая оценка похожести интересов на NumPy: битовые строки пользователей и popcount вместо пересечения множеств.
+
+Нужна там, где с одним пользователем (или со всеми) сравнивается вся база: аналитика, предрасчёт рекомендаций.
+Для выдачи одной страницы get_me_users хватает InterestIndex из project.matching.
+"""
+from typing import Dict, Iterable, Iterator, Sequence, Tuple
+
+import numpy as np
+
+from project.matching import InterestIndex
+
+# Количество строк матрицы, которое обрабатываем за один раз: ограничивает размер временных массивов
+ROW_CHUNK = 65536
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount_rows(words: np.ndarray) -> np.ndarray:
+    """ Сумма единичных битов по последней оси массива uint64 """
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int32)
+    as_bytes = words.view(np.uint8).reshape(words.shape[:-1] + (-1,))
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=-1, dtype=np.int32)
+
+
+class InterestMatrix:
+    """ Матрица пользователи x интересы, упакованная в биты (по 64 интереса в одном слове uint64) """
+
+    def __init__(self, user_ids: Sequence[int], term_lists: Sequence[Iterable[int]]):
+        term_lists = [np.fromiter(terms, dtype=np.int64) for terms in term_lists]
+        all_terms = np.unique(np.concatenate(term_lists)) if term_lists else np.empty(0, dtype=np.int64)
+
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.rows: Dict[int, int] = {int(uid): row for row, uid in enumerate(self.user_ids)}
+        self.columns: Dict[int, int] = {int(term): col for col, term in enumerate(all_terms)}
+        width = max(1, (len(all_terms) + 63) // 64)
+        self.bits = np.zeros((len(self.user_ids), width), dtype=np.uint64)
+
+        if term_lists:
+            rows = np.repeat(np.arange(len(term_lists)), [len(terms) for terms in term_lists])
+            cols = np.searchsorted(all_terms, np.concatenate(term_lists))
+            np.bitwise_or.at(self.bits, (rows, cols >> 6), np.left_shift(np.uint64(1), (cols & 63).astype(np.uint64)))
+        self.counts = _popcount_rows(self.bits)
+
+    @classmethod
+    def from_index(cls, index: InterestIndex) -> "InterestMatrix":
+        user_ids = list(index.terms_by_user)
+        return cls(user_ids, [index.terms_by_user[uid] for uid in user_ids])
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def one_vs_all(self, user_id: int, mode: str = "jaccard") -> np.ndarray:
+        """ Оценки похожести user_id со всеми строками матрицы (порядок как в user_ids, сам user_id получает 0) """
+        row = self.rows[user_id]
+        scores = self._scores(self.bits[row:row + 1], self.counts[row:row + 1], mode)[0]
+        scores[row] = 0
+        return scores
+
+    def all_vs_all(self, mode: str = "jaccard", batch_size: int = 64) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """ Перебирает пачки пользователей: (user_ids пачки, матрица оценок пачка x все пользователи) """
+        for start in range(0, len(self.user_ids), batch_size):
+            stop = min(start + batch_size, len(self.user_ids))
+            scores = self._scores(self.bits[start:stop], self.counts[start:stop], mode)
+            scores[np.arange(stop - start), np.arange(start, stop)] = 0
+            yield self.user_ids[start:stop], scores
+
+    def top_k(self, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """ k лучших ненулевых оценок из строки one_vs_all: (user_ids, scores) по убыванию, при равенстве - по user_id """
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            # argpartition берёт произвольных из равных k-й оценке: оставляем всех равных, порядок решит lexsort
+            kth = -np.partition(-scores[candidates], k - 1)[k - 1]
+            candidates = candidates[scores[candidates] >= kth]
+        order = np.lexsort((self.user_ids[candidates], -scores[candidates]))[:k]
+        candidates = candidates[order]
+        return self.user_ids[candidates], scores[candidates]
+
+    def _scores(self, query_bits: np.ndarray, query_counts: np.ndarray, mode: str) -> np.ndarray:
+        if mode not in ("jaccard", "overlap"):
+            raise ValueError(f"Unsupported scoring mode for bulk matching: {mode}")
+        overlap = np.empty((len(query_bits), len(self.user_ids)), dtype=np.int32)
+        chunk = max(1, ROW_CHUNK // len(query_bits))
+        for start in range(0, len(self.user_ids), chunk):
+            block = self.bits[start:start + chunk]
+            overlap[:, start:start + chunk] = _popcount_rows(query_bits[:, None, :] & block[None, :, :])
+        if mode == "overlap":
+            return overlap.astype(np.float64)
+
+        union = query_counts[:, None] + self.counts[None, :] - overlap
+        return np.divide(overlap, union, out=np.zeros(overlap.shape, dtype=np.float64), where=union > 0)
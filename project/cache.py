@@ -0,0 +1,314 @@
+""" Кеши в памяти процесса и кеш страниц постов с общим для воркеров хранилищем на SQLite """
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, NamedTuple, Optional, Set
+
+from project.config import TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL, DATA_VERSION_CACHE_SIZE, DATA_VERSION_CACHE_TTL, \
+    POSTS_CACHE_BACKEND, POSTS_CACHE_SIZE, POSTS_CACHE_TTL, POSTS_CACHE_PATH
+
+
+class TTLCache:
+    """ LRU-кеш ограниченного размера, в котором у каждой записи есть срок жизни """
+
+    def __init__(self, maxsize: int, ttl: float, on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default=None):
+        """ Возвращает значение, если оно есть и ещё не протухло """
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        deadline, value = item
+        if deadline <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """ Кладёт значение в кеш. ttl может только укоротить время жизни записи """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            self.pop(key)
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+
+    def pop(self, key: Hashable):
+        """ Явно удаляет запись из кеша """
+        if key in self._data:
+            self._remove(key)
+
+    def clear(self):
+        for key in list(self._data):
+            self._remove(key)
+
+    def _remove(self, key: Hashable):
+        _, value = self._data.pop(key)
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class TokenCache:
+    """ Кеш token -> строка tokens⋈users. Записи живут не дольше tokens.expires и сбрасываются по user_id """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = TTLCache(maxsize, ttl, on_evict=self._forget)
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+
+    def get(self, token: str):
+        return self._entries.get(token)
+
+    def put(self, token: str, user):
+        """ Запоминает владельца токена. user - строка из crud.get_user_by_token """
+        user_id = int(user["user_id"])
+        ttl = (user["expires"] - datetime.now()).total_seconds()
+        if ttl <= 0:
+            return
+        self._entries.set(token, user, ttl=ttl)
+        self._tokens_by_user.setdefault(user_id, set()).add(token)
+
+    def invalidate_token(self, token: str):
+        self._entries.pop(token)
+
+    def invalidate_user(self, user_id: int):
+        """ Удаляет все закешированные токены пользователя (удаление, деактивация, смена токена) """
+        for token in list(self._tokens_by_user.get(user_id, ())):
+            self._entries.pop(token)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return self._entries.stats()
+
+    def _forget(self, token: str, user):
+        tokens = self._tokens_by_user.get(int(user["user_id"]))
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[int(user["user_id"])]
+
+
+token_cache = TokenCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+
+class DataVersionCache:
+    """ Кеш user_id -> users.data_version. Версия в кеше только растёт: ответ на более старую запись,
+    пришедший позже, не откатывает её назад """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = TTLCache(maxsize, ttl)
+
+    def get(self, user_id: int) -> Optional[int]:
+        return self._entries.get(user_id)
+
+    def put(self, user_id: int, version: int):
+        # Запись читается мимо TTLCache.get: сохранение версии из БД - не попадание и не промах кеша
+        item = self._entries._data.get(user_id)
+        if item is None or item[0] <= time.monotonic() or version > item[1]:
+            self._entries.set(user_id, version)
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return self._entries.stats()
+
+
+data_versions = DataVersionCache(maxsize=DATA_VERSION_CACHE_SIZE, ttl=DATA_VERSION_CACHE_TTL)
+
+
+class LocalCacheBackend:
+    """ Хранилище кеша в памяти процесса: LRU с TTL и тегами - по тегу сбрасываются все его записи """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = TTLCache(maxsize, ttl, on_evict=self._forget)
+        self._keys_by_tag: Dict[str, Set[str]] = {}
+        self._tags_by_key: Dict[str, tuple] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._entries.get(key)
+
+    def set(self, key: str, value: bytes, tags: Iterable[str]):
+        self._entries.pop(key)
+        tags = tuple(tags)
+        self._entries.set(key, value)
+        self._tags_by_key[key] = tags
+        for tag in tags:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+
+    def invalidate(self, tags: Iterable[str]):
+        for tag in tags:
+            for key in list(self._keys_by_tag.get(tag, ())):
+                self._entries.pop(key)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _forget(self, key: str, value):
+        for tag in self._tags_by_key.pop(key, ()):
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+class SqliteCacheBackend:
+    """ Хранилище кеша в файле SQLite: общее для всех воркеров на одной машине (замена внешнему кешу на стенде).
+    Запросы к локальному файлу занимают десятки микросекунд, поэтому выполняются прямо в event loop-е """
+
+    def __init__(self, path: str, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=OFF")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                                 "expires REAL NOT NULL)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS tags (tag TEXT NOT NULL, key TEXT NOT NULL, "
+                                 "PRIMARY KEY (tag, key))")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS ix_entries_expires ON entries (expires)")
+        # Примерное число записей: растёт на вставках новых ключей этим процессом и сверяется с таблицей
+        # при вытеснении, чтобы не считать строки на каждой записи
+        self._size = len(self)
+
+    def __len__(self):
+        return self._connection.execute("SELECT count(*) FROM entries").fetchone()[0]
+
+    def get(self, key: str) -> Optional[bytes]:
+        # Время - по часам системы: monotonic у разных процессов не совпадает
+        row = self._connection.execute("SELECT value FROM entries WHERE key = ? AND expires > ?",
+                                       (key, time.time())).fetchone()
+        return row[0] if row is not None else None
+
+    def set(self, key: str, value: bytes, tags: Iterable[str]):
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            expires = time.time() + self.ttl
+            inserted = self._connection.execute("INSERT OR IGNORE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+                                                (key, value, expires)).rowcount
+            if not inserted:
+                self._connection.execute("UPDATE entries SET value = ?, expires = ? WHERE key = ?",
+                                         (value, expires, key))
+            self._connection.executemany("INSERT OR IGNORE INTO tags (tag, key) VALUES (?, ?)",
+                                         [(tag, key) for tag in tags])
+            self._size += inserted
+            if inserted and self._size > self.maxsize:
+                self._evict()
+
+    def invalidate(self, tags: Iterable[str]):
+        tags = list(tags)
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            deleted = self._connection.executemany(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM tags WHERE tag = ?)", [(tag,) for tag in tags]
+            ).rowcount
+            self._size = max(self._size - deleted, 0)
+            self._connection.executemany("DELETE FROM tags WHERE tag = ?", [(tag,) for tag in tags])
+
+    def clear(self):
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.execute("DELETE FROM entries")
+            self._connection.execute("DELETE FROM tags")
+            self._size = 0
+
+    def _evict(self):
+        """ Удаляет протухшие записи, а если их не хватило - самые старые (вытесняется десятая часть кеша) """
+        self._connection.execute("DELETE FROM entries WHERE expires <= ?", (time.time(),))
+        # Точный размер, с записями других процессов
+        self._size = len(self)
+        excess = self._size - self.maxsize
+        if excess > 0:
+            self._size -= self._connection.execute("DELETE FROM entries WHERE key IN "
+                                                   "(SELECT key FROM entries ORDER BY expires LIMIT ?)",
+                                                   (max(excess, self.maxsize // 10),)).rowcount
+        self._connection.execute("DELETE FROM tags WHERE key NOT IN (SELECT key FROM entries)")
+
+
+class PostsPage(NamedTuple):
+    """ Страница постов: готовое тело ответа и курсор следующей страницы (None - страница последняя) """
+    body: bytes
+    next_before: Optional[str]
+
+
+class PostsPageCache:
+    """ Read-through кеш страниц постов. Запись помечается тегами (user:<id>, name:<имя>), по ним её сбрасывают.
+    Заполнение, которое началось до сброса в этом процессе, в кеш не попадает - иначе в нём остались бы
+    данные, прочитанные до записи """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._generation = 0
+
+    async def get_or_load(self, key: str, tags: Iterable[str], load: Callable[[], Awaitable[PostsPage]]) -> PostsPage:
+        if self.backend is None:
+            return await load()
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            next_before, _, body = value.partition(b"\n")
+            return PostsPage(body, next_before.decode() or None)
+        self.misses += 1
+        generation = self._generation
+        page = await load()
+        if generation == self._generation:
+            self.backend.set(key, (page.next_before or "").encode() + b"\n" + page.body, tags)
+        return page
+
+    def invalidate_user(self, user_id: int, name: Optional[str] = None):
+        """ Сбрасывает страницы постов пользователя и страницы постов по его имени """
+        self._generation += 1
+        if self.backend is not None:
+            self.backend.invalidate([f"user:{user_id}"] + ([f"name:{name}"] if name is not None else []))
+
+    def clear(self):
+        self._generation += 1
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self.backend) if self.backend is not None else 0, "hits": self.hits,
+                "misses": self.misses}
+
+
+def make_posts_cache_backend(kind: str = POSTS_CACHE_BACKEND):
+    if kind == "local":
+        return LocalCacheBackend(maxsize=POSTS_CACHE_SIZE, ttl=POSTS_CACHE_TTL)
+    if kind == "sqlite":
+        return SqliteCacheBackend(POSTS_CACHE_PATH, maxsize=POSTS_CACHE_SIZE, ttl=POSTS_CACHE_TTL)
+    if kind == "none":
+        return None
+    raise ValueError(f"Unknown POSTS_CACHE_BACKEND: {kind}")
+
+
+posts_cache = PostsPageCache(make_posts_cache_backend())
@@ -1,17 +1,38 @@
+import asyncio
 from hashlib import pbkdf2_hmac
 from random import choice
 import string
-from fastapi.encoders import jsonable_encoder
 from datetime import datetime, timedelta
+import sqlalchemy
 from sqlalchemy import and_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from project import schemas
 from project.models.models import users_table as users, tokens_table as tokens
-from project.interests.interests_model import interests_table
-from project.posts.posts import posts_table as posts
+from project.interests.interests_model import interests_table, interest_terms_table, user_interests_table, \
+    interest_signatures_table, user_matches_table
+from project.interests.vocabulary import vocabulary
+from project.posts.posts import posts_table as posts, timelines_table as timelines, posts_search_vector
+from project.posts import timeline
+from project.hashing import hashing_executor
+from project.cache import token_cache, data_versions, posts_cache, PostsPage
+from project.serialization import dumps
+from project import request_context
+from project.db import reader
+from project.matching import interest_index, split_interests
+from project.minhash import lsh_index
+from project.recommendations import matches_worker
+from project.purge import account_purger
+from project.config import LSH_ENABLED, TIMELINE_MAX_LENGTH, TIMELINE_FANOUT_MAX_DEGREE, POSTS_SEARCH_CONFIG, \
+    POSTS_SEARCH_MAX_CANDIDATES, ACCOUNT_SOFT_DELETE
 from databases import Database
+from typing import List, Optional
 from uuid import UUID
 from os import urandom
 
+# Сколько MinHash-сигнатур сохраняем одним INSERT-ом при загрузке LSH-индекса
+SIGNATURES_CHUNK = 1000
+
 
 def uuid_generate_v4():
     """ Генерируем uuid для токена """
@@ -31,15 +52,15 @@ def hash_password(password: str, salt: str = None):
     return enc.hex()
 
 
-def validate_password(password: str, hashed_password: str):
-    """ Проверяет, что хеш пароля совпадает с хешем из БД """
+async def validate_password(password: str, hashed_password: str):
+    """ Проверяет, что хеш пароля совпадает с хешем из БД. Хеш считается в пуле hashing_executor """
     salt, hashed = hashed_password.split("$")
-    return hash_password(password, salt) == hashed
+    return await hashing_executor.run(hash_password, password, salt) == hashed
 
 
 def get_user_by_email(db: Database, email: str):
-    """ Возвращает информацию о пользователе """
-    query = users.select().where(users.c.email == email)
+    """ Возвращает информацию о пользователе. Удалённые, но ещё не вычищенные пользователи не находятся """
+    query = users.select().where(and_(users.c.email == email, users.c.deleted_at.is_(None)))
     return db.fetch_one(query)
 
 
@@ -49,10 +70,33 @@ def get_token_info_by_user_id(db: Database, user_id: int):
     return db.fetch_one(query)
 
 
-def get_interest_by_ui(db: Database, user_id: int):
-    """ Получаем информацию по интересам данного пользователя, используя user_id """
-    query = interests_table.select().where(interests_table.c.user_id == user_id)
-    return db.fetch_one(query)
+async def get_data_version(db: Database, user_id: int) -> Optional[int]:
+    """ Версия данных пользователя для ETag. Сначала смотрим в кеш data_versions, читаем всегда с основной БД """
+    version = data_versions.get(user_id)
+    if version is None:
+        version = await db.fetch_val(sqlalchemy.select([users.c.data_version]).where(users.c.id == user_id))
+        if version is not None:
+            data_versions.put(user_id, version)
+    return version
+
+
+async def bump_data_version(db: Database, user_id: int):
+    """ Увеличивает версию данных пользователя. Вызывается после записи: иначе параллельное чтение
+    могло бы отдать старые данные с новым ETag. Возвращает новую версию и имя пользователя """
+    row = await db.fetch_one(
+        users.update().where(users.c.id == user_id).
+        values(data_version=users.c.data_version + 1).
+        returning(users.c.data_version, users.c.name)
+    )
+    if row is not None:
+        data_versions.put(user_id, row["data_version"])
+    return row
+
+
+async def posts_changed(db: Database, user_id: int):
+    """ После изменения постов пользователя: новая версия данных и сброс его страниц в posts_cache """
+    row = await bump_data_version(db=db, user_id=user_id)
+    posts_cache.invalidate_user(user_id, row["name"] if row is not None else None)
 
 
 async def push_post(db: Database, user_id: int, post: schemas.PostsIn):
@@ -60,155 +104,632 @@ async def push_post(db: Database, user_id: int, post: schemas.PostsIn):
     now = datetime.now()
     query = posts.insert().values(
         user_id=user_id, created_at=now, title=post.title, content=post.content
-    )
-    await db.execute(query)
+    ).returning(posts.c.id)
+    post_id = await db.fetch_val(query)
+    forget_user_posts(user_id)
+    await posts_changed(db=db, user_id=user_id)
+    await fan_out_posts(db=db, author_id=user_id, post_ids=[post_id])
     return {"user_id": user_id, "created_at": str(now), "title": f"{post.title}", "content": f"{post.content}"}
 
 
-def get_users(db: Database, user_id: int):
+# Кладёт посты :post_ids в ленты пользователей :user_ids одним запросом с параметрами-массивами.
+# Из большой пачки берутся только :max_length последних постов - остальные обрезка всё равно бы удалила
+_FAN_OUT_POSTS = sqlalchemy.text("""
+    INSERT INTO timelines (user_id, post_id, author_id, created_at)
+    SELECT f.user_id, p.id, p.user_id, p.created_at
+    FROM unnest(CAST(:user_ids AS integer[])) AS f(user_id)
+    CROSS JOIN (
+        SELECT id, user_id, created_at FROM posts
+        WHERE id = ANY(CAST(:post_ids AS integer[]))
+        ORDER BY created_at DESC, id DESC
+        LIMIT :max_length
+    ) AS p
+    ON CONFLICT DO NOTHING
+""")
+
+# Обрезает ленты указанных пользователей до :max_length последних постов
+_TRIM_TIMELINES = sqlalchemy.text("""
+    DELETE FROM timelines t
+    USING unnest(CAST(:user_ids AS integer[])) AS f(user_id)
+    CROSS JOIN LATERAL (
+        SELECT created_at, post_id FROM timelines
+        WHERE user_id = f.user_id
+        ORDER BY created_at DESC, post_id DESC
+        OFFSET :max_length LIMIT 1
+    ) AS cut
+    WHERE t.user_id = f.user_id AND (t.created_at, t.post_id) <= (cut.created_at, cut.post_id)
+""")
+
+
+async def load_fanout_on_read_authors(db: Database):
+    """ Загружает авторов, чьи посты подмешиваются в ленты при чтении (вызывается при старте приложения) """
+    rows = await db.fetch_all(sqlalchemy.select([users.c.id]).where(users.c.fanout_on_read))
+    timeline.fanout_on_read_authors.clear()
+    timeline.fanout_on_read_authors.update(row["id"] for row in rows)
+
+
+async def fan_out_posts(db: Database, author_id: int, post_ids: List[int]):
+    """ Раскладывает посты автора по лентам пользователей с общими с ним интересами. Если таких пользователей
+    больше TIMELINE_FANOUT_MAX_DEGREE, автор переводится на подмешивание при чтении. Возвращает число лент """
+    if author_id in timeline.fanout_on_read_authors:
+        return 0
+    followers = list(interest_index.candidates(author_id))
+    if not followers:
+        return 0
+    if len(followers) > TIMELINE_FANOUT_MAX_DEGREE:
+        await db.execute(users.update().where(users.c.id == author_id).values(fanout_on_read=True))
+        timeline.fanout_on_read_authors.add(author_id)
+        return 0
+
+    async with db.transaction():
+        await db.execute(_FAN_OUT_POSTS.bindparams(
+            user_ids=followers, post_ids=post_ids, max_length=TIMELINE_MAX_LENGTH
+        ))
+        await db.execute(_TRIM_TIMELINES.bindparams(user_ids=followers, max_length=TIMELINE_MAX_LENGTH))
+    return len(followers)
+
+
+async def get_timeline(db: Database, user_id: int, limit: int, before: Optional[tuple] = None):
+    """ Домашняя лента пользователя: посты из его ленты и посты авторов с общими интересами,
+    которые раскладываются при чтении. before - (created_at, id) последнего поста предыдущей страницы """
+    query = sqlalchemy.select([posts]). \
+        select_from(timelines.join(posts, timelines.c.post_id == posts.c.id)). \
+        where(timelines.c.user_id == user_id)
+    if before is not None:
+        query = query.where(sqlalchemy.tuple_(timelines.c.created_at, timelines.c.post_id) < sqlalchemy.tuple_(*before))
+    query = query.order_by(timelines.c.created_at.desc(), timelines.c.post_id.desc()).limit(limit)
+    feeds = [await db.fetch_all(query)]
+
+    terms = interest_index.terms(user_id)
+    pulled = [
+        author for author in timeline.fanout_on_read_authors
+        if author != user_id and terms & interest_index.terms(author)
+    ]
+    if pulled:
+        query = sqlalchemy.select([posts]).where(posts.c.user_id.in_(pulled))
+        feeds.append(await db.fetch_all(_posts_feed(query, limit=limit, before=before)))
+    return timeline.merge_feeds(feeds, limit)
+
+
+def _keyset_page(query, key, after: Optional[int] = None, limit: Optional[int] = None):
+    """ Keyset-пагинация: строки с key > after по возрастанию key """
+    if after is not None:
+        query = query.where(key > after)
+    query = query.order_by(key)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def _users_query(user_id: int, after: Optional[int] = None, limit: Optional[int] = None):
+    query = sqlalchemy.select([users.c.id, users.c.email, users.c.name, interests_table.c.interests]). \
+        select_from(interests_table.join(users)). \
+        where(
+            and_
+            (
+                users.c.id != user_id,
+                interests_table.c.user_id != user_id
+            )
+        )
+    return _keyset_page(query, users.c.id, after=after, limit=limit)
+
+
+async def push_posts(db: Database, user_id: int, posts_in: List[schemas.PostsIn]):
+    """ Пушим в БД несколько постов пользователя одним INSERT. Возвращает id постов в том же порядке.
+    Обычно вызывается внутри транзакции, поэтому версию данных не меняет: после коммита вызывающий
+    должен сам вызвать posts_changed - иначе до коммита читатели получили бы новый ETag со старыми постами,
+    а строка пользователя оставалась бы заблокированной до конца транзакции """
+    now = datetime.now()
+    query = posts.insert().values([
+        {"user_id": user_id, "created_at": now, "title": post.title, "content": post.content} for post in posts_in
+    ]).returning(posts.c.id)
+    rows = await db.fetch_all(query)
+    forget_user_posts(user_id)
+    return [row["id"] for row in rows]
+
+
+def get_users(db: Database, user_id: int, limit: Optional[int] = None, after: Optional[int] = None):
     """ Получаем информацию о всех интересах всех пользователей, кроме пользователя с user_id """
-    query = interests_table.join(users).select().where(
-        and_
-        (
-            users.c.id != user_id,
-            interests_table.c.user_id != user_id
+    return reader(db).fetch_all(_users_query(user_id, after=after, limit=limit))
+
+
+def iterate_users(db: Database, user_id: int, after: Optional[int] = None):
+    """ То же, что get_users, но строки читаются курсором по одной """
+    return reader(db).iterate(_users_query(user_id, after=after))
+
+
+async def load_interest_index(db: Database):
+    """ Загружает словарь интересов и строит индекс по всем пользователям (вызывается при старте приложения) """
+    vocabulary.load(await db.fetch_all(interest_terms_table.select()))
+
+    query = sqlalchemy.select([users.c.id, users.c.name, user_interests_table.c.term_id]). \
+        select_from(users.join(user_interests_table)). \
+        order_by(users.c.id)
+    rows = await db.fetch_all(query)
+    interest_index.clear()
+    term_ids, names = {}, {}
+    for row in rows:
+        term_ids.setdefault(row["id"], []).append(row["term_id"])
+        names[row["id"]] = row["name"]
+    for user_id, ids in term_ids.items():
+        interest_index.set_user(user_id, ids, name=names[user_id])
+
+    if LSH_ENABLED:
+        await load_lsh_index(db=db)
+
+
+async def load_lsh_index(db: Database):
+    """ Загружает MinHash-сигнатуры из interest_signatures. Недостающие или устаревшие считает и сохраняет """
+    lsh_index.clear()
+    for row in await db.fetch_all(interest_signatures_table.select()):
+        signature = lsh_index.hasher.from_bytes(row["signature"])
+        if signature is not None and row["user_id"] in interest_index.terms_by_user:
+            lsh_index.set_user(row["user_id"], signature)
+
+    stale = [user_id for user_id in interest_index.terms_by_user if user_id not in lsh_index.signatures]
+    signatures = {user_id: lsh_index.hasher.signature(interest_index.terms(user_id)) for user_id in stale}
+    # Недостающие сигнатуры пишем многострочными INSERT-ами по SIGNATURES_CHUNK строк, а не по одной
+    items = list(signatures.items())
+    for start in range(0, len(items), SIGNATURES_CHUNK):
+        await _save_signatures(db=db, signatures=dict(items[start:start + SIGNATURES_CHUNK]))
+    for user_id, signature in signatures.items():
+        lsh_index.set_user(user_id, signature)
+
+
+async def update_signature(db: Database, user_id: int, term_ids):
+    """ Пересчитывает MinHash-сигнатуру пользователя и сохраняет её в БД """
+    signature = lsh_index.hasher.signature(term_ids)
+    await _save_signatures(db=db, signatures={user_id: signature})
+    lsh_index.set_user(user_id, signature)
+
+
+async def _save_signatures(db: Database, signatures: dict):
+    """ Сохраняет сигнатуры user_id -> signature одним запросом, заменяя старые """
+    query = pg_insert(interest_signatures_table).values([
+        {"user_id": user_id, "signature": lsh_index.hasher.to_bytes(signature)}
+        for user_id, signature in signatures.items()
+    ])
+    await db.execute(query.on_conflict_do_update(index_elements=["user_id"],
+                                                 set_={"signature": query.excluded.signature}))
+
+
+async def intern_terms(db: Database, terms: list):
+    """ Возвращает id интересов из словаря interest_terms, добавляя туда новые термины """
+    missing = vocabulary.missing(terms)
+    if missing:
+        await db.execute(
+            pg_insert(interest_terms_table).values([{"term": term} for term in missing]).on_conflict_do_nothing()
         )
+        query = interest_terms_table.select().where(interest_terms_table.c.term.in_(missing))
+        for row in await db.fetch_all(query):
+            vocabulary.add(row["id"], row["term"])
+    return [vocabulary.get_id(term) for term in terms]
+
+
+async def set_user_interest_terms(db: Database, user_id: int, stroke: str):
+    """ Сохраняет интересы пользователя в user_interests и возвращает их id """
+    term_ids = await intern_terms(db=db, terms=split_interests(stroke))
+    await db.execute(
+        user_interests_table.delete().where(and_(
+            user_interests_table.c.user_id == user_id,
+            user_interests_table.c.term_id.notin_(term_ids),
+        ))
     )
-    return db.fetch_all(query)
+    if term_ids:
+        await db.execute(
+            pg_insert(user_interests_table).
+            values([{"user_id": user_id, "term_id": term_id} for term_id in term_ids]).
+            on_conflict_do_nothing()
+        )
+    return term_ids
 
 
-def get_all_users_for_admin(db: Database, user_id: int):
-    query = users.join(tokens).select().where(users.c.id != user_id)
-    return db.fetch_all(query)
+async def get_user_matches(db: Database, user_id: int, limit: int, after: Optional[tuple] = None):
+    """ Предрасчитанные матчи пользователя из user_matches (по порядку rank), after - ключ (-score, match_id) """
+    query = sqlalchemy.select([user_matches_table, users.c.name]). \
+        select_from(user_matches_table.join(users, users.c.id == user_matches_table.c.match_id)). \
+        where(user_matches_table.c.user_id == user_id). \
+        order_by(user_matches_table.c.rank). \
+        limit(limit)
+    if after is not None:
+        score, match_id = -after[0], after[1]
+        query = query.where(sqlalchemy.or_(
+            user_matches_table.c.score < score,
+            and_(user_matches_table.c.score == score, user_matches_table.c.match_id > match_id),
+        ))
+    return await db.fetch_all(query)
 
 
-async def get_admin_all_users(db: Database, admin_id: int):
-    users_data = await get_all_users_for_admin(db=db, user_id=admin_id)
-    users_json = jsonable_encoder(users_data)
-    for item in users_json:
-        print(f"item: {item}")
+# Колонки выгрузки пользователей для администратора: поля пользователя идут в ответ как есть,
+# поля токена собираются во вложенный объект token
+ADMIN_USER_FIELDS = ("id", "email", "name", "is_active", "is_superuser")
+ADMIN_TOKEN_FIELDS = ("token", "expires")
+ADMIN_CSV_HEADER = ADMIN_USER_FIELDS + ADMIN_TOKEN_FIELDS
 
-    output_json = []
-    counter = 0
-    for item in users_json:
-        output_json.append({})
-        for key, value in item.items():
-            if key not in ["token", "expires", "token_type", "created_at", "title", "content"]:
-                output_json[counter][f"{key}"] = value
-            else:
-                output_json[counter]["token"] = {"token": item["token"], "expires": item["expires"],
-                                                 "token_type": "bearer"}
-        counter += 1
 
-    print(output_json)
-    return output_json
+def _admin_users_query(user_id: int):
+    return sqlalchemy.select([users.c[field] for field in ADMIN_USER_FIELDS] +
+                             [tokens.c[field] for field in ADMIN_TOKEN_FIELDS]). \
+        select_from(users.join(tokens)). \
+        where(users.c.id != user_id). \
+        order_by(users.c.id)
 
 
-def get_posts_of_user_name(db: Database, name: str):
-    query = users.join(posts).select().where(users.c.name == name)
-    return db.fetch_all(query)
+def reshape_admin_row(row) -> dict:
+    """ Строку users⋈tokens превращает в объект схемы FullUser """
+    item = {field: row[field] for field in ADMIN_USER_FIELDS}
+    item["token"] = {"token": row["token"], "expires": row["expires"], "token_type": "bearer"}
+    return item
 
 
-def get_user_by_token(db: Database, token: str):
-    """ Возвращает информацию о владельце указанного токена """
+def get_all_users_for_admin(db: Database, user_id: int):
+    return db.fetch_all(_admin_users_query(user_id))
+
+
+def iterate_all_users_for_admin(db: Database, user_id: int):
+    """ Строки выгрузки для администратора, читаются курсором по одной """
+    return db.iterate(_admin_users_query(user_id))
+
+
+async def get_admin_all_users(db: Database, admin_id: int):
+    users_data = await get_all_users_for_admin(db=db, user_id=admin_id)
+    return [reshape_admin_row(row) for row in users_data]
+
+
+async def copy_all_users_for_admin(db: Database, admin_id: int):
+    """ Выгрузка в CSV силами Postgres (COPY ... TO STDOUT): отдаёт куски байт по мере их получения """
+    query = _admin_users_query(admin_id).compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    chunks = asyncio.Queue(maxsize=16)
+
+    async def copy():
+        try:
+            async with db.connection() as connection, connection.transaction():
+                # SET LOCAL действует до конца транзакции и не остаётся на соединении в пуле
+                await connection.execute("SET LOCAL statement_timeout = 0")
+                await connection.raw_connection.copy_from_query(
+                    str(query), output=chunks.put, format="csv", header=True
+                )
+        except Exception as e:
+            await chunks.put(e)
+        else:
+            await chunks.put(None)
+
+    task = asyncio.get_running_loop().create_task(copy())
+    try:
+        while True:
+            chunk = await chunks.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield bytes(chunk)
+    finally:
+        task.cancel()
+
+
+def posts_cursor(post) -> str:
+    """ Курсор ленты постов: created_at и id последнего поста страницы """
+    return f"{post['created_at'].isoformat()},{post['id']}"
+
+
+def parse_posts_cursor(cursor: str) -> tuple:
+    try:
+        created_at, post_id = cursor.rsplit(",", 1)
+        return datetime.fromisoformat(created_at), int(post_id)
+    except ValueError:
+        raise ValueError(f"Bad cursor: {cursor}")
+
+
+def _posts_feed(query, limit: Optional[int] = None, before: Optional[tuple] = None):
+    """ Лента постов от новых к старым. before - (created_at, id) последнего поста предыдущей страницы """
+    if before is not None:
+        query = query.where(sqlalchemy.tuple_(posts.c.created_at, posts.c.id) < sqlalchemy.tuple_(*before))
+    query = query.order_by(posts.c.created_at.desc(), posts.c.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+async def search_posts(db: Database, text: str, limit: int, after: Optional[tuple] = None):
+    """ Посты, в заголовке или тексте которых есть все слова запроса, по убыванию ранга ts_rank.
+    Ранжируются только POSTS_SEARCH_MAX_CANDIDATES самых новых подходящих постов.
+    after - (-rank, id) последнего поста предыдущей страницы """
+    tsquery = sqlalchemy.func.websearch_to_tsquery(
+        sqlalchemy.literal_column(f"'{POSTS_SEARCH_CONFIG}'::regconfig"), text
+    )
+    rank = sqlalchemy.cast(sqlalchemy.func.ts_rank(posts_search_vector, tsquery), sqlalchemy.Float)
+    found = sqlalchemy.select([posts, rank.label("rank")]). \
+        where(posts_search_vector.op("@@")(tsquery)). \
+        order_by(posts.c.id.desc()). \
+        limit(POSTS_SEARCH_MAX_CANDIDATES). \
+        subquery()
+    query = sqlalchemy.select([found])
+    if after is not None:
+        neg_rank, post_id = after
+        query = query.where(sqlalchemy.or_(
+            found.c.rank < -neg_rank,
+            and_(found.c.rank == -neg_rank, found.c.id > post_id),
+        ))
+    query = query.order_by(found.c.rank.desc(), found.c.id).limit(limit)
+    return await db.fetch_all(query)
+
+
+def _posts_of_user_name_query(name: str):
+    return sqlalchemy.select([posts]).select_from(users.join(posts)). \
+        where(and_(users.c.name == name, users.c.deleted_at.is_(None)))
+
+
+def get_posts_of_user_name(db: Database, name: str, limit: Optional[int] = None, before: Optional[tuple] = None):
+    return reader(db).fetch_all(_posts_feed(_posts_of_user_name_query(name), limit=limit, before=before))
+
+
+def _posts_page(rows: list, limit: int, body: bytes) -> PostsPage:
+    return PostsPage(body, posts_cursor(rows[-1]) if len(rows) == limit else None)
+
+
+async def get_posts_of_user_name_json(db: Database, name: str, limit: int) -> PostsPage:
+    """ Первая страница постов пользователей с именем name в виде готового JSON (поля схемы PostsUpdate).
+    Читается через posts_cache, сбрасывается при изменении постов любого из них. Кеш заполняется с основной базы:
+    отстающая реплика сразу после сброса вернула бы в кеш страницу до записи на POSTS_CACHE_TTL """
+    async def load():
+        rows = await db.fetch_all(_posts_feed(_posts_of_user_name_query(name), limit=limit))
+        return _posts_page(rows, limit, schemas.posts_update_serializer.dumps_many(rows))
+
+    return await posts_cache.get_or_load(f"name:{name}:{limit}", [f"name:{name}"], load)
+
+
+async def get_user_by_token(db: Database, token: str):
+    """ Возвращает информацию о владельце указанного токена. Сначала смотрим в контекст запроса и token_cache """
+    key = ("user", token)
+    user = request_context.memo_get(key)
+    if not request_context.is_missing(user):
+        return user
+    user = token_cache.get(token)
+    if user is not None:
+        request_context.memo_set(key, user)
+        return user
+
     q = tokens.join(users).select().where(
         and_(
             users.c.email == token,
             tokens.c.expires > datetime.now()
         )
     )
+    user = await db.fetch_one(q)
+    if user is not None:
+        token_cache.put(token, user)
+    request_context.memo_set(key, user)
+    return user
 
-    return db.fetch_one(q)
 
-
-def get_interests_user_by_ui(db: Database, user_id: int):
+async def get_interests_user_by_ui(db: Database, user_id: int):
     """ Получаем пользователя по его user_id """
-    query = users.join(interests_table).select().where(
-        and_(
-            users.c.id == user_id,
-            interests_table.c.user_id == user_id
+    key = ("interests_user", user_id)
+    interests_user = request_context.memo_get(key)
+    if request_context.is_missing(interests_user):
+        query = users.join(interests_table).select().where(
+            and_(
+                users.c.id == user_id,
+                interests_table.c.user_id == user_id
+            )
         )
-    )
-    return db.fetch_one(query)
+        interests_user = await db.fetch_one(query)
+        request_context.memo_set(key, interests_user)
+    return interests_user
+
+
+async def get_post_cu(db: Database, user_id: int, limit: Optional[int] = None, before: Optional[tuple] = None):
+    """ Получаем посты пользователя по его user_id (от новых к старым, постранично).
+    Читаем с основной базы, а не с реплики: ответ помечается ETag по версии из основной базы, и отстающая
+    реплика отдала бы старые посты с новым ETag """
+    key = ("posts", user_id)
+    pages = request_context.memo_get(key)
+    if request_context.is_missing(pages):
+        pages = {}
+        request_context.memo_set(key, pages)
+    if (limit, before) not in pages:
+        query = posts.select().where(
+            posts.c.user_id == user_id
+        )
+        pages[(limit, before)] = await db.fetch_all(_posts_feed(query, limit=limit, before=before))
+    return pages[(limit, before)]
 
 
-def get_post_cu(db: Database, user_id: int):
-    """ Получаем посты пользователя по его user_id """
-    query = posts.select().where(
-        posts.c.user_id == user_id
-    )
-    return db.fetch_all(query)
+async def get_post_cu_json(db: Database, user_id: int, limit: int) -> PostsPage:
+    """ Первая страница постов пользователя в виде готового JSON. Читается через posts_cache,
+    заполняется с основной базы (см. get_post_cu) """
+    async def load():
+        rows = await get_post_cu(db=db, user_id=user_id, limit=limit)
+        return _posts_page(rows, limit, dumps([dict(row) for row in rows]))
 
+    return await posts_cache.get_or_load(f"user:{user_id}:{limit}", [f"user:{user_id}"], load)
 
-def get_all_users(db: Database):
-    """ Получаем всех пользователей """
-    query = tokens.join(users).join(interests_table).select()
-    return db.fetch_all(query)
 
+def forget_user_interests(user_id: int):
+    """ Сбрасывает запомненные в рамках запроса интересы пользователя """
+    request_context.memo_forget(("interests_user", user_id))
 
-def create_user_token(db: Database, user_id: int):
-    """ Создает токен для пользователя с указанным user_id """
-    insert_token = str(uuid_generate_v4())
-    query = (
-        tokens.insert()
-            .values(expires=datetime.now() + timedelta(weeks=2), user_id=user_id, token=insert_token)
-            .returning(tokens.c.token, tokens.c.expires)
-    )
 
-    return db.fetch_one(query)
+def forget_user_posts(user_id: int):
+    """ Сбрасывает запомненные в рамках запроса посты пользователя """
+    request_context.memo_forget(("posts", user_id))
 
 
-async def delete_posts(db: Database, user_id: int):
-    query = posts.delete().where(posts.c.user_id == user_id)
-    return await db.execute(query)
+def _all_users_query(after: Optional[int] = None, limit: Optional[int] = None):
+    query = sqlalchemy.select([users.c.id, users.c.email, users.c.name, interests_table.c.interests]). \
+        select_from(tokens.join(users).join(interests_table))
+    return _keyset_page(query, users.c.id, after=after, limit=limit)
+
 
+def get_all_users(db: Database, limit: Optional[int] = None, after: Optional[int] = None):
+    """ Получаем всех пользователей (страницу из limit пользователей с id > after) """
+    return reader(db).fetch_all(_all_users_query(after=after, limit=limit))
 
-async def delete_cu(db: Database, user_id: int):
-    query3 = interests_table.delete().where(interests_table.c.user_id == user_id)
-    await delete_posts(db=db, user_id=user_id)
-    query = users.delete().where(users.c.id == user_id)
-    await db.execute(query3)
-    query2 = tokens.delete().where(tokens.c.user_id == user_id)
-    await db.execute(query2)
+
+def iterate_all_users(db: Database, after: Optional[int] = None):
+    """ То же, что get_all_users, но строки читаются курсором по одной """
+    return reader(db).iterate(_all_users_query(after=after))
+
+
+async def delete_posts(db: Database, user_id: int):
+    query = posts.delete().where(posts.c.user_id == user_id)
+    result = await db.execute(query)
+    forget_user_posts(user_id)
+    await posts_changed(db=db, user_id=user_id)
+    return result
+
+
+# Мягкое удаление одним запросом: помечаем пользователя и удаляем всё, что его описывает, кроме постов.
+# Без токенов и интересов он сразу пропадает из авторизации, списков и матчей, без записей в лентах - из чужих лент;
+# посты вычищает project.purge
+_SOFT_DELETE_USER = sqlalchemy.text("""
+    WITH deleted_tokens AS (DELETE FROM tokens WHERE user_id = :user_id),
+         deleted_interests AS (DELETE FROM interests WHERE user_id = :user_id),
+         deleted_terms AS (DELETE FROM user_interests WHERE user_id = :user_id),
+         deleted_signature AS (DELETE FROM interest_signatures WHERE user_id = :user_id),
+         deleted_matches AS (DELETE FROM user_matches WHERE user_id = :user_id OR match_id = :user_id),
+         deleted_timelines AS (DELETE FROM timelines WHERE user_id = :user_id OR author_id = :user_id)
+    UPDATE users SET deleted_at = now(), is_active = false WHERE id = :user_id
+    RETURNING name
+""")
+
+
+async def delete_cu(db: Database, user_id: int, soft: bool = ACCOUNT_SOFT_DELETE):
+    """ Удаляет пользователя одним запросом (и одной транзакцией): строки в остальных таблицах удаляют каскады
+    внешних ключей. При soft пользователь только помечается удалённым, а посты вычищаются в фоне -
+    время ответа не зависит от числа постов """
+    if soft:
+        name = await db.fetch_val(_SOFT_DELETE_USER.bindparams(user_id=user_id))
+        account_purger.wake()
+    else:
+        name = await db.fetch_val(users.delete().where(users.c.id == user_id).returning(users.c.name))
+    token_cache.invalidate_user(user_id)
+    matches_worker.interests_changed(user_id, interest_index.terms(user_id), ())
+    interest_index.remove_user(user_id)
+    lsh_index.remove_user(user_id)
+    timeline.fanout_on_read_authors.discard(user_id)
+    data_versions.invalidate(user_id)
+    posts_cache.invalidate_user(user_id, name)
+    forget_user_interests(user_id)
+    forget_user_posts(user_id)
+
+
+async def set_user_active(db: Database, user_id: int, is_active: bool):
+    """ Активирует или деактивирует пользователя """
+    query = users.update().where(users.c.id == user_id).values(is_active=is_active)
     await db.execute(query)
+    token_cache.invalidate_user(user_id)
+    await bump_data_version(db=db, user_id=user_id)
 
 
 async def update_cu_interests(db: Database, interest: dict, update: dict):
     uid = int(interest["user_id"])
     for k, v in update.items():
         if k == "interests" and interest[k]:
-            interest[k] = update[k]
+            interest[k] = ", ".join(split_interests(str(update[k])))
     query = interests_table.update(). \
         where(interests_table.c.user_id == uid). \
         values(interests=str(interest["interests"]))
     await db.execute(query)
+    term_ids = await set_user_interest_terms(db=db, user_id=uid, stroke=str(interest["interests"]))
+    matches_worker.interests_changed(uid, interest_index.terms(uid), term_ids)
+    interest_index.set_user(uid, term_ids, name=interest.get("name"))
+    if LSH_ENABLED:
+        await update_signature(db=db, user_id=uid, term_ids=term_ids)
+    forget_user_interests(uid)
+    await bump_data_version(db=db, user_id=uid)
 
 
-async def update_mine_posts(db: Database, update: list, user_id: int):
+async def update_mine_posts(db: Database, title: str, content: str, user_id: int):
+    """ Меняет содержимое постов пользователя с указанным заголовком """
     stmt = posts.update().where(and_(
         posts.c.user_id == user_id,
-        posts.c.title == update[0]["title"]
-    )).values(content=update[0]["content"])
+        posts.c.title == title
+    )).values(content=content, updated_at=datetime.now(), version=posts.c.version + 1)
 
     await db.execute(stmt)
+    forget_user_posts(user_id)
+    await posts_changed(db=db, user_id=user_id)
+
+
+class PostVersionConflict(Exception):
+    """ Пост уже изменён кем-то другим: версия в БД не совпадает с версией клиента """
+
+
+async def update_post(db: Database, post_id: int, user_id: int, update: schemas.PostsEdit):
+    """ Изменяет пост пользователя одним UPDATE ... RETURNING. Возвращает новую строку или None, если поста нет """
+    values = {key: value for key, value in (("title", update.title), ("content", update.content)) if value is not None}
+    condition = and_(posts.c.id == post_id, posts.c.user_id == user_id)
+    if update.version is not None:
+        condition = and_(condition, posts.c.version == update.version)
+    stmt = posts.update().where(condition). \
+        values(updated_at=datetime.now(), version=posts.c.version + 1, **values). \
+        returning(*posts.c)
+
+    async with db.transaction():
+        row = await db.fetch_one(stmt)
+        if row is None and update.version is not None:
+            # Отличаем "поста нет" от "пост изменили": второй запрос только на неудачном пути
+            exists = await db.fetch_val(
+                sqlalchemy.select([posts.c.id]).where(and_(posts.c.id == post_id, posts.c.user_id == user_id))
+            )
+            if exists is not None:
+                raise PostVersionConflict()
+    forget_user_posts(user_id)
+    if row is not None:
+        await posts_changed(db=db, user_id=user_id)
+    return row
+
+
+class EmailAlreadyRegistered(Exception):
+    """ Пользователь с таким email уже есть (сработал уникальный индекс ix_users_email) """
+
+
+# Регистрация одним запросом: пользователь, его интересы и токен. Если email занят, ON CONFLICT ничего не вставляет,
+# остальные части цепочки берут user_id из new_user и тоже ничего не вставляют, запрос возвращает 0 строк
+_SIGN_UP = sqlalchemy.text("""
+    WITH new_user AS (
+        INSERT INTO users (email, name, hashed_password, is_superuser)
+        VALUES (:email, :name, :hashed_password, false)
+        ON CONFLICT (email) DO NOTHING
+        RETURNING id
+    ), new_interests AS (
+        INSERT INTO interests (interests, user_id) SELECT :interests, id FROM new_user
+    ), new_terms AS (
+        INSERT INTO user_interests (user_id, term_id)
+        SELECT new_user.id, term_id FROM new_user, unnest(CAST(:term_ids AS integer[])) AS term_id
+    )
+    INSERT INTO tokens (token, expires, user_id)
+    SELECT :token, CAST(:expires AS timestamp), id FROM new_user
+    RETURNING user_id, token, expires
+""")
 
 
-async def create_user(db: Database, user: schemas.UserCreate):
-    """ Создает нового пользователя в БД """
-    salt = get_random_string()
-    hashed_password = hash_password(user.password, salt)
+async def insert_user(db: Database, user: schemas.UserCreate, hashed_password: str, term_ids: List[int]):
+    """ Вставляет пользователя, его интересы и токен одним запросом. Возвращает строку токена (user_id, token,
+    expires) или None, если email занят """
+    return await db.fetch_one(_SIGN_UP.bindparams(
+        email=user.email, name=user.name, hashed_password=hashed_password, interests=user.interests,
+        term_ids=term_ids, token=str(uuid_generate_v4()), expires=datetime.now() + timedelta(weeks=2),
+    ))
 
-    query = users.insert().values(
-        email=user.email, name=user.name, hashed_password=f"{salt}${hashed_password}", is_superuser=False,
-    )
-    user_id = await db.execute(query)
 
-    query_interests = interests_table.insert().values(
-        interests=user.interests, user_id=user_id
-    )
-    await db.execute(query_interests)
+async def create_user(db: Database, user: schemas.UserCreate):
+    """ Создает нового пользователя в БД. Если email занят - EmailAlreadyRegistered """
+    salt = get_random_string()
+    hashed_password = await hashing_executor.run(hash_password, user.password, salt)
+    # Новые термины добавляются в словарь заранее: обычно все они уже в кеше vocabulary и запроса не нужно
+    term_ids = await intern_terms(db=db, terms=split_interests(user.interests))
+
+    token = await insert_user(db=db, user=user, hashed_password=f"{salt}${hashed_password}", term_ids=term_ids)
+    if token is None:
+        raise EmailAlreadyRegistered()
+    user_id = token["user_id"]
+    interest_index.set_user(user_id, term_ids, name=user.name)
+    matches_worker.interests_changed(user_id, (), term_ids)
+    if LSH_ENABLED:
+        await update_signature(db=db, user_id=user_id, term_ids=term_ids)
 
-    token = await create_user_token(db=db, user_id=user_id)
     token_dict = dict(token=token["token"], expires=str(token["expires"]), user_id=user_id)
     return {"id": str(user_id), "email": user.email, "name": user.name,
             "interests": user.interests, "token": token_dict}
@@ -0,0 +1,68 @@
+""" Подключения к БД: основная база и необязательная реплика для чтения, каждая со своим пулом соединений """
+from typing import Optional
+
+from databases import Database
+
+from project.instrumentation import InstrumentedDatabase
+from project.config import SQLALCHEMY_DATABASE_URL, DATABASE_REPLICA_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, \
+    DB_CONNECT_TIMEOUT, DB_STATEMENT_TIMEOUT
+
+
+def make_database(url: str) -> Database:
+    """ Database с настройками пула из config и метриками запросов. Параметры передаются в asyncpg.create_pool """
+    return InstrumentedDatabase(
+        url,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_CONNECT_TIMEOUT,
+        server_settings={"statement_timeout": str(DB_STATEMENT_TIMEOUT)},
+    )
+
+
+database = make_database(SQLALCHEMY_DATABASE_URL)
+replica: Optional[Database] = make_database(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
+
+
+def reader(db: Database) -> Database:
+    """ База для запросов только на чтение: реплика вместо основной базы, если реплика настроена.
+    Реплика может отставать - то, что только что записано, там может быть ещё не видно """
+    if db is database and replica is not None:
+        return replica
+    return db
+
+
+async def connect():
+    await database.connect()
+    if replica is not None:
+        await replica.connect()
+
+
+async def disconnect():
+    if replica is not None:
+        await replica.disconnect()
+    await database.disconnect()
+
+
+def _pool_metrics(db: Database) -> dict:
+    pool = getattr(db._backend, "_pool", None)
+    if pool is None:
+        return {"connected": False}
+    size, idle, max_size = pool.get_size(), pool.get_idle_size(), pool.get_max_size()
+    return {
+        "connected": True,
+        "min_size": pool.get_min_size(),
+        "max_size": max_size,
+        "size": size,
+        "idle": idle,
+        "in_use": size - idle,
+        # Доля занятых соединений от максимума пула: около 1 - новые запросы ждут соединения
+        "saturation": (size - idle) / max_size,
+    }
+
+
+def pool_metrics() -> dict:
+    """ Состояние пулов соединений основной базы и реплики """
+    return {
+        "primary": _pool_metrics(database),
+        "replica": _pool_metrics(replica) if replica is not None else None,
+    }
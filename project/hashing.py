@@ -0,0 +1,82 @@
+""" Пул для хеширования паролей. PBKDF2 выполняется вне event loop-а, чтобы не блокировать остальные запросы """
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from project.config import HASH_POOL_KIND, HASH_POOL_SIZE, HASH_QUEUE_SIZE
+
+
+class HashingQueueFull(Exception):
+    """ Очередь на хеширование переполнена, запрос нужно повторить позже """
+
+
+class HashingExecutor:
+    """ Пул процессов (или потоков) с ограниченной очередью и простыми метриками """
+
+    def __init__(self, kind: str = "process", workers: int = 2, max_queue: int = 64):
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Unknown hashing pool kind: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool: Optional[Executor] = None
+        self._in_flight = 0
+        self._rejected = 0
+        self._completed = 0
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+
+    def start(self):
+        """ Создаёт пул, если он ещё не создан """
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hashing")
+
+    def shutdown(self):
+        """ Останавливает пул и дожидается завершения уже принятых задач """
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    @property
+    def queue_depth(self) -> int:
+        """ Количество задач, которые ждут свободного воркера """
+        return max(0, self._in_flight - self.workers)
+
+    async def run(self, func: Callable, *args):
+        """ Выполняет func(*args) в пуле. Если очередь заполнена, бросает HashingQueueFull """
+        if self.queue_depth >= self.max_queue:
+            self._rejected += 1
+            raise HashingQueueFull()
+        self.start()
+
+        self._in_flight += 1
+        start_time = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+        finally:
+            self._in_flight -= 1
+            latency = time.perf_counter() - start_time
+            self._completed += 1
+            self._latency_sum += latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def metrics(self) -> dict:
+        """ Текущее состояние очереди и задержки хеширования (в секундах, включая ожидание в очереди) """
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "rejected": self._rejected,
+            "completed": self._completed,
+            "latency_avg": self._latency_sum / self._completed if self._completed else 0.0,
+            "latency_max": self._latency_max,
+        }
+
+
+hashing_executor = HashingExecutor(kind=HASH_POOL_KIND, workers=HASH_POOL_SIZE, max_queue=HASH_QUEUE_SIZE)
@@ -0,0 +1,242 @@
+""" Метрики приложения в памяти процесса и их выдача в текстовом формате Prometheus (GET /metrics).
+
+Гистограммы задержек роутов, зависимостей (get_current_user и др.) и запросов к БД (с функцией, которая
+выполнила запрос), число запросов к БД на HTTP-запрос, счётчики строк,
+плюс состояние пула хеширования, кеша токенов и пулов соединений - они снимаются в момент запроса /metrics.
+Запись - словарь и несколько сложений, без блокировок и ввода-вывода: всё выполняется в event loop-е.
+"""
+import functools
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import sqlalchemy
+from databases import Database
+
+from project import profiling
+
+# Границы корзин гистограмм задержек в секундах
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # метки -> (число наблюдений в каждой корзине без накопления, сумма, количество)
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {count}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics: list = []
+        self.collectors: List[Callable[[], Iterable[Tuple[str, str, dict, float]]]] = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, dict, float]]]):
+        """ collector возвращает значения, которые снимаются в момент запроса: (имя, описание, метки, значение) """
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        described = set()
+        for collector in self.collectors:
+            for name, documentation, labels, value in collector():
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {documentation}")
+                    lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ["method", "route", "status"]
+)
+dependency_duration = registry.histogram(
+    "dependency_duration_seconds", "FastAPI dependency latency", ["dependency"]
+)
+query_duration = registry.histogram(
+    "db_query_duration_seconds", "Database query latency", ["operation", "statement", "caller"]
+)
+query_rows = registry.counter(
+    "db_query_rows_total", "Rows returned by database queries", ["operation", "statement", "caller"]
+)
+request_queries = registry.histogram(
+    "http_request_db_queries", "Database queries issued by one HTTP request", ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+query_errors = registry.counter(
+    "db_query_errors_total", "Database queries that raised an exception", ["operation", "statement", "caller"]
+)
+
+
+def route_label(scope: dict) -> str:
+    """ Шаблон пути роута (/get_posts/{name}), а не сам путь - чтобы число серий не зависело от параметров """
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def timed_dependency(name: Optional[str] = None):
+    """ Декоратор для async-зависимостей FastAPI: пишет их время выполнения в dependency_duration.
+    Сигнатура сохраняется (functools.wraps), поэтому FastAPI разбирает параметры как у исходной функции """
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                dependency_duration.observe(time.perf_counter() - start, label)
+        return wrapper
+    return decorator
+
+
+def statement_label(query) -> str:
+    """ Вид запроса и таблица: "select posts", "insert tokens", "text" - для текстовых запросов """
+    visit = getattr(query, "__visit_name__", None)
+    if visit in ("insert", "update", "delete"):
+        return f"{visit} {query.table.name}"
+    if visit == "select":
+        froms = query.get_final_froms()
+        if not froms:
+            return "select"
+        table = froms[0]
+        while isinstance(table, sqlalchemy.sql.expression.Join):
+            table = table.left
+        return f"select {table.name}" if isinstance(table, sqlalchemy.Table) else "select subquery"
+    return "text" if visit == "textclause" else "raw"
+
+
+class InstrumentedDatabase(Database):
+    """ Database, который пишет время и число строк каждого запроса в query_duration и query_rows с меткой
+    функции, выполнившей запрос, журналирует медленные запросы и считает запросы HTTP-запроса (project.profiling).
+    Методы - обычные функции, возвращающие корутину: так вызывающая функция видна в стеке в момент вызова """
+
+    async def _timed(self, operation: str, caller: str, method, query, values, *args, rows: Callable = None):
+        profiling.track_request_query(caller, query)
+        start = time.perf_counter()
+        try:
+            result = await method(query, values, *args)
+        except Exception:
+            self._observe(operation, caller, query, time.perf_counter() - start, failed=True)
+            raise
+        elapsed = time.perf_counter() - start
+        self._observe(operation, caller, query, elapsed, rows=rows(result) if rows else None)
+        if profiling.is_slow(elapsed) and profiling.should_explain(query):
+            await profiling.log_explain(self, caller, query, values)
+        return result
+
+    def _observe(self, operation: str, caller: str, query, elapsed: float, rows: Optional[int] = None,
+                 failed: bool = False):
+        statement = statement_label(query)
+        query_duration.observe(elapsed, operation, statement, caller)
+        if rows is not None:
+            query_rows.inc(operation, statement, caller, amount=rows)
+        if failed:
+            query_errors.inc(operation, statement, caller)
+        if profiling.is_slow(elapsed):
+            profiling.log_slow_query(caller, operation, query, elapsed, rows)
+
+    def fetch_all(self, query, values: dict = None):
+        return self._timed("fetch_all", profiling.query_caller(), super().fetch_all, query, values, rows=len)
+
+    def fetch_one(self, query, values: dict = None):
+        return self._timed("fetch_one", profiling.query_caller(), super().fetch_one, query, values,
+                           rows=lambda row: int(row is not None))
+
+    def fetch_val(self, query, values: dict = None, column=0):
+        return self._timed("fetch_val", profiling.query_caller(), super().fetch_val, query, values, column)
+
+    def execute(self, query, values: dict = None):
+        return self._timed("execute", profiling.query_caller(), super().execute, query, values)
+
+    def execute_many(self, query, values: list):
+        return self._timed("execute_many", profiling.query_caller(), super().execute_many, query, values)
+
+    def iterate(self, query, values: dict = None):
+        return self._iterate(profiling.query_caller(), query, values)
+
+    async def _iterate(self, caller: str, query, values: dict = None):
+        profiling.track_request_query(caller, query)
+        start = time.perf_counter()
+        rows, failed = 0, False
+        try:
+            async for row in super().iterate(query, values):
+                rows += 1
+                yield row
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # Время - до конца чтения, включая то, что потребитель делает между строками
+            self._observe("iterate", caller, query, time.perf_counter() - start, rows=rows, failed=failed)
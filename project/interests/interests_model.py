@@ -10,5 +10,41 @@ interests_table = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column("interests", sqlalchemy.Text(), nullable=False),
-    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey(users_table.c.id)),
-)
\ No newline at end of file
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey(users_table.c.id, ondelete="CASCADE")),
+)
+
+# Словарь интересов: каждый нормализованный интерес хранится один раз и получает целочисленный id
+interest_terms_table = sqlalchemy.Table(
+    "interest_terms",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("term", sqlalchemy.String(100), nullable=False, unique=True, index=True),
+)
+
+# Связь пользователь -> интерес из словаря
+user_interests_table = sqlalchemy.Table(
+    "user_interests",
+    metadata,
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey(users_table.c.id, ondelete="CASCADE"), primary_key=True),
+    sqlalchemy.Column("term_id", sqlalchemy.ForeignKey(interest_terms_table.c.id), primary_key=True),
+    sqlalchemy.Index("ix_user_interests_term_id", "term_id"),
+)
+
+# MinHash-сигнатуры интересов пользователей для приближённого поиска (см. project.minhash)
+interest_signatures_table = sqlalchemy.Table(
+    "interest_signatures",
+    metadata,
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey(users_table.c.id, ondelete="CASCADE"), primary_key=True),
+    sqlalchemy.Column("signature", sqlalchemy.LargeBinary(), nullable=False),
+)
+
+# Предрасчитанные списки похожих пользователей (см. project.recommendations). rank начинается с 1
+user_matches_table = sqlalchemy.Table(
+    "user_matches",
+    metadata,
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey(users_table.c.id, ondelete="CASCADE"), primary_key=True),
+    sqlalchemy.Column("rank", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("match_id", sqlalchemy.ForeignKey(users_table.c.id, ondelete="CASCADE"), nullable=False, index=True),
+    sqlalchemy.Column("score", sqlalchemy.Float(), nullable=False),
+    sqlalchemy.Column("computed_at", sqlalchemy.DateTime(), nullable=False),
+)
@@ -0,0 +1,36 @@
+""" Кеш словаря интересов в памяти процесса: термин <-> целочисленный id из таблицы interest_terms """
+from typing import Dict, Iterable, List, Optional
+
+
+class Vocabulary:
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.terms: Dict[int, str] = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, term_id: int, term: str):
+        self.ids[term] = term_id
+        self.terms[term_id] = term
+
+    def load(self, rows: Iterable):
+        """ rows - строки таблицы interest_terms """
+        self.ids.clear()
+        self.terms.clear()
+        for row in rows:
+            self.add(row["id"], row["term"])
+
+    def get_id(self, term: str) -> Optional[int]:
+        return self.ids.get(term)
+
+    def missing(self, terms: Iterable[str]) -> List[str]:
+        """ Термины, которых ещё нет в кеше """
+        return [term for term in terms if term not in self.ids]
+
+    def to_terms(self, term_ids: Iterable[int]) -> List[str]:
+        return sorted(self.terms[term_id] for term_id in term_ids)
+
+
+vocabulary = Vocabulary()
@@ -1,12 +1,29 @@
-from fastapi import FastAPI, APIRouter, Request, Depends, HTTPException, status
+from fastapi import FastAPI, APIRouter, Request, Response, Depends, HTTPException, Query, status
 from fastapi.encoders import jsonable_encoder
-from typing import List
+from typing import List, Optional
+import hashlib
+import json
 import time
+from datetime import datetime
 from fastapi.responses import JSONResponse
 from . import crud
 from . import schemas
-import databases
-from .config import SQLALCHEMY_DATABASE_URL
+from . import request_context
+from . import db
+from . import instrumentation
+from . import profiling
+from .hashing import hashing_executor, HashingQueueFull
+from .cache import token_cache, posts_cache, PostsPage
+from .matching import interest_index, make_cursor, parse_cursor
+from .recommendations import matches_worker
+from .purge import account_purger
+from .serialization import RowSerializer, JSON_MEDIA_TYPE
+from .streaming import ndjson_response, csv_response, bytes_response, encode_json, iter_ndjson_lines, \
+    CSV_MEDIA_TYPE, NDJSON_MEDIA_TYPE
+from .interests.vocabulary import vocabulary
+from .minhash import lsh_index
+from .config import MAX_PAGE_SIZE, LSH_ENABLED, MATCHES_MODE, MATCHES_WORKER_ENABLED, \
+    POSTS_BATCH_MAX, POSTS_BATCH_CHUNK, ACCOUNT_SOFT_DELETE, DEBUG, FAST_JSON
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from templates import success_page, main_page
 from fastapi.responses import HTMLResponse
@@ -19,22 +36,120 @@ class UnicornException(Exception):
         self.status = code_status
 
 
+# Ответы с данными пользователя можно хранить только в кеше клиента и только с проверкой ETag
+PRIVATE_CACHE_HEADERS = {"Cache-Control": "private, no-cache"}
+
+
+class NotModified(Exception):
+    """ Данные пользователя не менялись с версии, ETag которой прислал клиент в If-None-Match """
+    def __init__(self, etag: str):
+        self.etag = etag
+
+
+def make_etag(user_id: int, version: int, request: Request) -> str:
+    """ Слабый ETag: версия данных пользователя плюс путь и параметры запроса (у страниц постов разные ETag) """
+    variant = hashlib.blake2b(f"{request.url.path}?{request.url.query}".encode(), digest_size=6).hexdigest()
+    return f'W/"{user_id}.{version}.{variant}"'
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """ Слабое сравнение из RFC 7232: префикс W/ не учитывается """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tag = etag[2:] if etag.startswith("W/") else etag
+    return any((candidate[2:] if candidate.startswith("W/") else candidate) == tag
+               for candidate in (part.strip() for part in if_none_match.split(",")))
+
+
+def check_page_limit(limit: int):
+    """ Проверяет размер запрошенной страницы """
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise UnicornException(code_status=400, content=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+
+def set_next_after(response: Response, rows: list, limit: int):
+    """ Если страница заполнена целиком, сообщает клиенту id, с которого начинается следующая """
+    if len(rows) == limit:
+        response.headers["X-Next-After"] = str(rows[-1]["id"])
+
+
+def fast_json_response(response: Response, rows, serializer: RowSerializer) -> Response:
+    """ Быстрый путь (FAST_JSON): строки кодируются в JSON сразу, без jsonable_encoder и проверки response_model.
+    Заголовки, выставленные через response (X-Next-After), переносятся в ответ """
+    return Response(serializer.dumps_many(rows), media_type=JSON_MEDIA_TYPE, headers=dict(response.headers))
+
+
+def posts_page_response(response: Response, page: PostsPage) -> Response:
+    """ Первая страница постов из posts_cache: тело уже в JSON, курсор следующей - в X-Next-Before """
+    headers = dict(response.headers)
+    if page.next_before is not None:
+        headers["X-Next-Before"] = page.next_before
+    return Response(page.body, media_type=JSON_MEDIA_TYPE, headers=headers)
+
+
+def user_base_encoder():
+    """ Кодирование строки для stream=true: быстрый сериализатор или схема UserBase """
+    if FAST_JSON:
+        return schemas.user_base_serializer.dumps
+    return lambda row: schemas.UserBase(**dict(row)).json()
+
+
+def parse_before(before: Optional[str]):
+    """ Разбирает курсор ленты постов """
+    if before is None:
+        return None
+    try:
+        return crud.parse_posts_cursor(before)
+    except ValueError as e:
+        raise UnicornException(code_status=400, content=str(e))
+
+
+def set_next_before(response: Response, posts: list, limit: int):
+    """ Если страница ленты заполнена целиком, сообщает клиенту курсор следующей """
+    if len(posts) == limit:
+        response.headers["X-Next-Before"] = crud.posts_cursor(posts[-1])
+
+
 # Объявление движка приложения
 app = FastAPI()
 
 
 # Создадим промежуточное ПО по http
-# считаем время запросов ( для тестов )
+# считаем время запросов: заголовок X-Process-Time и гистограмма по шаблону роута для /metrics
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
+    start_time = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        instrumentation.request_duration.observe(
+            time.perf_counter() - start_time, request.method, instrumentation.route_label(request.scope), "500"
+        )
+        raise
+    process_time = time.perf_counter() - start_time
     response.headers["X-Process-Time"] = str(process_time)
-    print(f"Time of current request: {process_time}")
+    route = instrumentation.route_label(request.scope)
+    instrumentation.request_duration.observe(process_time, request.method, route, str(response.status_code))
+    queries = profiling.request_query_count()
+    instrumentation.request_queries.observe(queries, route)
+    if DEBUG:
+        response.headers["X-DB-Queries"] = str(queries)
     return response
 
 
+# Контекст запроса: crud-хелперы запоминают в нём пользователя, интересы и посты,
+# чтобы в рамках одного запроса не ходить за ними в БД повторно
+@app.middleware("http")
+async def request_scope(request: Request, call_next):
+    token = request_context.begin()
+    try:
+        return await call_next(request)
+    finally:
+        request_context.end(token)
+
+
 # Конфигурации роута /api/user/...
 user_router = APIRouter(
     prefix="/api/user",
@@ -56,8 +171,8 @@ admin_router = APIRouter(
     responses={404: {"description": "My Dear, dont take mistakes there !"}},
 )
 
-# Инициализация БД
-database = databases.Database(SQLALCHEMY_DATABASE_URL)
+# Инициализация БД: основная база и реплика для чтения (project.db)
+database = db.database
 
 
 # Обработчик ошибок внутри приложения app
@@ -70,13 +185,29 @@ async def unicorn_exception_handler(request: Request, exc: UnicornException):
     )
 
 
+@app.exception_handler(NotModified)
+async def not_modified_handler(request: Request, exc: NotModified):
+    """ 304 без тела: клиент использует сохранённый ответ """
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": exc.etag, **PRIVATE_CACHE_HEADERS})
+
+
+@app.exception_handler(HashingQueueFull)
+async def hashing_queue_full_handler(request: Request, exc: HashingQueueFull):
+    """ Пул хеширования перегружен: просим клиента повторить запрос позже """
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"message": "Oops! Server is busy, try again later"},
+        headers={"Retry-After": "1"},
+    )
+
+
 # Роут аунтетификации
 @app.post("/auth")
 async def auth(form_data: OAuth2PasswordRequestForm = Depends()):
     user = await crud.get_user_by_email(db=database, email=form_data.username)
     if not user:
         raise UnicornException(code_status=400, content="Incorrect email or password")
-    if not crud.validate_password(
+    if not await crud.validate_password(
             password=form_data.password, hashed_password=user["hashed_password"]
     ):
         raise UnicornException(code_status=400, content="Incorrect email or password")
@@ -87,25 +218,59 @@ async def auth(form_data: OAuth2PasswordRequestForm = Depends()):
 # Роут регистрации
 @user_router.post("/sign-up", response_model=schemas.User, response_model_exclude_unset=True)
 async def create_user(user: schemas.UserCreate):
-    """ Проверка на наличие уже зарегистрированного пользователя """
-    db_user = await crud.get_user_by_email(db=database, email=user.email)
-    if db_user:
+    """ Регистрация. Занятый email определяет уникальный индекс, а не отдельный запрос перед вставкой """
+    try:
+        return await crud.create_user(db=database, user=user)
+    except crud.EmailAlreadyRegistered:
         raise UnicornException(code_status=418, content="Email already registered")
-    return await crud.create_user(db=database, user=user)
 
 
 # Объявляем применяемую зависимость для аунтетифицированных пользователей
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth")
 
 
-async def get_mine_interests(token: str = Depends(oauth2_scheme)):
-    cu = await crud.get_user_by_token(db=database, token=token)
+# Вспомогательный функция-зависимость. Для текущего аунт. юзера возвращает информацию о нём согласно полям схемы User.
+@instrumentation.timed_dependency()
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    user = await crud.get_user_by_token(db=database, token=token)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if not user["is_active"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user"
+        )
+    return user
+
+
+# Функция-зависимость для условных GET: ставит ETag по версии данных текущего пользователя и, если она совпадает
+# с If-None-Match, сразу отвечает 304. Версия берётся из кеша data_versions, строки из БД не читаются.
+# В роуте должна стоять раньше зависимостей, которые читают данные.
+@instrumentation.timed_dependency()
+async def user_data_etag(request: Request, response: Response,
+                         current_user: schemas.User = Depends(get_current_user)) -> str:
+    user_id = int(current_user["user_id"])
+    version = await crud.get_data_version(db=database, user_id=user_id)
+    etag = make_etag(user_id, version, request)
+    if etag_matches(etag, request.headers.get("if-none-match")):
+        raise NotModified(etag)
+    response.headers["ETag"] = etag
+    response.headers.update(PRIVATE_CACHE_HEADERS)
+    return etag
+
+
+@instrumentation.timed_dependency()
+async def get_mine_interests(cu: schemas.User = Depends(get_current_user)):
     user_id = int(cu["user_id"])
     return await crud.get_interests_user_by_ui(db=database, user_id=user_id)
 
 
 @app.get("/api/user/auth/my_page/interests", response_model=schemas.InterestsBase, response_model_exclude_unset=True)
-async def get_my_interest(my_interests: schemas.InterestsBase = Depends(get_mine_interests)):
+async def get_my_interest(etag: str = Depends(user_data_etag),
+                          my_interests: schemas.InterestsBase = Depends(get_mine_interests)):
     return my_interests
 
 
@@ -119,46 +284,60 @@ async def update_cu_interests(update: schemas.InterestsUpdate,
     return success_page.success_letter(letter="Success!")
 
 
-# Вспомогательный функция-зависимость. Для текущего аунт. юзера возвращает информацию о нём согласно полям схемы User.
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    user = await crud.get_user_by_token(db=database, token=token)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    if not user["is_active"]:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user"
-        )
-    return user
+@user_posts_router.get("/get_posts/{name}", response_model=List[schemas.PostsUpdate])
+async def get_posts_of_user_use_name(name: str, response: Response, limit: int = 20, before: Optional[str] = None,
+                                     cu: schemas.User = Depends(get_current_user)):
+    check_page_limit(limit)
+    if before is None:
+        page = await crud.get_posts_of_user_name_json(db=database, name=name, limit=limit)
+        return posts_page_response(response, page)
+    posts = await crud.get_posts_of_user_name(db=database, name=name, limit=limit, before=parse_before(before))
+    set_next_before(response, posts, limit)
+    return posts
 
 
-@user_posts_router.get("/get_posts/{name}", response_model=List[schemas.PostsUpdate])
-async def get_posts_of_user_use_name(name: str, cu: schemas.User = Depends(get_current_user)):
-    return await crud.get_posts_of_user_name(db=database, name=name)
+# Полнотекстовый поиск по заголовкам и текстам постов: от более релевантных к менее,
+# cursor - значение заголовка X-Next-Cursor предыдущей страницы.
+@user_posts_router.get("/search", response_model=List[schemas.PostsSearchHit])
+async def search_posts(response: Response, q: str = Query(..., min_length=1), limit: int = 20,
+                       cursor: Optional[str] = None, cu: schemas.User = Depends(get_current_user)):
+    check_page_limit(limit)
+    try:
+        after = parse_cursor(cursor) if cursor is not None else None
+    except ValueError as e:
+        raise UnicornException(code_status=400, content=str(e))
+    hits = await crud.search_posts(db=database, text=q, limit=limit, after=after)
+    if len(hits) == limit:
+        response.headers["X-Next-Cursor"] = make_cursor(-hits[-1]["rank"], hits[-1]["id"])
+    return hits
 
 
 @app.delete("/api/user/auth/my_page/delete_my_page")
 async def delete_my_page(cu: schemas.User = Depends(get_current_user)):
-    uid = int(jsonable_encoder(cu)["id"])
+    uid = int(jsonable_encoder(cu)["user_id"])
     await crud.delete_cu(db=database, user_id=uid)
     return success_page.success_letter(letter="Success!")
 
 
-# Функция получения всех постов текущего пользователя.
-async def get_me_posts(current_user: schemas.User = Depends(get_current_user)):
+# Функция получения постов текущего пользователя: лента от новых к старым,
+# before - курсор из заголовка X-Next-Before предыдущей страницы.
+@instrumentation.timed_dependency()
+async def get_me_posts(response: Response, limit: int = 20, before: Optional[str] = None,
+                       current_user: schemas.User = Depends(get_current_user)):
     cu = dict(current_user)
     user_id = cu["user_id"]
-    update_user = await crud.get_post_cu(db=database, user_id=user_id)
+    check_page_limit(limit)
+    if before is None:
+        return posts_page_response(response, await crud.get_post_cu_json(db=database, user_id=user_id, limit=limit))
+    update_user = await crud.get_post_cu(db=database, user_id=user_id, limit=limit, before=parse_before(before))
+    set_next_before(response, update_user, limit)
 
     return update_user
 
 
 @user_posts_router.delete("/delete")
 async def delete_my_posts(cu: schemas.User = Depends(get_current_user)):
-    uid = int(jsonable_encoder(cu)["id"])
+    uid = int(jsonable_encoder(cu)["user_id"])
     await crud.delete_posts(db=database, user_id=uid)
     return success_page.success_letter(letter="Success!")
 
@@ -166,124 +345,213 @@ async def delete_my_posts(cu: schemas.User = Depends(get_current_user)):
 # Пушим посты в базу данных для дальнейшего вывода их в ЛК пользователя.
 @user_posts_router.post("/", response_model=schemas.PostsBase, response_model_exclude_unset=True)
 async def create_new_posts(post: schemas.PostsIn, current_user: schemas.User = Depends(get_current_user)):
+    cu = dict(current_user)
+    user_id = cu["user_id"]
+    return await crud.push_post(db=database, user_id=user_id, post=post)
+
+
+async def _batch_items(request: Request):
+    """ Элементы пакета постов: тело - JSON-массив или NDJSON (Content-Type: application/x-ndjson).
+    Строку NDJSON, которая не разбирается как JSON, отдаём как исключение, чтобы ошибка попала в результат элемента """
+    if request.headers.get("content-type", "").startswith(NDJSON_MEDIA_TYPE):
+        async for line in iter_ndjson_lines(request.stream()):
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+        return
+
     try:
-        cu = dict(current_user)
-        user_id = cu["user_id"]
-        return await crud.push_post(db=database, user_id=user_id, post=post)
-    except Exception as E:
-        print(E)
+        items = json.loads(await request.body())
+    except ValueError:
+        raise UnicornException(code_status=400, content="Body must be a JSON array or NDJSON")
+    if not isinstance(items, list):
+        raise UnicornException(code_status=400, content="Body must be a JSON array or NDJSON")
+    for item in items:
+        yield item
+
+
+# Пакетная загрузка постов: JSON-массив или поток NDJSON из объектов PostsIn.
+# Тело сначала читается и проверяется целиком (его размер ограничен POSTS_BATCH_MAX), и только потом открывается
+# транзакция: она не держится, пока клиент медленно присылает тело. Посты вставляются пачками по POSTS_BATCH_CHUNK
+# в этой одной транзакции, в ответе - результат для каждого элемента.
+@user_posts_router.post("/batch")
+async def create_posts_batch(request: Request, current_user: schemas.User = Depends(get_current_user)):
+    uid = int(current_user["user_id"])
+    results = []
+    valid = []
+
+    index = -1
+    async for item in _batch_items(request):
+        index += 1
+        if index >= POSTS_BATCH_MAX:
+            raise UnicornException(code_status=413, content=f"No more than {POSTS_BATCH_MAX} posts per batch")
+        try:
+            if isinstance(item, Exception):
+                raise item
+            valid.append((index, schemas.PostsIn.parse_obj(item)))
+        except ValueError as e:
+            results.append({"index": index, "status": "error", "error": str(e)})
+
+    async with database.transaction():
+        for start in range(0, len(valid), POSTS_BATCH_CHUNK):
+            chunk = valid[start:start + POSTS_BATCH_CHUNK]
+            ids = await crud.push_posts(db=database, user_id=uid, posts_in=[post for _, post in chunk])
+            results.extend({"index": index, "status": "created", "id": post_id}
+                           for (index, _), post_id in zip(chunk, ids))
+    # Версия данных, кеш постов и раскладка по лентам - один раз и только после коммита
+    created_ids = [result["id"] for result in results if result["status"] == "created"]
+    if created_ids:
+        await crud.posts_changed(db=database, user_id=uid)
+        await crud.fan_out_posts(db=database, author_id=uid, post_ids=created_ids)
+
+    results.sort(key=lambda result: result["index"])
+    return {"created": len(created_ids), "failed": len(results) - len(created_ids), "results": results}
 
 
 # Сделаем частичный update, с помощью метода PATCH. По названию поста.
 @user_posts_router.patch("/patch_mine_post/{title}")
-async def update_mine_posts(cp: schemas.PostsUpdate,
+async def update_mine_posts(title: str, cp: schemas.PostsUpdate,
                             current_user: schemas.User = Depends(get_current_user)):
-    json_enc = jsonable_encoder(current_user)
-    uid = json_enc["user_id"]
-
-    posts_cu = await crud.get_post_cu(db=database, user_id=uid)
-    posts_cu = jsonable_encoder(posts_cu)
-    print(f"The type of posts_cu: {type(posts_cu)}")
-    cp = jsonable_encoder(cp)
-    title = cp['title']
-    for item in posts_cu:
-        if item['title'] == title and item['user_id'] == uid:
-            item[title] = cp["content"]
-        elif item["user_id"] != uid:
-            raise UnicornException(code_status=401, content="Not available!")
-        else:
-            continue
-    print(posts_cu)
-    await crud.update_mine_posts(db=database, update=posts_cu, user_id=int(uid))
+    uid = int(current_user["user_id"])
+    await crud.update_mine_posts(db=database, title=title, content=cp.content, user_id=uid)
     return {"Success": "!"}
 
 
+# Изменение поста по его id. Если в теле передана version, пост изменится только если его версия не поменялась,
+# иначе вернётся 409 - клиенту нужно перечитать пост.
+@user_posts_router.patch("/{post_id}", response_model=schemas.PostsOut)
+async def update_post(post_id: int, cp: schemas.PostsEdit, current_user: schemas.User = Depends(get_current_user)):
+    uid = int(current_user["user_id"])
+    try:
+        post = await crud.update_post(db=database, post_id=post_id, user_id=uid, update=cp)
+    except crud.PostVersionConflict:
+        raise UnicornException(code_status=409, content="Post was changed by someone else")
+    if post is None:
+        raise UnicornException(code_status=404, content="Post not found")
+    return post
+
+
 # Функция, которая возвращает результат join-а interests с users и даёт нам всю необходимую информацию о каждом юзере,
 # кроме того юзера, user_id которого мы передали.
-@app.get("/secret/auth/users/get_all_ui", response_model=List[schemas.User])
-async def get_users_interests(user_id: int):
-    return await crud.get_users(db=database, user_id=user_id)
-
-
-# Функция-зависимость. Возвращает такой json для юзера, который имеет схожие поля интересов.
-# Если по-простому, то выводит анкеты людей со схожими интересами.
-async def users_with_similar_interests(token: str = Depends(oauth2_scheme)):
-    current_user = await crud.get_user_by_token(db=database, token=token)
-    user_id = int(current_user["id"])
-
-    cu_interests = await crud.get_interest_by_ui(db=database, user_id=user_id)
-    cu_interest = set(cu_interests["interests"].split(", "))
-
-    interests_of_users = await get_users_interests(user_id=user_id)
-
-    # preprocessing data
-    support_dct = dict()
-    for item in interests_of_users:
-        support_dct[item["id"]] = item["interests"].split(", ")
-
-    # Выполняем небольшое преобразование
-    for key, value in support_dct.items():
-        for item in value:
-            if ' ' in item:
-                ind = item.index(' ')
-                result_item = item[ind + 1:]
-                value[1] = result_item
-                support_dct[key] = value
-
-    interests_dictionary = dict()
-    for item in interests_of_users:
-        for key, value in support_dct.items():
-            if key == int(item["id"]):
-                interests_dictionary[f"{item['name']}"] = set(value)
-
-    copy_of_dict = interests_dictionary.copy()
-    for key, value in copy_of_dict.items():
-        if len(cu_interest & value) >= 1:
-            continue
-        else:
-            interests_dictionary.pop(key, None)
-    return interests_dictionary
+# Постраничный вывод: limit строк с id > after, id для следующей страницы - в заголовке X-Next-After.
+# stream=true отдаёт всех пользователей после after в формате NDJSON, читая их из БД курсором.
+@app.get("/secret/auth/users/get_all_ui", response_model=List[schemas.UserBase])
+async def get_users_interests(user_id: int, response: Response, limit: int = 50, after: Optional[int] = None,
+                              stream: bool = False):
+    if stream:
+        return ndjson_response(crud.iterate_users(db=database, user_id=user_id, after=after), user_base_encoder())
+    check_page_limit(limit)
+    users = await crud.get_users(db=database, user_id=user_id, limit=limit, after=after)
+    set_next_after(response, users, limit)
+    if FAST_JSON:
+        return fast_json_response(response, users, schemas.user_base_serializer)
+    return users
+
+
+# Функция-зависимость. Возвращает анкеты людей со схожими интересами, отсортированные по похожести.
+# mode - способ оценки (jaccard, overlap, cosine), limit и cursor - постраничный вывод.
+# Для mode по умолчанию ответ читается из предрасчитанной таблицы user_matches (см. project.recommendations),
+# computed_at и stale_seconds показывают, насколько данные устарели. Другие режимы считаются на лету.
+# approximate=true берёт кандидатов из LSH-индекса (если он включён через LSH_ENABLED).
+@instrumentation.timed_dependency()
+async def users_with_similar_interests(limit: int = 20, cursor: Optional[str] = None, mode: str = MATCHES_MODE,
+                                       approximate: bool = False,
+                                       current_user: schemas.User = Depends(get_current_user)):
+    user_id = int(current_user["user_id"])
+    check_page_limit(limit)
+    if approximate and not LSH_ENABLED:
+        raise UnicornException(code_status=400, content="Approximate matching is disabled")
+    try:
+        after = parse_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise UnicornException(code_status=400, content=str(e))
+
+    computed_at = None
+    page = []
+    if mode == MATCHES_MODE and not approximate:
+        rows = await crud.get_user_matches(db=database, user_id=user_id, limit=limit + 1, after=after)
+        if rows:
+            computed_at = rows[0]["computed_at"]
+            page = [(row["match_id"], row["score"]) for row in rows]
+
+    # Если матчи ещё не посчитаны (или страницы за пределами MATCHES_TOP_N) - считаем на лету
+    if computed_at is None:
+        candidates = lsh_index.candidates(user_id) if approximate else None
+        try:
+            page, _ = interest_index.top_k(user_id, limit=limit + 1, mode=mode, cursor=cursor, candidates=candidates)
+        except ValueError as e:
+            raise UnicornException(code_status=400, content=str(e))
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = make_cursor(-page[-1][1], page[-1][0])
+
+    return {
+        "users": [
+            {"id": uid, "name": interest_index.names.get(uid), "interests": vocabulary.to_terms(interest_index.terms(uid)),
+             "score": score}
+            for uid, score in page
+        ],
+        "next_cursor": next_cursor,
+        "computed_at": computed_at,
+        "stale_seconds": (datetime.now() - computed_at).total_seconds() if computed_at else 0.0,
+        "pending": matches_worker.is_pending(user_id),
+    }
 
 
 # Этот роут работает на зависимости get_current_user, работа которого описана выше.
+# Этот и два следующих роута отвечают ETag и 304 на If-None-Match (см. user_data_etag).
 @app.get("/api/user/auth/my_page")
-async def read_users_me(current_user: schemas.User = Depends(get_current_user)):
+async def read_users_me(etag: str = Depends(user_data_etag), current_user: schemas.User = Depends(get_current_user)):
     return current_user
 
 
 # Функция использует функцию-зависимость для того, чтобы вернуть все посты/записи пользователю.
 @app.get("/api/user/auth/my_page/posts/", response_model_exclude_unset=True)
-async def read_users_my_posts(posts: schemas.PostsBase = Depends(get_me_posts)):
+async def read_users_my_posts(etag: str = Depends(user_data_etag), posts: schemas.PostsBase = Depends(get_me_posts)):
     return posts
 
 
 # Этот роут работает на зависимсоти users_with_similar_interests, работа которого описана выше
 @app.get("/api/user/auth/get_me_users")
-async def get_users_with_my_interests(users: schemas.User = Depends(users_with_similar_interests)):
+async def get_users_with_my_interests(users: dict = Depends(users_with_similar_interests)):
     return users
 
 
-async def get_all_users(tokens: str = Depends(oauth2_scheme)):
-    return await crud.get_all_users(db=database)
+# Домашняя лента: посты пользователей с общими интересами от новых к старым,
+# before - курсор из заголовка X-Next-Before предыдущей страницы.
+@app.get("/api/user/auth/timeline", response_model=List[schemas.PostsOut])
+async def get_my_timeline(response: Response, limit: int = 20, before: Optional[str] = None,
+                          current_user: schemas.User = Depends(get_current_user)):
+    user_id = dict(current_user)["user_id"]
+    check_page_limit(limit)
+    posts = await crud.get_timeline(db=database, user_id=user_id, limit=limit, before=parse_before(before))
+    set_next_before(response, posts, limit)
+    return posts
+
+
+async def get_all_users(response: Response, limit: int = 50, after: Optional[int] = None, stream: bool = False,
+                        tokens: str = Depends(oauth2_scheme)):
+    if stream:
+        return ndjson_response(crud.iterate_all_users(db=database, after=after), user_base_encoder())
+    check_page_limit(limit)
+    users = await crud.get_all_users(db=database, limit=limit, after=after)
+    set_next_after(response, users, limit)
+    if FAST_JSON:
+        return fast_json_response(response, users, schemas.user_base_serializer)
+    return users
 
 
+# Постраничный вывод и stream=true работают так же, как в /secret/auth/users/get_all_ui
 @app.get("/api/user/auth/get_all_users", response_model=List[schemas.UserBase])
 async def get_me_all_users(users: schemas.User = Depends(get_all_users)):
     return users
 
 
-async def get_admin(token: str = Depends(oauth2_scheme)):
-    user = await crud.get_user_by_token(db=database, token=token)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    if not user["is_active"]:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user"
-        )
+@instrumentation.timed_dependency()
+async def get_admin(user: schemas.User = Depends(get_current_user)):
     if not user["is_superuser"]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="U are super, but.. u are not a superuser :("
@@ -292,9 +560,77 @@ async def get_admin(token: str = Depends(oauth2_scheme)):
 
 
 @admin_router.get("/all_users", response_model=List[schemas.FullUser], response_model_exclude_unset=True)
-async def get_me_all_full_users(admin: schemas.FullUser = Depends(get_admin)):
-    ai = int(jsonable_encoder(admin)["id"])
-    return await crud.get_admin_all_users(db=database, admin_id=ai)
+async def get_me_all_full_users(response: Response, admin: schemas.FullUser = Depends(get_admin)):
+    ai = int(admin["user_id"])
+    users = await crud.get_admin_all_users(db=database, admin_id=ai)
+    if FAST_JSON:
+        return fast_json_response(response, users, schemas.full_user_serializer)
+    return users
+
+
+# Потоковая выгрузка всех пользователей для администратора: format=ndjson или format=csv.
+# copy=true (только для csv) формирует CSV на стороне Postgres через COPY ... TO STDOUT.
+@admin_router.get("/export")
+async def export_all_users(export_format: str = Query("ndjson", alias="format"), copy: bool = False,
+                           admin: schemas.FullUser = Depends(get_admin)):
+    ai = int(admin["user_id"])
+    if copy:
+        if export_format != "csv":
+            raise UnicornException(code_status=400, content="COPY export supports only format=csv")
+        return bytes_response(crud.copy_all_users_for_admin(db=database, admin_id=ai),
+                              media_type=CSV_MEDIA_TYPE, filename="users.csv")
+    rows = crud.iterate_all_users_for_admin(db=database, user_id=ai)
+    if export_format == "csv":
+        return csv_response(rows, header=crud.ADMIN_CSV_HEADER, filename="users.csv")
+    if export_format == "ndjson":
+        return ndjson_response(rows, lambda row: encode_json(crud.reshape_admin_row(row)))
+    raise UnicornException(code_status=400, content=f"Unknown export format: {export_format}")
+
+
+# Активация/деактивация пользователя администратором
+@admin_router.patch("/users/{user_id}/active")
+async def set_user_active(user_id: int, is_active: bool, admin: schemas.FullUser = Depends(get_admin)):
+    await crud.set_user_active(db=database, user_id=user_id, is_active=is_active)
+    return success_page.success_letter(letter="Success!")
+
+
+# Метрики пула хеширования паролей: глубина очереди и задержка
+@admin_router.get("/metrics/hashing")
+async def get_hashing_metrics(admin: schemas.FullUser = Depends(get_admin)):
+    return hashing_executor.metrics()
+
+
+# Метрики пулов соединений с БД: размер, занятые соединения, насыщение
+@admin_router.get("/metrics/db")
+async def get_db_metrics(admin: schemas.FullUser = Depends(get_admin)):
+    return db.pool_metrics()
+
+
+def _runtime_metrics():
+    """ Состояние пула хеширования, кешей токенов и постов и пулов соединений на момент запроса /metrics """
+    hashing = hashing_executor.metrics()
+    for key in ("in_flight", "queue_depth", "rejected", "completed", "latency_avg", "latency_max"):
+        yield f"hashing_{key}", f"Password hashing pool {key}", {}, hashing[key]
+    cache = token_cache.stats()
+    for key in ("size", "hits", "misses"):
+        yield f"token_cache_{key}", f"Token cache {key}", {}, cache[key]
+    cache = posts_cache.stats()
+    for key in ("size", "hits", "misses"):
+        yield f"posts_cache_{key}", f"Posts first page cache {key}", {}, cache[key]
+    for pool, metrics in db.pool_metrics().items():
+        if metrics and metrics["connected"]:
+            for key in ("size", "idle", "in_use", "max_size", "saturation"):
+                yield f"db_pool_{key}", f"Database connection pool {key}", {"pool": pool}, metrics[key]
+
+
+instrumentation.registry.add_collector(_runtime_metrics)
+
+
+# Метрики в формате Prometheus: задержки роутов, зависимостей и запросов к БД, пулы и кеши
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(instrumentation.registry.render(), media_type="text/plain; version=0.0.4")
+
 
 # Добавляем в скоуп приложения роут router
 app.include_router(user_router)
@@ -308,13 +644,23 @@ app.include_router(admin_router)
 @app.on_event("startup")
 async def startup():
     """ когда приложение запускается устанавливаем соединение с БД """
-    await database.connect()
+    await db.connect()
+    hashing_executor.start()
+    await crud.load_interest_index(db=database)
+    await crud.load_fanout_on_read_authors(db=database)
+    if MATCHES_WORKER_ENABLED:
+        matches_worker.start(db=database)
+    if ACCOUNT_SOFT_DELETE:
+        account_purger.start(db=database)
 
 
 @app.on_event("shutdown")
 async def shutdown():
     """ когда приложение останавливается разрываем соединение с БД """
-    await database.disconnect()
+    await matches_worker.stop()
+    await account_purger.stop()
+    await db.disconnect()
+    hashing_executor.shutdown()
 
 
 @app.get("/check")
@@ -0,0 +1,163 @@
+""" Поиск пользователей со схожими интересами по инвертированному индексу id интереса -> пользователи """
+import heapq
+import math
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+# Способы оценки похожести: коэффициент Жаккара, число общих интересов, косинус с весами IDF
+SCORING_MODES = ("jaccard", "overlap", "cosine")
+# Максимальная длина одного интереса - размер колонки interest_terms.term
+MAX_TERM_LENGTH = 100
+
+
+def split_interests(stroke: str) -> List[str]:
+    """ Разбивает строку интересов вида "music, books" на нормализованные термины """
+    terms = []
+    for item in stroke.split(","):
+        term = item.strip().lower()
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+class InterestIndex:
+    """ Инвертированный индекс: для каждого id интереса (interest_terms.id) хранит множество user_id """
+
+    def __init__(self):
+        self.postings: Dict[int, Set[int]] = {}
+        self.terms_by_user: Dict[int, FrozenSet[int]] = {}
+        self.names: Dict[int, str] = {}
+
+    def __len__(self):
+        return len(self.terms_by_user)
+
+    def clear(self):
+        self.postings.clear()
+        self.terms_by_user.clear()
+        self.names.clear()
+
+    def set_user(self, user_id: int, terms: Iterable[int], name: Optional[str] = None):
+        """ Добавляет пользователя или заменяет его интересы """
+        new_terms = frozenset(terms)
+        old_terms = self.terms_by_user.get(user_id, frozenset())
+        for term in old_terms - new_terms:
+            self._discard(term, user_id)
+        for term in new_terms - old_terms:
+            self.postings.setdefault(term, set()).add(user_id)
+        self.terms_by_user[user_id] = new_terms
+        if name is not None:
+            self.names[user_id] = name
+
+    def remove_user(self, user_id: int):
+        for term in self.terms_by_user.pop(user_id, frozenset()):
+            self._discard(term, user_id)
+        self.names.pop(user_id, None)
+
+    def terms(self, user_id: int) -> FrozenSet[int]:
+        return self.terms_by_user.get(user_id, frozenset())
+
+    def candidates(self, user_id: int) -> Set[int]:
+        """ Пользователи, у которых есть хотя бы один общий интерес с user_id """
+        result: Set[int] = set()
+        for term in self.terms(user_id):
+            result |= self.postings[term]
+        result.discard(user_id)
+        return result
+
+    def idf(self, term: int) -> float:
+        """ Вес интереса: чем реже он встречается, тем больше вес """
+        df = len(self.postings.get(term, ())) or 1
+        return math.log(1 + len(self.terms_by_user) / df)
+
+    def scores(self, user_id: int, mode: str = "jaccard", candidates: Optional[Iterable[int]] = None) -> Dict[int, float]:
+        """ Оценки похожести user_id с кандидатами. По умолчанию кандидаты - все пользователи с общими интересами """
+        if mode not in SCORING_MODES:
+            raise ValueError(f"Unknown scoring mode: {mode}")
+        terms = self.terms(user_id)
+        shared: Dict[int, float] = {}
+        if candidates is None:
+            for term in terms:
+                weight = self.idf(term) ** 2 if mode == "cosine" else 1.0
+                for uid in self.postings[term]:
+                    shared[uid] = shared.get(uid, 0.0) + weight
+        else:
+            for uid in candidates:
+                common = terms & self.terms(uid)
+                if common:
+                    shared[uid] = sum(self.idf(t) ** 2 for t in common) if mode == "cosine" else float(len(common))
+        shared.pop(user_id, None)
+
+        if mode == "overlap":
+            return shared
+        if mode == "jaccard":
+            return {uid: common / (len(terms) + len(self.terms_by_user[uid]) - common)
+                    for uid, common in shared.items()}
+        norm = math.sqrt(sum(self.idf(term) ** 2 for term in terms))
+        return {uid: common / (norm * math.sqrt(sum(self.idf(t) ** 2 for t in self.terms_by_user[uid])))
+                for uid, common in shared.items()}
+
+    def top_k(self, user_id: int, limit: int, mode: str = "jaccard", cursor: Optional[str] = None,
+              candidates: Optional[Iterable[int]] = None) -> Tuple[List[Tuple[int, float]], Optional[str]]:
+        """ Лучшие limit кандидатов, упорядоченные по (-score, user_id), и курсор следующей страницы """
+        after = parse_cursor(cursor) if cursor else None
+        keys = ((-score, uid) for uid, score in self.scores(user_id, mode, candidates).items())
+        if after is not None:
+            keys = (key for key in keys if key > after)
+        page = heapq.nsmallest(limit + 1, keys)
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = make_cursor(*page[-1])
+        return [(uid, -neg_score) for neg_score, uid in page], next_cursor
+
+    def snapshot(self, user_id: int, mode: str = "jaccard") -> "IndexSnapshot":
+        """ Копия той части индекса, от которой зависят оценки user_id: его интересы, их пользователи
+        с интересами каждого и (для cosine) частоты всех этих интересов """
+        postings = {term: frozenset(self.postings[term]) for term in self.terms(user_id)}
+        terms_by_user = {user_id: self.terms(user_id)}
+        for users in postings.values():
+            for uid in users:
+                terms_by_user[uid] = self.terms_by_user[uid]
+        df = {}
+        if mode == "cosine":
+            df = {term: len(self.postings[term]) for terms in terms_by_user.values() for term in terms}
+        return IndexSnapshot(postings, terms_by_user, df, len(self.terms_by_user))
+
+    def _discard(self, term: int, user_id: int):
+        users = self.postings.get(term)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self.postings[term]
+
+
+class IndexSnapshot(InterestIndex):
+    """ Неизменяемый снимок из InterestIndex.snapshot: его можно читать из другого потока, пока индекс меняется
+    в event loop-е. IDF считается по частотам и числу пользователей на момент снимка """
+
+    def __init__(self, postings: Dict[int, FrozenSet[int]], terms_by_user: Dict[int, FrozenSet[int]],
+                 df: Dict[int, int], total: int):
+        super().__init__()
+        self.postings = postings
+        self.terms_by_user = terms_by_user
+        self.df = df
+        self.total = total
+
+    def idf(self, term: int) -> float:
+        return math.log(1 + self.total / (self.df.get(term) or 1))
+
+
+def make_cursor(neg_score: float, user_id: int) -> str:
+    return f"{-neg_score!r}:{user_id}"
+
+
+def parse_cursor(cursor: str) -> Tuple[float, int]:
+    """ Курсор вида "score:user_id" превращает в ключ сортировки (-score, user_id) """
+    try:
+        score, user_id = cursor.split(":")
+        return -float(score), int(user_id)
+    except ValueError:
+        raise ValueError(f"Bad cursor: {cursor}")
+
+
+interest_index = InterestIndex()
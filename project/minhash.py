@@ -0,0 +1,91 @@
+""" Приближённый поиск похожих пользователей: MinHash-сигнатуры интересов и LSH-корзины.
+
+Сигнатура из bands * rows минимальных хешей; два пользователя становятся кандидатами, если хотя бы в одной
+полосе (band) совпали все rows значений. Больше полос - выше полнота и больше кандидатов,
+больше строк в полосе - меньше кандидатов и ниже полнота.
+"""
+import random
+import struct
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from project.config import LSH_BANDS, LSH_ROWS
+
+# Простое число Мерсенна 2^61 - 1 для универсального хеширования (a * x + b) mod p
+_PRIME = (1 << 61) - 1
+_EMPTY = _PRIME
+
+
+class MinHasher:
+
+    def __init__(self, num_perm: int, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+    def signature(self, term_ids: Iterable[int]) -> Tuple[int, ...]:
+        term_ids = list(term_ids)
+        if not term_ids:
+            return (_EMPTY,) * self.num_perm
+        return tuple(min((a * term + b) % _PRIME for term in term_ids) for a, b in self._params)
+
+    def to_bytes(self, signature: Tuple[int, ...]) -> bytes:
+        return struct.pack(f"<{len(signature)}Q", *signature)
+
+    def from_bytes(self, data: bytes) -> Optional[Tuple[int, ...]]:
+        """ Сигнатура из БД. None, если она посчитана с другим числом перестановок """
+        if len(data) != 8 * self.num_perm:
+            return None
+        return struct.unpack(f"<{self.num_perm}Q", data)
+
+
+class LSHIndex:
+    """ LSH-индекс по MinHash-сигнатурам пользователей """
+
+    def __init__(self, bands: int, rows: int, seed: int = 1):
+        self.bands = bands
+        self.rows = rows
+        self.hasher = MinHasher(bands * rows, seed=seed)
+        self.signatures: Dict[int, Tuple[int, ...]] = {}
+        self._buckets: List[Dict[int, Set[int]]] = [{} for _ in range(bands)]
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def clear(self):
+        self.signatures.clear()
+        self._buckets = [{} for _ in range(self.bands)]
+
+    def set_user(self, user_id: int, signature: Tuple[int, ...]):
+        self.remove_user(user_id)
+        self.signatures[user_id] = signature
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(key, set()).add(user_id)
+
+    def remove_user(self, user_id: int):
+        signature = self.signatures.pop(user_id, None)
+        if signature is None:
+            return
+        for band, key in enumerate(self._band_keys(signature)):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(user_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def candidates(self, user_id: int) -> Set[int]:
+        """ Пользователи, попавшие хотя бы в одну общую корзину с user_id """
+        signature = self.signatures.get(user_id)
+        if signature is None:
+            return set()
+        result: Set[int] = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            result |= self._buckets[band].get(key, set())
+        result.discard(user_id)
+        return result
+
+    def _band_keys(self, signature: Tuple[int, ...]):
+        rows = self.rows
+        return [hash(signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+
+lsh_index = LSHIndex(bands=LSH_BANDS, rows=LSH_ROWS)
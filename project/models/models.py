@@ -9,7 +9,7 @@ users_table = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column("email", sqlalchemy.String(), unique=True, index=True),
-    sqlalchemy.Column("name", sqlalchemy.String(100)),
+    sqlalchemy.Column("name", sqlalchemy.String(100), index=True),
     sqlalchemy.Column("hashed_password", sqlalchemy.String()),
     sqlalchemy.Column(
         "is_active",
@@ -18,6 +18,21 @@ users_table = sqlalchemy.Table(
         nullable=False,
     ),
     sqlalchemy.Column("is_superuser", sqlalchemy.Boolean(), nullable=False),
+    # У автора слишком много читателей: его посты не раскладываются по лентам, а подмешиваются при чтении
+    sqlalchemy.Column(
+        "fanout_on_read",
+        sqlalchemy.Boolean(),
+        server_default=sqlalchemy.sql.expression.false(),
+        nullable=False,
+    ),
+    # Аккаунт удалён, но его посты ещё не вычищены фоновой задачей (project.purge)
+    sqlalchemy.Column("deleted_at", sqlalchemy.DateTime(), nullable=True),
+    # Версия данных пользователя (профиль, интересы, посты): растёт при каждой записи, из неё строится ETag
+    sqlalchemy.Column("data_version", sqlalchemy.BigInteger(), server_default="1", nullable=False),
+)
+
+sqlalchemy.Index(
+    "ix_users_deleted_at", users_table.c.deleted_at, postgresql_where=users_table.c.deleted_at.isnot(None)
 )
 
 
@@ -34,7 +49,7 @@ tokens_table = sqlalchemy.Table(
         index=True,
     ),
     sqlalchemy.Column("expires", sqlalchemy.DateTime()),
-    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id")),
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id", ondelete="CASCADE")),
 )
 
 
@@ -1,4 +1,5 @@
 import sqlalchemy
+from sqlalchemy.dialects import postgresql
 
 from project.models.models import users_table
 
@@ -10,8 +11,42 @@ posts_table = sqlalchemy.Table(
     "posts",
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
-    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey(users_table.c.id)),
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey(users_table.c.id, ondelete="CASCADE")),
     sqlalchemy.Column("created_at", sqlalchemy.DateTime()),
     sqlalchemy.Column("title", sqlalchemy.String(100)),
     sqlalchemy.Column("content", sqlalchemy.Text()),
-)
\ No newline at end of file
+    # Время последнего изменения и номер версии поста для оптимистичной блокировки при редактировании
+    sqlalchemy.Column("updated_at", sqlalchemy.DateTime()),
+    sqlalchemy.Column("version", sqlalchemy.Integer, nullable=False, server_default="1"),
+)
+
+
+# Лента постов пользователя: WHERE user_id = ... ORDER BY created_at DESC, id DESC
+# Колонка search_vector (tsvector заголовка и текста) и её GIN-индекс есть только в Postgres: их создаёт миграция,
+# заполняет триггер, а в модели колонки нет, чтобы она не попадала в SELECT постов
+posts_search_vector = sqlalchemy.literal_column("posts.search_vector", type_=postgresql.TSVECTOR)
+
+sqlalchemy.Index(
+    "ix_posts_user_id_created_at", posts_table.c.user_id, posts_table.c.created_at.desc(), posts_table.c.id.desc()
+)
+
+
+# Домашняя лента: посты авторов со схожими интересами, разложенные по лентам читателей при публикации
+timelines_table = sqlalchemy.Table(
+    "timelines",
+    metadata,
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey(users_table.c.id, ondelete="CASCADE"), primary_key=True),
+    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey(posts_table.c.id, ondelete="CASCADE"), primary_key=True),
+    sqlalchemy.Column("author_id", sqlalchemy.ForeignKey(users_table.c.id, ondelete="CASCADE"), nullable=False),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime(), nullable=False),
+)
+
+sqlalchemy.Index(
+    "ix_timelines_user_id_created_at",
+    timelines_table.c.user_id, timelines_table.c.created_at.desc(), timelines_table.c.post_id.desc()
+)
+# Удаление поста каскадом удаляет его из лент: без индекса каждый удалённый пост - полный проход по timelines
+sqlalchemy.Index("ix_timelines_post_id", timelines_table.c.post_id)
+
+# Записи лент по автору удаляются вместе с ним (каскад и мягкое удаление)
+sqlalchemy.Index("ix_timelines_author_id", timelines_table.c.author_id)
@@ -0,0 +1,85 @@
+""" Полнотекстовый поиск по постам в памяти процесса, без базы. Приложение ищет через posts.search_vector
+и GIN-индекс (crud.search_posts), а этот индекс повторяет то же ранжирование ts_rank с конфигурацией simple:
+слово из заголовка весит 1.0, из текста - 0.4. Запрос - все слова сразу (И), без фраз и отрицаний """
+import heapq
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TITLE_WEIGHT = 1.0
+CONTENT_WEIGHT = 0.4
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """ Слова текста в нижнем регистре, как их разбивает конфигурация simple в Postgres """
+    return _WORD.findall(text.lower()) if text else []
+
+
+class PostsSearchIndex:
+
+    def __init__(self):
+        # слово -> {id поста: вес слова в посте}
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self.words_by_post: Dict[int, set] = {}
+        self.posts: Dict[int, dict] = {}
+
+    def __len__(self):
+        return len(self.posts)
+
+    def clear(self):
+        self.postings.clear()
+        self.words_by_post.clear()
+        self.posts.clear()
+
+    def add(self, post):
+        """ Добавляет или переиндексирует пост (строку таблицы posts) """
+        post = dict(post)
+        post_id = post["id"]
+        self.remove(post_id)
+        weights: Dict[str, float] = defaultdict(float)
+        for word in tokenize(post.get("title")):
+            weights[word] += TITLE_WEIGHT
+        for word in tokenize(post.get("content")):
+            weights[word] += CONTENT_WEIGHT
+        for word, weight in weights.items():
+            self.postings[word][post_id] = weight
+        self.words_by_post[post_id] = set(weights)
+        self.posts[post_id] = post
+
+    def load(self, rows: Iterable):
+        self.clear()
+        for row in rows:
+            self.add(row)
+
+    def remove(self, post_id: int):
+        for word in self.words_by_post.pop(post_id, ()):
+            self.postings[word].pop(post_id, None)
+            if not self.postings[word]:
+                del self.postings[word]
+        self.posts.pop(post_id, None)
+
+    def remove_user(self, user_id: int):
+        for post_id in [post_id for post_id, post in self.posts.items() if post["user_id"] == user_id]:
+            self.remove(post_id)
+
+    def search(self, text: str, limit: int, after: Optional[Tuple[float, int]] = None,
+               max_candidates: Optional[int] = None) -> List[dict]:
+        """ Посты со всеми словами запроса по убыванию ранга. Ранжируются только max_candidates постов
+        с наибольшими id. after - ключ (-rank, id) последнего поста предыдущей страницы.
+        Возвращает строки постов с полем rank """
+        words = set(tokenize(text))
+        if not words:
+            return []
+        postings = sorted((self.postings.get(word, {}) for word in words), key=len)
+        found = [post_id for post_id in postings[0] if all(post_id in other for other in postings[1:])]
+        if max_candidates is not None and len(found) > max_candidates:
+            found = heapq.nlargest(max_candidates, found)
+        keys = []
+        for post_id in found:
+            key = (-sum(other[post_id] for other in postings), post_id)
+            if after is None or key > after:
+                keys.append(key)
+        return [dict(self.posts[post_id], rank=-neg_rank) for neg_rank, post_id in heapq.nsmallest(limit, keys)]
+
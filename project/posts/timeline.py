@@ -0,0 +1,20 @@
+""" Домашняя лента: fan-out при публикации для обычных авторов и подмешивание при чтении для авторов с большим
+числом читателей (их id хранятся в users.fanout_on_read и кешируются здесь) """
+import heapq
+from typing import Iterable, List, Set
+
+# Авторы, чьи посты не раскладываются по лентам. Загружается при старте приложения
+fanout_on_read_authors: Set[int] = set()
+
+
+def merge_feeds(feeds: Iterable[list], limit: int) -> List:
+    """ Сливает несколько лент (каждая отсортирована от новых к старым) в одну страницу без повторов """
+    merged = heapq.merge(*feeds, key=lambda post: (post["created_at"], post["id"]), reverse=True)
+    page, seen = [], set()
+    for post in merged:
+        if post["id"] not in seen:
+            seen.add(post["id"])
+            page.append(post)
+            if len(page) == limit:
+                break
+    return page
@@ -0,0 +1,98 @@
+""" Профилирование запросов к БД: какая функция выполнила запрос, журнал медленных запросов с выборочным
+EXPLAIN ANALYZE и поиск N+1 - одинаковых запросов, повторяющихся в рамках одного HTTP-запроса (только в DEBUG).
+Используется из instrumentation.InstrumentedDatabase """
+import logging
+import random
+import sys
+from typing import Optional
+
+from databases.core import Connection
+
+from project import request_context
+from project.config import DEBUG, DB_SLOW_QUERY_MS, DB_EXPLAIN_SAMPLE_RATE, DB_N_PLUS_ONE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# Ключ в контексте запроса: число запросов к БД и повторы одинаковых запросов
+_REQUEST_QUERIES = ("db_queries",)
+
+# Не больше стольких символов SQL в журнале
+SQL_LOG_LIMIT = 2000
+
+
+def query_caller(depth: int = 2) -> str:
+    """ Функция, которая вызвала метод Database: "crud.get_users". depth считается от вызывающего query_caller.
+    Берётся кадр в момент вызова метода, а не при await - поэтому и crud-функции, которые возвращают
+    корутину db.fetch_all(...) без await, определяются правильно """
+    frame = sys._getframe(depth)
+    return f"{frame.f_globals.get('__name__', '?').rsplit('.', 1)[-1]}.{frame.f_code.co_name}"
+
+
+def query_sql(query) -> str:
+    return " ".join(str(query).split())[:SQL_LOG_LIMIT]
+
+
+def is_select(query) -> bool:
+    """ EXPLAIN ANALYZE выполняет запрос ещё раз, поэтому он допустим только для чтения """
+    if getattr(query, "__visit_name__", None) == "select":
+        return True
+    text = getattr(query, "text", query)
+    return isinstance(text, str) and text.lstrip().upper().startswith("SELECT")
+
+
+def request_queries() -> Optional[dict]:
+    """ Счётчики запросов к БД текущего HTTP-запроса, None вне запроса """
+    stats = request_context.memo_get(_REQUEST_QUERIES, None)
+    if stats is None:
+        stats = {"count": 0, "shapes": {}}
+        request_context.memo_set(_REQUEST_QUERIES, stats)
+        if request_context.memo_get(_REQUEST_QUERIES, None) is None:
+            return None
+    return stats
+
+
+def request_query_count() -> int:
+    stats = request_context.memo_get(_REQUEST_QUERIES, None)
+    return stats["count"] if stats is not None else 0
+
+
+def track_request_query(caller: str, query):
+    """ Считает запрос в рамках HTTP-запроса. В DEBUG предупреждает, если один и тот же запрос
+    (тот же SQL из той же функции) повторился больше DB_N_PLUS_ONE_THRESHOLD раз """
+    stats = request_queries()
+    if stats is None:
+        return
+    stats["count"] += 1
+    if not DEBUG:
+        return
+    shape = (caller, str(query))
+    repeats = stats["shapes"][shape] = stats["shapes"].get(shape, 0) + 1
+    if repeats == DB_N_PLUS_ONE_THRESHOLD + 1:
+        logger.warning("Possible N+1: %s issued the same query more than %d times in one request: %s",
+                       caller, DB_N_PLUS_ONE_THRESHOLD, query_sql(query))
+
+
+def is_slow(seconds: float) -> bool:
+    return seconds * 1000 >= DB_SLOW_QUERY_MS
+
+
+def log_slow_query(caller: str, operation: str, query, seconds: float, rows: Optional[int]):
+    logger.warning("Slow query: %.1f ms in %s (%s, rows=%s): %s",
+                   seconds * 1000, caller, operation, rows, query_sql(query))
+
+
+def should_explain(query) -> bool:
+    return DB_EXPLAIN_SAMPLE_RATE > 0 and random.random() < DB_EXPLAIN_SAMPLE_RATE and is_select(query)
+
+
+async def log_explain(db, caller: str, query, values: Optional[dict]):
+    """ Выполняет EXPLAIN ANALYZE запроса на соединении текущей задачи и пишет план в журнал """
+    try:
+        async with db.connection() as connection:
+            built = Connection._build_query(query, values)
+            sql, args, _ = connection._connection._compile(built)
+            rows = await connection.raw_connection.fetch("EXPLAIN ANALYZE " + sql, *args)
+    except Exception:
+        logger.exception("EXPLAIN ANALYZE failed for a slow query in %s", caller)
+        return
+    logger.warning("EXPLAIN ANALYZE for a slow query in %s:\n%s", caller, "\n".join(row[0] for row in rows))
@@ -0,0 +1,245 @@
+""" Массовое создание пользователей (с интересами, токенами и постами) для стендов и нагрузочных тестов.
+
+Вход - CSV с колонками email,name,password,interests[,posts] или NDJSON с такими же полями; posts - список
+объектов {"title": ..., "content": ...} (в CSV - JSON-строка). Пароли хешируются в пуле процессов, данные
+загружаются пачками через COPY (или обычными INSERT с --insert), каждая пачка - в своей транзакции.
+После каждой пачки в файл-чекпоинт записывается число обработанных строк: повторный запуск продолжает с них,
+а email, которые уже есть в базе, пропускаются.
+
+    python -m project.provision users.ndjson
+    python -m project.provision users.csv --batch-size 5000 --workers 8
+    python -m project.provision users.csv --reuse-hash    # один хеш на каждый разный пароль, только для стендов
+
+Работающее приложение узнает о новых пользователях после перезапуска (индекс интересов строится при старте),
+матчи считаются отдельно: python -m project.recommendations
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+from databases import Database
+
+from project import crud
+from project.config import SQLALCHEMY_DATABASE_URL
+from project.interests.interests_model import interests_table, interest_terms_table, user_interests_table
+from project.interests.vocabulary import vocabulary
+from project.matching import MAX_TERM_LENGTH, split_interests
+from project.models.models import users_table as users, tokens_table as tokens
+from project.posts.posts import posts_table as posts
+
+# Не больше стольких строк в одном INSERT в режиме --insert
+INSERT_CHUNK = 1000
+
+
+def salted_hash(password: str) -> str:
+    """ Хеш пароля в формате, который ожидает crud.validate_password """
+    salt = crud.get_random_string()
+    return f"{salt}${crud.hash_password(password, salt)}"
+
+
+def read_records(path: str, fmt: str) -> Iterator[dict]:
+    """ Строки входного файла как словари """
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            for record in csv.DictReader(f):
+                if record.get("posts"):
+                    record["posts"] = json.loads(record["posts"])
+                yield record
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_checkpoint(path: str) -> int:
+    try:
+        with open(path) as f:
+            return json.load(f)["done"]
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path: str, done: int):
+    """ Атомарно записывает число обработанных строк входа """
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"done": done}, f)
+    os.replace(tmp, path)
+
+
+class Provisioner:
+
+    def __init__(self, db: Database, pool: ProcessPoolExecutor, workers: int, use_copy: bool = True,
+                 reuse_hash: bool = False):
+        self.db = db
+        self.pool = pool
+        self.workers = workers
+        self.use_copy = use_copy
+        self.reuse_hash = reuse_hash
+        self._hashes: Dict[str, str] = {}
+        self.users = 0
+        self.posts = 0
+        self.skipped = 0
+
+    async def _hash(self, passwords: List[str]) -> List[str]:
+        """ Делит пароли между всеми процессами пула: одна задача на процесс, а не на пароль """
+        loop = asyncio.get_running_loop()
+        size = -(-len(passwords) // self.workers)
+        parts = await asyncio.gather(*[
+            loop.run_in_executor(self.pool, _hash_all, passwords[start:start + size])
+            for start in range(0, len(passwords), size or 1)
+        ])
+        return [hashed for part in parts for hashed in part]
+
+    async def hash_passwords(self, passwords: List[str]) -> List[str]:
+        if not self.reuse_hash:
+            return await self._hash(passwords)
+        missing = sorted(set(passwords) - set(self._hashes))
+        if missing:
+            self._hashes.update(zip(missing, await self._hash(missing)))
+        return [self._hashes[password] for password in passwords]
+
+    async def load_batch(self, records: List[dict]):
+        """ Загружает пачку строк входа в одной транзакции. Уже существующие email пропускаются """
+        unique = {}
+        for record in records:
+            unique.setdefault(record["email"], record)
+        existing = await self.db.fetch_all(users.select().with_only_columns([users.c.email]).
+                                           where(users.c.email.in_(list(unique))))
+        for row in existing:
+            del unique[row["email"]]
+        self.skipped += len(records) - len(unique)
+        records = list(unique.values())
+        if not records:
+            return
+
+        hashed = await self.hash_passwords([record["password"] for record in records])
+        # Слишком длинные интересы не помещаются в словарь - пропускаем их
+        interests = [", ".join(term for term in split_interests(record.get("interests") or "")
+                               if len(term) <= MAX_TERM_LENGTH) for record in records]
+        # Новые термины попадают в словарь (и в кеш vocabulary) до транзакции пачки
+        await crud.intern_terms(db=self.db, terms=sorted({
+            term for stroke in interests for term in split_interests(stroke)
+        }))
+        expires = datetime.now() + timedelta(weeks=2)
+
+        async with self.db.connection() as connection:
+            async with connection.transaction():
+                if self.use_copy:
+                    raw = connection.raw_connection
+                    rows = await raw.fetch("SELECT nextval('users_id_seq') FROM generate_series(1, $1)", len(records))
+                    user_ids = [row[0] for row in rows]
+                    await raw.copy_records_to_table("users", columns=["id", "email", "name", "hashed_password",
+                                                                      "is_superuser"], records=[
+                        (user_id, record["email"], record.get("name"), password, False)
+                        for user_id, record, password in zip(user_ids, records, hashed)
+                    ])
+                else:
+                    user_ids = []
+                    for start in range(0, len(records), INSERT_CHUNK):
+                        rows = await connection.fetch_all(users.insert().values([
+                            {"email": record["email"], "name": record.get("name"), "hashed_password": password,
+                             "is_superuser": False}
+                            for record, password in zip(records[start:start + INSERT_CHUNK],
+                                                        hashed[start:start + INSERT_CHUNK])
+                        ]).returning(users.c.id))
+                        user_ids.extend(row["id"] for row in rows)
+
+                await self._write(connection, interests_table, ["user_id", "interests"],
+                                  list(zip(user_ids, interests)))
+                await self._write(connection, user_interests_table, ["user_id", "term_id"], [
+                    (user_id, vocabulary.get_id(term))
+                    for user_id, stroke in zip(user_ids, interests) for term in split_interests(stroke)
+                ])
+                await self._write(connection, tokens, ["user_id", "token", "expires"], [
+                    (user_id, str(crud.uuid_generate_v4()), expires) for user_id in user_ids
+                ])
+                now = datetime.now()
+                user_posts = [
+                    (user_id, now, post.get("title"), post.get("content"))
+                    for user_id, record in zip(user_ids, records) for post in record.get("posts") or ()
+                ]
+                await self._write(connection, posts, ["user_id", "created_at", "title", "content"], user_posts)
+        self.users += len(records)
+        self.posts += len(user_posts)
+
+    async def _write(self, connection, table, columns: List[str], records: List[tuple]):
+        if not records:
+            return
+        if self.use_copy:
+            await connection.raw_connection.copy_records_to_table(table.name, columns=columns, records=records)
+            return
+        for start in range(0, len(records), INSERT_CHUNK):
+            await connection.execute(table.insert().values([
+                dict(zip(columns, record)) for record in records[start:start + INSERT_CHUNK]
+            ]))
+
+
+def _hash_all(passwords: List[str]) -> List[str]:
+    return [salted_hash(password) for password in passwords]
+
+
+async def main(args):
+    fmt = args.format or ("csv" if args.input.endswith(".csv") else "ndjson")
+    checkpoint = args.checkpoint or f"{args.input}.checkpoint"
+    done = 0 if args.restart else read_checkpoint(checkpoint)
+    if done:
+        print(f"resuming after {done} records from {checkpoint}", file=sys.stderr)
+
+    db = Database(args.database_url)
+    await db.connect()
+    pool = ProcessPoolExecutor(max_workers=args.workers)
+    provisioner = Provisioner(db, pool, workers=args.workers, use_copy=not args.insert, reuse_hash=args.reuse_hash)
+
+    try:
+        vocabulary.load(await db.fetch_all(interest_terms_table.select()))
+        start = time.perf_counter()
+        batch: List[dict] = []
+        for number, record in enumerate(read_records(args.input, fmt), start=1):
+            if number <= done:
+                continue
+            batch.append(record)
+            if len(batch) == args.batch_size:
+                await provisioner.load_batch(batch)
+                done = number
+                write_checkpoint(checkpoint, done)
+                batch = []
+                elapsed = time.perf_counter() - start
+                print(f"{done} records: {provisioner.users} users, {provisioner.posts} posts, "
+                      f"{provisioner.skipped} skipped, {provisioner.users / elapsed:.0f} users/s", file=sys.stderr)
+        if batch:
+            await provisioner.load_batch(batch)
+            done += len(batch)
+            write_checkpoint(checkpoint, done)
+        elapsed = time.perf_counter() - start
+        print(f"done: {done} records, {provisioner.users} users, {provisioner.posts} posts, "
+              f"{provisioner.skipped} skipped in {elapsed:.1f} s", file=sys.stderr)
+    finally:
+        pool.shutdown()
+        await db.disconnect()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m project.provision", description=__doc__.split("\n")[0])
+    parser.add_argument("input", help="CSV or NDJSON file with users")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="input format (default: by file extension)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="users per transaction")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="password hashing processes")
+    parser.add_argument("--insert", action="store_true", help="batched INSERT instead of COPY")
+    parser.add_argument("--reuse-hash", action="store_true",
+                        help="hash each distinct password once (weak, for staging and load tests only)")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <input>.checkpoint)")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the beginning")
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
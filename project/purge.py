@@ -0,0 +1,98 @@
+""" Фоновое вычищение аккаунтов, удалённых мягко (users.deleted_at). Посты удаляются пачками, чтобы не держать
+долгих блокировок, затем удаляется сама строка users - остальное удаляют каскады внешних ключей.
+
+Внутри приложения работает asyncio-задача, её будит crud.delete_cu. Вычистить всё сразу можно отдельно:
+
+    python -m project.purge
+"""
+import asyncio
+import logging
+from typing import Optional
+
+import sqlalchemy
+from databases import Database
+
+from project.config import ACCOUNT_PURGE_BATCH_SIZE, ACCOUNT_PURGE_INTERVAL
+from project.models.models import users_table as users
+from project.posts.posts import posts_table as posts
+
+logger = logging.getLogger(__name__)
+
+
+async def purge_user(db: Database, user_id: int, batch_size: int = ACCOUNT_PURGE_BATCH_SIZE) -> int:
+    """ Удаляет посты пользователя пачками, затем его самого. Возвращает число удалённых постов """
+    batch = sqlalchemy.select([posts.c.id]).where(posts.c.user_id == user_id).limit(batch_size)
+    purged = 0
+    while True:
+        rows = await db.fetch_all(posts.delete().where(posts.c.id.in_(batch.scalar_subquery())).returning(posts.c.id))
+        purged += len(rows)
+        if len(rows) < batch_size:
+            break
+        # Отдаём управление event loop-у между пачками
+        await asyncio.sleep(0)
+    # Условие на deleted_at - на случай, если удаление успели отменить
+    await db.execute(users.delete().where(sqlalchemy.and_(users.c.id == user_id, users.c.deleted_at.isnot(None))))
+    return purged
+
+
+async def purge_deleted_users(db: Database, batch_size: int = ACCOUNT_PURGE_BATCH_SIZE) -> int:
+    """ Вычищает всех мягко удалённых пользователей. Возвращает их число """
+    rows = await db.fetch_all(sqlalchemy.select([users.c.id]).where(users.c.deleted_at.isnot(None)))
+    for row in rows:
+        await purge_user(db, row["id"], batch_size=batch_size)
+    return len(rows)
+
+
+class AccountPurger:
+    """ asyncio-задача, которая вычищает мягко удалённые аккаунты: сразу после удаления и раз в interval секунд """
+
+    def __init__(self, interval: float = ACCOUNT_PURGE_INTERVAL):
+        self.interval = interval
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self, db: Database):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, db: Database):
+        while True:
+            try:
+                await purge_deleted_users(db)
+            except Exception:
+                logger.exception("Failed to purge deleted users, will retry")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+account_purger = AccountPurger()
+
+
+async def main():
+    from project.config import SQLALCHEMY_DATABASE_URL
+
+    db = Database(SQLALCHEMY_DATABASE_URL)
+    await db.connect()
+    try:
+        print(f"purged {await purge_deleted_users(db)} users")
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,179 @@
+""" Фоновый предрасчёт похожих пользователей в таблицу user_matches.
+
+Внутри приложения работает asyncio-задача: изменения интересов помечают затронутых пользователей (не больше
+MATCHES_DIRTY_MAX за одно изменение), задача пересчитывает только их - по одному пользователю в отдельном потоке,
+чтобы не занимать event loop. Полный пересчёт запускается отдельно:
+
+    python -m project.recommendations            # все пользователи
+    python -m project.recommendations 1 2 3      # только указанные user_id
+"""
+import asyncio
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from databases import Database
+
+from project.config import MATCHES_TOP_N, MATCHES_MODE, MATCHES_BATCH_SIZE, MATCHES_DIRTY_MAX
+from project.interests.interests_model import user_matches_table
+from project.matching import InterestIndex, interest_index
+
+logger = logging.getLogger(__name__)
+
+# Не больше стольких строк в одном INSERT
+INSERT_CHUNK = 5000
+
+
+def compute_matches(index: InterestIndex, user_ids: Iterable[int], top_n: int = MATCHES_TOP_N,
+                    mode: str = MATCHES_MODE) -> Dict[int, List[Tuple[int, float]]]:
+    """ top_n похожих пользователей для каждого из user_ids """
+    return {user_id: index.top_k(user_id, top_n, mode=mode)[0] for user_id in user_ids}
+
+
+def compute_all_matches(index: InterestIndex, top_n: int = MATCHES_TOP_N,
+                        mode: str = MATCHES_MODE) -> Dict[int, List[Tuple[int, float]]]:
+    """ Матчи для всех пользователей. Если установлен NumPy, считаем пачками через InterestMatrix """
+    try:
+        from project.bulk_matching import InterestMatrix
+    except ImportError:
+        InterestMatrix = None
+    if InterestMatrix is None or mode not in ("jaccard", "overlap"):
+        return compute_matches(index, list(index.terms_by_user), top_n=top_n, mode=mode)
+
+    matrix = InterestMatrix.from_index(index)
+    result = {}
+    for user_ids, scores in matrix.all_vs_all(mode=mode):
+        for user_id, row in zip(user_ids, scores):
+            ids, values = matrix.top_k(row, top_n)
+            result[int(user_id)] = [(int(uid), float(score)) for uid, score in zip(ids, values)]
+    return result
+
+
+async def save_matches(db: Database, matches: Dict[int, List[Tuple[int, float]]]):
+    """ Заменяет списки матчей указанных пользователей одной транзакцией """
+    now = datetime.now()
+    rows = [
+        {"user_id": user_id, "rank": rank, "match_id": match_id, "score": score, "computed_at": now}
+        for user_id, page in matches.items()
+        for rank, (match_id, score) in enumerate(page, start=1)
+    ]
+    async with db.transaction():
+        await db.execute(user_matches_table.delete().where(user_matches_table.c.user_id.in_(list(matches))))
+        for start in range(0, len(rows), INSERT_CHUNK):
+            await db.execute(user_matches_table.insert().values(rows[start:start + INSERT_CHUNK]))
+
+
+class MatchesWorker:
+    """ Очередь пользователей, чьи матчи устарели, и asyncio-задача, которая их пересчитывает """
+
+    def __init__(self, index: InterestIndex, batch_size: int = MATCHES_BATCH_SIZE,
+                 max_affected: int = MATCHES_DIRTY_MAX):
+        self.index = index
+        self.batch_size = batch_size
+        self.max_affected = max_affected
+        self.dirty: Set[int] = set()
+        # Взяты из dirty, но их матчи ещё не сохранены
+        self.in_progress: Set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Один поток: расчёт для одного пользователя за раз, event loop свободен
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def interests_changed(self, user_id: int, old_terms: Iterable[int], new_terms: Iterable[int]):
+        """ Помечает пользователя и тех, у кого был или появился общий интерес с ним. Интересы перебираются
+        от редких к частым: общий редкий интерес сильнее меняет оценку. Интерес, пользователи которого
+        уже не влезают в max_affected, и все более частые пропускаются """
+        affected = {user_id}
+        terms = sorted(set(old_terms) | set(new_terms), key=lambda term: len(self.index.postings.get(term, ())))
+        for term in terms:
+            users = self.index.postings.get(term, set())
+            if len(affected) + len(users) > self.max_affected + 1:
+                break
+            affected |= users
+        self.mark_dirty(affected)
+
+    def mark_dirty(self, user_ids: Iterable[int]):
+        self.dirty.update(user_ids)
+        self._wakeup.set()
+
+    def is_pending(self, user_id: int) -> bool:
+        return user_id in self.dirty or user_id in self.in_progress
+
+    def start(self, db: Database):
+        if self._task is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="matches")
+            self._task = asyncio.get_running_loop().create_task(self._run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _run(self, db: Database):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.dirty:
+                batch = [self.dirty.pop() for _ in range(min(self.batch_size, len(self.dirty)))]
+                # Удалённые пользователи уже не в индексе: их строки удаляет crud.delete_cu
+                batch = [user_id for user_id in batch if user_id in self.index.terms_by_user]
+                self.in_progress.update(batch)
+                try:
+                    await save_matches(db, await self._compute(batch))
+                except Exception:
+                    logger.exception("Failed to precompute matches, will retry")
+                    self.dirty.update(batch)
+                    await asyncio.sleep(1)
+                finally:
+                    self.in_progress.difference_update(batch)
+                # Отдаём управление event loop-у между пачками
+                await asyncio.sleep(0)
+
+    async def _compute(self, user_ids: List[int]) -> Dict[int, List[Tuple[int, float]]]:
+        """ Матчи пользователей, по одному в потоке executor-а. Индекс меняется из event loop-а, поэтому поток
+        получает не сам индекс, а снимок, снятый в event loop-е. Пользователь, удалённый во время расчёта
+        предыдущих, пропускается """
+        loop = asyncio.get_running_loop()
+        matches = {}
+        for user_id in user_ids:
+            if user_id not in self.index.terms_by_user:
+                continue
+            snapshot = self.index.snapshot(user_id, MATCHES_MODE)
+            matches.update(await loop.run_in_executor(self._executor, compute_matches, snapshot, [user_id]))
+        return matches
+
+
+matches_worker = MatchesWorker(interest_index)
+
+
+async def main(user_ids: List[int]):
+    from project import crud
+    from project.config import SQLALCHEMY_DATABASE_URL
+
+    db = Database(SQLALCHEMY_DATABASE_URL)
+    await db.connect()
+    try:
+        await crud.load_interest_index(db=db)
+        if user_ids:
+            matches = compute_matches(interest_index, user_ids)
+        else:
+            matches = compute_all_matches(interest_index)
+        items = list(matches.items())
+        for start in range(0, len(items), MATCHES_BATCH_SIZE):
+            chunk = dict(items[start:start + MATCHES_BATCH_SIZE])
+            await save_matches(db, chunk)
+            print(f"saved matches for {start + len(chunk)}/{len(items)} users")
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,44 @@
+""" Контекст текущего HTTP-запроса. Хранит результаты запросов к БД, которые не нужно повторять в рамках запроса """
+from contextvars import ContextVar, Token
+from typing import Any, Hashable, Optional
+
+_MISSING = object()
+
+# Словарь мемоизации живёт ровно один запрос: его создаёт middleware в main.py
+_request_memo: ContextVar[Optional[dict]] = ContextVar("request_memo", default=None)
+
+
+def begin() -> Token:
+    """ Открывает новый контекст запроса """
+    return _request_memo.set({})
+
+
+def end(token: Token):
+    """ Закрывает контекст запроса """
+    _request_memo.reset(token)
+
+
+def memo_get(key: Hashable, default: Any = _MISSING) -> Any:
+    """ Возвращает запомненное значение. Вне запроса всегда промах """
+    memo = _request_memo.get()
+    if memo is None:
+        return default
+    return memo.get(key, default)
+
+
+def memo_set(key: Hashable, value: Any):
+    memo = _request_memo.get()
+    if memo is not None:
+        memo[key] = value
+
+
+def memo_forget(*keys: Hashable):
+    """ Сбрасывает запомненные значения после записи в БД """
+    memo = _request_memo.get()
+    if memo is not None:
+        for key in keys:
+            memo.pop(key, None)
+
+
+def is_missing(value: Any) -> bool:
+    return value is _MISSING
@@ -1,6 +1,21 @@
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, validator
 from datetime import datetime
+from project.matching import MAX_TERM_LENGTH, split_interests
+from project.serialization import RowSerializer
+
+
+def _check_terms_length(terms: List[str]):
+    """ Интересы длиннее MAX_TERM_LENGTH не помещаются в словарь interest_terms """
+    if any(len(term) > MAX_TERM_LENGTH for term in terms):
+        raise ValueError(f'~ Each interest must be at most {MAX_TERM_LENGTH} characters ~')
+
+
+def _check_title_length(cls, v):
+    """ Валидатор заголовка поста, общий для PostsIn и PostsEdit: длина колонки posts.title - 100 символов """
+    if v is not None and len(v) > 100:
+        raise ValueError("~ Your title is so big. Lets make it small ~")
+    return v
 
 
 class TokenBase(BaseModel):
@@ -36,9 +51,10 @@ class UserCreate(BaseModel):
 
     @validator('interests')
     def convert_list(cls, stroke):
-        lst = stroke.split(",")
+        lst = split_interests(stroke)
         if len(lst) < 2:
             raise ValueError('~ List of interests must be more than one ~')
+        _check_terms_length(lst)
         perfect_stroke = ', '.join(lst)
         return perfect_stroke
 
@@ -58,7 +74,7 @@ class UserBase(BaseModel):
 
     @validator('interests')
     def convert_list(cls, stroke):
-        lst = stroke.split(",")
+        lst = split_interests(stroke)
         if len(lst) < 2:
             raise ValueError('~ List of interests must be more than one ~')
         perfect_stroke = ', '.join(lst)
@@ -88,10 +104,7 @@ class PostsIn(BaseModel):
     title: Optional[str] = None
     content: Optional[str] = None
 
-    @validator('title')
-    def title_validator(cls, v):
-        if len(v) > 100:
-            raise ValueError("~ Your title is so big. Lets make it small ~")
+    title_validator = validator('title', allow_reuse=True)(_check_title_length)
 
 
 class PostsUpdate(BaseModel):
@@ -99,6 +112,28 @@ class PostsUpdate(BaseModel):
     content: Optional[str]
 
 
+class PostsEdit(PostsUpdate):
+    """ Изменение поста по id. version - версия, которую видел клиент (если указана, проверяется при записи) """
+    version: Optional[int] = None
+
+    title_validator = validator('title', allow_reuse=True)(_check_title_length)
+
+
+class PostsOut(BaseModel):
+    id: int
+    user_id: int
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+    title: Optional[str]
+    content: Optional[str]
+    version: int
+
+
+class PostsSearchHit(PostsOut):
+    """ Пост из результатов поиска с его рангом """
+    rank: float
+
+
 class PostsBase(PostsIn):
     """ Модель (сущность), описывающая посты каждого пользователя """
     id: Optional[str] = None
@@ -117,7 +152,24 @@ class InterestsBase(BaseModel):
 class InterestsUpdate(BaseModel):
     interests: Optional[str]
 
+    @validator('interests')
+    def terms_length(cls, stroke):
+        if stroke is not None:
+            _check_terms_length(split_interests(stroke))
+        return stroke
+
 
 class FullUser(User):
     id: Optional[str] = None
     interests: Optional[str] = None
+
+
+def _title(name: Optional[str]) -> Optional[str]:
+    return name.title() if name else name
+
+
+# Сериализаторы списков для быстрого пути (FAST_JSON и кеш страниц постов, см. project.serialization).
+# Имя в ответе FullUser приводится к title(), как это делает валидатор User.name_must_contain_space
+user_base_serializer = RowSerializer(UserBase)
+posts_update_serializer = RowSerializer(PostsUpdate)
+full_user_serializer = RowSerializer(FullUser, converters={"name": _title}, exclude_unset=True)
@@ -0,0 +1,81 @@
+""" Быстрая сериализация ответов: строки из БД кодируются в JSON-байты напрямую, без jsonable_encoder
+и проверки response_model. Для каждой схемы один раз составляется список полей с функциями преобразования
+(str для id: str, вложенные схемы), дальше каждая строка - один проход по этому списку.
+Выходные валидаторы схем (convert_list, name_must_contain_space и т.д.) здесь не выполняются - данные
+уже проверены при записи. В DEBUG каждая строка дополнительно проходит через саму схему.
+Если orjson не установлен, используется json из стандартной библиотеки """
+import json
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from project.config import DEBUG
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(obj) -> bytes:
+    """ JSON-байты; datetime - в ISO-формате, как у jsonable_encoder """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default)
+    return json.dumps(obj, default=_json_default, separators=(",", ":")).encode()
+
+
+def _to_str(value):
+    return value if value is None or value.__class__ is str else str(value)
+
+
+class RowSerializer:
+    """ Превращает строки из БД (Record или dict) в объекты схемы schema.
+    converters - свои преобразования для отдельных полей: значение -> значение в ответе.
+    exclude_unset - поля, которых нет в строке, не попадают в ответ (как response_model_exclude_unset);
+    работает только для строк-словарей """
+
+    def __init__(self, schema, converters: Optional[Dict[str, Callable]] = None, exclude_unset: bool = False):
+        self.schema = schema
+        self.exclude_unset = exclude_unset
+        converters = converters or {}
+        self.fields: List[Tuple[str, Optional[Callable]]] = []
+        for name, field in schema.__fields__.items():
+            converter = converters.get(name)
+            if converter is None and isinstance(field.type_, type):
+                if issubclass(field.type_, BaseModel):
+                    converter = RowSerializer(field.type_, exclude_unset=exclude_unset).to_dict
+                elif field.type_ is str:
+                    converter = _to_str
+            self.fields.append((field.alias, converter))
+
+    def to_dict(self, row) -> dict:
+        if self.exclude_unset:
+            return {name: (converter(row[name]) if converter else row[name])
+                    for name, converter in self.fields if name in row}
+        return {name: (converter(row[name]) if converter else row[name]) for name, converter in self.fields}
+
+    def validate(self, rows: Iterable):
+        """ Прогоняет строки через схему, чтобы её валидаторы поймали данные, которые быстрый путь пропустил бы """
+        for row in rows:
+            self.schema(**dict(row))
+
+    def dumps(self, row) -> bytes:
+        if DEBUG:
+            self.validate((row,))
+        return dumps(self.to_dict(row))
+
+    def dumps_many(self, rows: Iterable) -> bytes:
+        """ Список строк как JSON-массив """
+        if DEBUG:
+            rows = list(rows)
+            self.validate(rows)
+        return dumps([self.to_dict(row) for row in rows])
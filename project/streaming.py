@@ -0,0 +1,84 @@
+""" Потоковые ответы: строки из БД отдаются клиенту по мере чтения, без сборки всего списка в памяти """
+import json
+from datetime import datetime
+from typing import AsyncIterable, Callable, Sequence, Union
+
+from fastapi.responses import StreamingResponse
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv"
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_json(obj) -> str:
+    """ json.dumps, который умеет datetime (в ISO-формате, как jsonable_encoder) """
+    return json.dumps(obj, default=_json_default)
+
+
+async def iter_ndjson_lines(chunks: AsyncIterable[bytes]):
+    """ Разбивает входящий поток байт на непустые строки NDJSON, не дожидаясь конца тела запроса """
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+def ndjson_response(rows: AsyncIterable, encode: Callable[[object], Union[str, bytes]]) -> StreamingResponse:
+    """ NDJSON: каждая строка rows превращается функцией encode в JSON-объект (str или bytes) на отдельной строке """
+    async def lines():
+        async for row in rows:
+            line = encode(row)
+            yield line + (b"\n" if isinstance(line, bytes) else "\n")
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+
+def _csv_field(value) -> str:
+    """ Значение колонки так же, как его выводит COPY ... TO STDOUT (FORMAT csv): NULL - пусто, boolean - t/f,
+    timestamp - "2026-01-02 03:04:05.678" (дробная часть без хвостовых нулей), пустая строка и строки
+    с разделителем, кавычкой или переводом строки - в кавычках """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        text = value.strftime("%Y-%m-%d %H:%M:%S")
+        if value.microsecond:
+            text += f".{value.microsecond:06d}".rstrip("0")
+        return text
+    text = str(value)
+    if not text or any(char in text for char in ',"\r\n'):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def _csv_line(values) -> str:
+    return ",".join(_csv_field(value) for value in values) + "\n"
+
+
+def csv_response(rows: AsyncIterable, header: Sequence[str], filename: str = "export.csv") -> StreamingResponse:
+    """ CSV: первая строка - header, дальше значения колонок header из каждой строки rows.
+    Формат совпадает с выводом COPY, поэтому выгрузка не зависит от того, кто её собирает - Python или Postgres """
+    async def lines():
+        yield _csv_line(header)
+        async for row in rows:
+            yield _csv_line(row[column] for column in header)
+
+    return StreamingResponse(lines(), media_type=CSV_MEDIA_TYPE,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+def bytes_response(chunks: AsyncIterable[bytes], media_type: str, filename: str) -> StreamingResponse:
+    """ Отдаёт уже готовые куски байт (например, вывод COPY ... TO STDOUT) """
+    return StreamingResponse(chunks, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
@@ -0,0 +1,91 @@
+""" Общие фикстуры тестов.
+
+Тесты API работают с настоящим Postgres: TEST_DATABASE_URL должен указывать на отдельную базу со схемой
+из migrations (alembic upgrade head) - перед каждым тестом все её таблицы очищаются. Без TEST_DATABASE_URL
+тесты API пропускаются, остальные работают без БД.
+
+    TEST_DATABASE_URL=postgresql://postgres@127.0.0.1/course_test python -m pytest -q
+"""
+import os
+
+import pytest
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+# В DEBUG ответ содержит X-DB-Queries, а быстрая сериализация проверяет строки схемами
+os.environ.setdefault("DEBUG", "1")
+
+
+def _truncate_all_tables(url: str):
+    import sqlalchemy
+
+    engine = sqlalchemy.create_engine(url)
+    try:
+        with engine.begin() as connection:
+            tables = [row[0] for row in connection.execute(sqlalchemy.text(
+                "SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename <> 'alembic_version'"
+            ))]
+            connection.execute(sqlalchemy.text(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE"))
+    finally:
+        engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def app_client():
+    """ Один TestClient на все тесты: фоновые задачи приложения привязаны к event loop-у, в котором оно стартовало """
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from fastapi.testclient import TestClient
+    from project.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def client(app_client):
+    """ TestClient с пустой базой, пустыми кешами и заново построенными индексами в памяти """
+    from project import crud
+    from project.cache import token_cache, data_versions, posts_cache
+    from project.db import database
+    from project.recommendations import matches_worker
+
+    _truncate_all_tables(TEST_DATABASE_URL)
+    token_cache.clear()
+    data_versions.clear()
+    posts_cache.clear()
+    matches_worker.dirty.clear()
+    matches_worker.in_progress.clear()
+    for load in (crud.load_interest_index, crud.load_fanout_on_read_authors):
+        app_client.portal.call(load, database)
+    return app_client
+
+
+@pytest.fixture
+def sign_up(client):
+    """ Регистрирует пользователя и возвращает заголовки авторизации (токен - email) """
+    def sign_up(email: str, name: str = "Ann Lee", interests: str = "music, books") -> dict:
+        response = client.post("/api/user/sign-up", json={
+            "email": email, "name": name, "password": "pw", "repeating_password": "pw", "interests": interests,
+        })
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {email}"}
+
+    return sign_up
+
+
+@pytest.fixture
+def db_queries(client):
+    """ Число запросов к БД, которые выполнил запрос к API (заголовок X-DB-Queries, есть только в DEBUG).
+    Кеши токенов и версий перед запросом очищаются, чтобы результат не зависел от предыдущих запросов """
+    from project.cache import token_cache, data_versions
+
+    def db_queries(method: str, path: str, **kwargs) -> int:
+        token_cache.clear()
+        data_versions.clear()
+        response = client.request(method, path, **kwargs)
+        assert response.status_code < 400, response.text
+        return int(response.headers["X-DB-Queries"])
+
+    return db_queries
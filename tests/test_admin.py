@@ -0,0 +1,60 @@
+""" Выгрузка пользователей для администратора """
+import json
+
+import pytest
+
+
+@pytest.fixture
+def admin_headers(client, sign_up):
+    """ Администратор. Регистрация суперпользователей не создаёт, поэтому флаг ставится прямо в БД.
+    id токена администратора сдвинут, чтобы он не совпадал с его user_id """
+    from project.db import database
+
+    sign_up("a@x.com")
+    client.portal.call(database.execute, "ALTER SEQUENCE tokens_id_seq RESTART WITH 100")
+    headers = sign_up("root@x.com", name="Root Admin")
+    sign_up("b@x.com", name="Bob Ray")
+    client.portal.call(database.execute, "UPDATE users SET is_superuser = true WHERE email = 'root@x.com'")
+    return headers
+
+
+def test_all_users_excludes_admin(client, admin_headers):
+    client.get("/api/user/auth/my_page", headers=admin_headers)
+    response = client.get("/api/admin/all_users", headers=admin_headers)
+    assert response.status_code == 200
+    users = response.json()
+    assert [user["email"] for user in users] == ["a@x.com", "b@x.com"]
+    assert users[0]["token"]["token_type"] == "bearer"
+
+
+@pytest.mark.parametrize("params", [{"format": "ndjson"}, {"format": "csv"}, {"format": "csv", "copy": True}])
+def test_export_matches_all_users(client, admin_headers, params):
+    from project.db import database
+
+    # Строка с разделителем и кавычками и время с хвостовым нулём в дробной части
+    client.portal.call(database.execute, """UPDATE users SET name = 'Lee, "Ann"' WHERE email = 'a@x.com'""")
+    client.portal.call(database.execute, "UPDATE tokens SET expires = '2100-01-02 03:04:05.678'")
+    expected = client.get("/api/admin/all_users", headers=admin_headers).json()
+    response = client.get("/api/admin/export", params=params, headers=admin_headers)
+    assert response.status_code == 200
+    if params["format"] == "ndjson":
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        # В all_users id - строка, и флагов нет: у выгрузки схема полнее
+        assert [{**{key: row[key] for key in user}, "id": str(row["id"])} for row, user in zip(rows, expected)] == \
+            expected
+        assert len(rows) == len(expected)
+        assert all(row["is_active"] and not row["is_superuser"] for row in rows)
+    else:
+        # Колонки в том виде, в каком их выводит COPY
+        assert response.text.splitlines() == ["id,email,name,is_active,is_superuser,token,expires"] + [
+            ",".join([str(user["id"]), user["email"], '"Lee, ""Ann"""' if user["email"] == "a@x.com" else user["name"],
+                      "t", "f", user["token"]["token"], "2100-01-02 03:04:05.678"])
+            for user in expected
+        ]
+        assert "\r" not in response.text
+
+
+def test_export_requires_superuser(client, sign_up):
+    headers = sign_up("a@x.com")
+    assert client.get("/api/admin/export", headers=headers).status_code == 400
+    assert client.get("/api/admin/all_users", headers=headers).status_code == 400
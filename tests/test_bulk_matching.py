@@ -0,0 +1,52 @@
+""" Массовая оценка похожести на NumPy должна совпадать с InterestIndex """
+import random
+
+import numpy as np
+import pytest
+
+from project.bulk_matching import InterestMatrix, _popcount_rows
+from project.matching import InterestIndex
+
+
+@pytest.fixture
+def index():
+    rng = random.Random(7)
+    index = InterestIndex()
+    for user_id in rng.sample(range(1, 1000), 150):
+        index.set_user(user_id, rng.sample(range(90), rng.randint(1, 6)))
+    return index
+
+
+def test_popcount_rows():
+    words = np.array([[0, 1], [np.iinfo(np.uint64).max, 6]], dtype=np.uint64)
+    assert _popcount_rows(words).tolist() == [1, 66]
+
+
+@pytest.mark.parametrize("mode", ["jaccard", "overlap"])
+def test_one_vs_all_matches_index_scores(index, mode):
+    matrix = InterestMatrix.from_index(index)
+    for user_id in list(index.terms_by_user)[:20]:
+        scores = matrix.one_vs_all(user_id, mode)
+        expected = index.scores(user_id, mode)
+        got = {int(uid): score for uid, score in zip(matrix.user_ids, scores) if score > 0}
+        assert got == pytest.approx(expected)
+
+
+def test_all_vs_all_rows_equal_one_vs_all(index):
+    matrix = InterestMatrix.from_index(index)
+    for user_ids, scores in matrix.all_vs_all(batch_size=32):
+        for user_id, row in zip(user_ids, scores):
+            assert np.array_equal(row, matrix.one_vs_all(int(user_id)))
+
+
+def test_top_k_agrees_with_index_on_ties(index):
+    matrix = InterestMatrix.from_index(index)
+    for user_id in index.terms_by_user:
+        user_ids, scores = matrix.top_k(matrix.one_vs_all(user_id, "overlap"), 5)
+        page, _ = index.top_k(user_id, limit=5, mode="overlap")
+        assert list(zip(user_ids.tolist(), scores.tolist())) == page
+
+
+def test_cosine_is_not_supported(index):
+    with pytest.raises(ValueError):
+        InterestMatrix.from_index(index).one_vs_all(next(iter(index.terms_by_user)), "cosine")
@@ -0,0 +1,148 @@
+""" Кеши в памяти процесса и кеш страниц постов """
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from project.cache import LocalCacheBackend, PostsPage, PostsPageCache, SqliteCacheBackend, TTLCache, TokenCache
+
+
+def _user(user_id: int, expires_in: float = 3600) -> dict:
+    return {"user_id": user_id, "expires": datetime.now() + timedelta(seconds=expires_in)}
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    evicted = []
+    cache = TTLCache(maxsize=2, ttl=60, on_evict=lambda key, value: evicted.append(key))
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert evicted == ["b"]
+    assert cache.get("b") is None
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 1, "misses": 1}
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("project.cache.time.monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=5)
+    # ttl больше ttl кеша срок жизни не продлевает
+    cache.set("c", 3, ttl=600)
+
+    now[0] += 10
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    now[0] += 60
+    assert cache.get("c") is None
+
+
+def test_token_cache_invalidates_all_tokens_of_user():
+    cache = TokenCache(maxsize=10, ttl=60)
+    cache.put("t1", _user(1))
+    cache.put("t2", _user(1))
+    cache.put("t3", _user(2))
+
+    cache.invalidate_user(1)
+    assert cache.get("t1") is None
+    assert cache.get("t2") is None
+    assert cache.get("t3") is not None
+
+
+def test_token_cache_skips_expired_tokens():
+    cache = TokenCache(maxsize=10, ttl=60)
+    cache.put("t", _user(1, expires_in=-1))
+    assert cache.get("t") is None
+
+
+def test_deleted_user_token_is_rejected(client, sign_up):
+    headers = sign_up("a@x.com")
+    assert client.get("/api/user/auth/my_page", headers=headers).status_code == 200
+
+    client.delete("/api/user/auth/my_page/delete_my_page", headers=headers)
+    assert client.get("/api/user/auth/my_page", headers=headers).status_code == 401
+
+
+@pytest.fixture(params=["local", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "local":
+        return LocalCacheBackend(maxsize=10, ttl=60)
+    return SqliteCacheBackend(str(tmp_path / "cache.sqlite"), maxsize=10, ttl=60)
+
+
+def test_backend_invalidates_by_tag(backend):
+    backend.set("user:1:20", b"a", ["user:1"])
+    backend.set("name:Ann:20", b"b", ["name:Ann"])
+    backend.set("user:2:20", b"c", ["user:2"])
+
+    backend.invalidate(["user:1", "name:Ann"])
+    assert backend.get("user:1:20") is None
+    assert backend.get("name:Ann:20") is None
+    assert backend.get("user:2:20") == b"c"
+    assert len(backend) == 1
+
+
+def test_backend_keeps_maxsize(backend):
+    for i in range(25):
+        backend.set(f"key:{i}", b"x", [f"tag:{i}"])
+    assert len(backend) <= 10
+    assert backend.get("key:24") == b"x"
+
+
+def test_sqlite_backend_counts_rows_only_when_evicting(tmp_path):
+    backend = SqliteCacheBackend(str(tmp_path / "cache.sqlite"), maxsize=10, ttl=60)
+    statements = []
+    backend._connection.set_trace_callback(statements.append)
+    for i in range(10):
+        backend.set(f"key:{i}", b"x", [f"tag:{i}"])
+    backend.set("key:0", b"y", ["tag:0"])
+    assert not [statement for statement in statements if "count(*)" in statement]
+
+    backend.set("key:10", b"x", ["tag:10"])
+    assert len([statement for statement in statements if "count(*)" in statement]) == 1
+    assert len(backend) <= 10
+    assert backend.get("key:10") == b"x"
+
+
+def test_posts_cache_reads_through_and_skips_stale_fill():
+    cache = PostsPageCache(LocalCacheBackend(maxsize=10, ttl=60))
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return PostsPage(b"[]", "cursor")
+
+    async def load_with_invalidation():
+        # Запись, которая случилась, пока страница читалась из БД
+        cache.invalidate_user(1)
+        return PostsPage(b"[1]", None)
+
+    async def scenario():
+        assert await cache.get_or_load("user:1:20", ["user:1"], load) == PostsPage(b"[]", "cursor")
+        assert await cache.get_or_load("user:1:20", ["user:1"], load) == PostsPage(b"[]", "cursor")
+        assert len(loads) == 1
+
+        cache.invalidate_user(1)
+        assert await cache.get_or_load("user:1:20", ["user:1"], load_with_invalidation) == PostsPage(b"[1]", None)
+        assert cache.backend.get("user:1:20") is None
+
+    asyncio.run(scenario())
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_name_page_is_invalidated_by_author_writes(client, sign_up):
+    ann = sign_up("a@x.com")
+    bob = sign_up("b@x.com", name="Bob Ray")
+    path = "/api/user/auth/update_posts/get_posts/Bob Ray"
+    client.post("/api/user/auth/update_posts/", json={"title": "one"}, headers=bob)
+    assert [post["title"] for post in client.get(path, headers=ann).json()] == ["one"]
+
+    client.post("/api/user/auth/update_posts/", json={"title": "two"}, headers=bob)
+    assert [post["title"] for post in client.get(path, headers=ann).json()] == ["two", "one"]
+    client.patch("/api/user/auth/update_posts/patch_mine_post/two", json={"content": "new"}, headers=bob)
+    assert client.get(path, headers=ann).json()[0]["content"] == "new"
+    client.delete("/api/user/auth/my_page/delete_my_page", headers=bob)
+    assert client.get(path, headers=ann).json() == []
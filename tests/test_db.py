@@ -0,0 +1,84 @@
+""" Пул соединений и чтение с реплики """
+import pytest
+
+from project import db
+
+
+class RecordingReplica:
+    """ "Реплика", которая выполняет запросы на основной базе и запоминает, какие методы вызывались """
+
+    def __init__(self, primary):
+        self.primary = primary
+        self.calls = []
+
+    def fetch_all(self, query, values: dict = None):
+        self.calls.append("fetch_all")
+        return self.primary.fetch_all(query, values)
+
+    def iterate(self, query, values: dict = None):
+        self.calls.append("iterate")
+        return self.primary.iterate(query, values)
+
+
+@pytest.fixture
+def replica(client, monkeypatch):
+    replica = RecordingReplica(db.database)
+    monkeypatch.setattr(db, "replica", replica)
+    return replica
+
+
+def test_reader_without_replica(monkeypatch):
+    monkeypatch.setattr(db, "replica", None)
+    assert db.reader(db.database) is db.database
+
+
+def test_lists_are_read_from_replica(client, sign_up, replica):
+    headers = sign_up("a@x.com")
+    client.get("/api/user/auth/get_all_users", headers=headers)
+    client.get("/api/user/auth/get_all_users", params={"stream": True}, headers=headers)
+    client.get("/api/user/auth/update_posts/get_posts/Ann Lee", params={"before": "2100-01-01T00:00:00,1"},
+               headers=headers)
+    assert replica.calls == ["fetch_all", "iterate", "fetch_all"]
+
+
+def test_etag_and_cached_reads_use_primary(client, sign_up, replica):
+    headers = sign_up("a@x.com")
+    client.post("/api/user/auth/update_posts/", json={"title": "hello"}, headers=headers)
+    client.get("/api/user/auth/my_page/posts/", headers=headers)
+    client.get("/api/user/auth/my_page/interests", headers=headers)
+    client.get("/api/user/auth/update_posts/get_posts/Ann Lee", headers=headers)
+    assert replica.calls == []
+
+
+def test_pool_metrics(client):
+    metrics = db.pool_metrics()
+    primary = metrics["primary"]
+    assert primary["connected"]
+    assert primary["min_size"] <= primary["size"] <= primary["max_size"]
+    assert 0 <= primary["saturation"] <= 1
+
+
+def test_export_ignores_statement_timeout(client, monkeypatch):
+    """ Выгрузка COPY идёт без statement_timeout, даже если в пуле он меньше времени выгрузки """
+    import sqlalchemy
+    from asyncpg.exceptions import QueryCanceledError
+
+    from project import crud
+    from project.config import SQLALCHEMY_DATABASE_URL
+
+    # Выгрузка, которая заведомо дольше таймаута пула
+    slow_query = sqlalchemy.select([sqlalchemy.func.pg_sleep(0.3).label("slept")])
+    monkeypatch.setattr(crud, "_admin_users_query", lambda user_id: slow_query)
+    monkeypatch.setattr(db, "DB_STATEMENT_TIMEOUT", 100)
+    database = db.make_database(SQLALCHEMY_DATABASE_URL)
+
+    async def export():
+        await database.connect()
+        try:
+            with pytest.raises(QueryCanceledError):
+                await database.execute("SELECT pg_sleep(0.3)")
+            return b"".join([chunk async for chunk in crud.copy_all_users_for_admin(database, admin_id=0)])
+        finally:
+            await database.disconnect()
+
+    assert client.portal.call(export).splitlines() == [b"slept", b'""']
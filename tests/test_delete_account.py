@@ -0,0 +1,62 @@
+""" Удаление аккаунта: один запрос, остальное удаляют каскады (или фоновое вычищение при мягком удалении) """
+import pytest
+
+TABLES = ("users", "tokens", "interests", "user_interests", "posts", "timelines", "user_matches")
+
+
+@pytest.fixture
+def rows(client):
+    """ Число строк пользователя с user_id в таблицах TABLES """
+    from project.db import database
+
+    def rows(user_id: int) -> dict:
+        counts = {}
+        for table in TABLES:
+            column = "id" if table == "users" else "user_id"
+            counts[table] = client.portal.call(database.fetch_val,
+                                               f"SELECT count(*) FROM {table} WHERE {column} = {user_id}")
+        return counts
+
+    return rows
+
+
+@pytest.fixture
+def two_users(client, sign_up):
+    """ Ann (user_id 1) с постом и Bob (user_id 2), у которых общий интерес """
+    ann = sign_up("a@x.com")
+    bob = sign_up("b@x.com", name="Bob Ray", interests="music, golf")
+    client.post("/api/user/auth/update_posts/", json={"title": "hello"}, headers=ann)
+    client.post("/api/user/auth/update_posts/", json={"title": "hi"}, headers=bob)
+    return ann, bob
+
+
+def test_delete_my_page_removes_everything(client, two_users, rows):
+    ann, bob = two_users
+    assert rows(1)["timelines"] == 1
+
+    response = client.delete("/api/user/auth/my_page/delete_my_page", headers=ann)
+    assert response.status_code == 200
+    assert set(rows(1).values()) == {0}
+    assert rows(2)["timelines"] == 0
+    assert client.get("/api/user/auth/timeline", headers=bob).json() == []
+
+    assert client.get("/api/user/auth/get_me_users", headers=bob).json()["users"] == []
+    assert client.get("/api/user/auth/update_posts/get_posts/Ann Lee", headers=bob).json() == []
+    assert [user["email"] for user in client.get("/api/user/auth/get_all_users", headers=bob).json()] == ["b@x.com"]
+
+
+def test_soft_delete_hides_user_until_purge(client, two_users, rows):
+    from project import crud
+    from project.db import database
+    from project.purge import purge_deleted_users
+
+    ann, bob = two_users
+    client.portal.call(lambda: crud.delete_cu(db=database, user_id=1, soft=True))
+    assert rows(1) == dict.fromkeys(TABLES, 0) | {"users": 1, "posts": 1}
+    assert client.get("/api/user/auth/my_page", headers=ann).status_code == 401
+    assert client.get("/api/user/auth/update_posts/get_posts/Ann Lee", headers=bob).json() == []
+    assert client.get("/api/user/auth/timeline", headers=bob).json() == []
+
+    assert client.portal.call(lambda: purge_deleted_users(database, batch_size=1)) == 1
+    assert set(rows(1).values()) == {0}
+    assert rows(2)["users"] == 1
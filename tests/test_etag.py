@@ -0,0 +1,76 @@
+""" ETag и условные GET для профиля, интересов и постов """
+import pytest
+
+from project.cache import DataVersionCache
+from project.main import etag_matches
+
+ROUTES = ["/api/user/auth/my_page", "/api/user/auth/my_page/interests", "/api/user/auth/my_page/posts/"]
+
+
+def test_etag_matches_weakly():
+    etag = 'W/"1.2.abc"'
+    assert etag_matches(etag, 'W/"1.2.abc"')
+    assert etag_matches(etag, '"1.2.abc"')
+    assert etag_matches(etag, '"other", W/"1.2.abc"')
+    assert etag_matches(etag, "*")
+    assert not etag_matches(etag, None)
+    assert not etag_matches(etag, 'W/"1.3.abc"')
+
+
+def test_data_version_cache_never_goes_back():
+    cache = DataVersionCache(maxsize=10, ttl=60)
+    cache.put(1, 5)
+    cache.put(1, 4)
+    assert cache.get(1) == 5
+    cache.invalidate(1)
+    cache.put(1, 4)
+    assert cache.get(1) == 4
+    # Сохранение версии не считается ни попаданием, ни промахом
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (2, 0)
+
+
+def _etags(client, headers) -> dict:
+    etags = {}
+    for path in ROUTES:
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200
+        assert response.headers["Cache-Control"] == "private, no-cache"
+        etags[path] = response.headers["ETag"]
+    return etags
+
+
+@pytest.mark.parametrize("path", ROUTES)
+def test_not_modified(client, sign_up, path):
+    headers = sign_up("a@x.com")
+    etag = client.get(path, headers=headers).headers["ETag"]
+    response = client.get(path, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+
+def test_pages_have_different_etags(client, sign_up):
+    headers = sign_up("a@x.com")
+    first = client.get(ROUTES[2], headers=headers).headers["ETag"]
+    assert client.get(ROUTES[2], params={"limit": 1}, headers=headers).headers["ETag"] != first
+
+
+@pytest.mark.parametrize("method, path, body", [
+    ("POST", "/api/user/auth/update_posts/", {"title": "hello"}),
+    ("POST", "/api/user/auth/update_posts/batch", [{"title": "hello"}]),
+    ("PATCH", "/api/user/auth/my_page/update_interests", {"interests": "golf, ski"}),
+    ("DELETE", "/api/user/auth/update_posts/delete", None),
+])
+def test_writes_change_etags(client, sign_up, method, path, body):
+    headers = sign_up("a@x.com")
+    before = _etags(client, headers)
+    assert client.request(method, path, json=body, headers=headers).status_code == 200
+    after = _etags(client, headers)
+    assert all(after[route] != before[route] for route in ROUTES)
+
+
+def test_failed_batch_keeps_etags(client, sign_up):
+    headers = sign_up("a@x.com")
+    before = _etags(client, headers)
+    client.post("/api/user/auth/update_posts/batch", json=[{"title": "x" * 101}], headers=headers)
+    assert _etags(client, headers) == before
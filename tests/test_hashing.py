@@ -0,0 +1,52 @@
+""" Хеширование паролей в пуле вне event loop-а """
+import asyncio
+import threading
+
+import pytest
+
+from project.hashing import HashingExecutor, HashingQueueFull
+
+
+def test_run_returns_result_and_counts_latency():
+    executor = HashingExecutor(kind="thread", workers=1)
+    try:
+        assert asyncio.run(executor.run(pow, 2, 10)) == 1024
+    finally:
+        executor.shutdown()
+    metrics = executor.metrics()
+    assert metrics["completed"] == 1
+    assert metrics["in_flight"] == 0
+
+
+def test_full_queue_rejects_new_tasks():
+    executor = HashingExecutor(kind="thread", workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        busy = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HashingQueueFull):
+            await executor.run(release.wait)
+        release.set()
+        await asyncio.gather(*busy)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert executor.metrics()["rejected"] == 1
+
+
+def test_unknown_pool_kind():
+    with pytest.raises(ValueError):
+        HashingExecutor(kind="fiber")
+
+
+def test_auth_checks_password(client, sign_up):
+    sign_up("a@x.com")
+    good = client.post("/auth", data={"username": "a@x.com", "password": "pw"})
+    assert good.status_code == 200
+    assert good.json() == {"access_token": "a@x.com", "token_type": "bearer"}
+
+    bad = client.post("/auth", data={"username": "a@x.com", "password": "wrong"})
+    assert bad.status_code == 400
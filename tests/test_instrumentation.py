@@ -0,0 +1,52 @@
+""" Метрики в формате Prometheus """
+import sqlalchemy
+
+from project.instrumentation import Registry, statement_label
+from project.models.models import users_table as users, tokens_table as tokens
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ["route"])
+    latency = registry.histogram("latency_seconds", "Latency", ["route"], buckets=(0.1, 1.0))
+    registry.add_collector(lambda: [("queue_depth", "Queue depth", {"pool": 'a"b'}, 3)])
+    requests.inc("/a")
+    requests.inc("/a", amount=2)
+    latency.observe(0.5, "/a")
+    latency.observe(5, "/a")
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{route="/a"} 3.0',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a",le="0.1"} 0',
+        'latency_seconds_bucket{route="/a",le="1.0"} 1',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 2',
+        'latency_seconds_sum{route="/a"} 5.5',
+        'latency_seconds_count{route="/a"} 2',
+        "# HELP queue_depth Queue depth",
+        "# TYPE queue_depth gauge",
+        'queue_depth{pool="a\\"b"} 3.0',
+    ]
+
+
+def test_statement_label():
+    assert statement_label(users.select()) == "select users"
+    assert statement_label(sqlalchemy.select([users.c.id]).select_from(users.join(tokens))) == "select users"
+    assert statement_label(tokens.insert()) == "insert tokens"
+    assert statement_label(sqlalchemy.text("SELECT 1")) == "text"
+
+
+def test_metrics_route(client, sign_up):
+    headers = sign_up("a@x.com")
+    client.get("/api/user/auth/my_page/posts/", headers=headers)
+
+    text = client.get("/metrics").text
+    route = "/api/user/auth/my_page/posts/"
+    assert f'http_request_duration_seconds_count{{method="GET",route="{route}",status="200"}}' in text
+    assert 'dependency_duration_seconds_count{dependency="get_current_user"}' in text
+    assert 'db_query_duration_seconds_count{operation="fetch_all",statement="select posts",caller="crud.get_post_cu"}' \
+        in text
+    assert "hashing_queue_depth" in text
@@ -0,0 +1,37 @@
+""" Словарь интересов interest_terms и связи user_interests """
+from project.interests.vocabulary import Vocabulary
+from project.matching import MAX_TERM_LENGTH
+
+
+def test_vocabulary_maps_terms_both_ways():
+    vocabulary = Vocabulary()
+    vocabulary.load([{"id": 2, "term": "music"}, {"id": 1, "term": "books"}])
+    assert vocabulary.get_id("music") == 2
+    assert vocabulary.missing(["music", "golf"]) == ["golf"]
+    assert vocabulary.to_terms([2, 1]) == ["books", "music"]
+
+
+def test_update_interests_changes_matches(client, sign_up):
+    headers = sign_up("a@x.com", interests="music, books")
+    sign_up("b@x.com", name="Bob Ray", interests="golf, ski")
+
+    response = client.patch("/api/user/auth/my_page/update_interests", json={"interests": "Golf, chess"},
+                            headers=headers)
+    assert response.status_code == 200
+    assert client.get("/api/user/auth/my_page/interests", headers=headers).json()["interests"] == "golf, chess"
+    users = client.get("/api/user/auth/get_me_users", params={"mode": "overlap"}, headers=headers).json()["users"]
+    assert [user["name"] for user in users] == ["Bob Ray"]
+
+
+def test_too_long_interest_is_rejected(client, sign_up):
+    long_term = "x" * (MAX_TERM_LENGTH + 1)
+    response = client.post("/api/user/sign-up", json={
+        "email": "a@x.com", "name": "Ann Lee", "password": "pw", "repeating_password": "pw",
+        "interests": f"music, {long_term}",
+    })
+    assert response.status_code == 422
+
+    headers = sign_up("a@x.com")
+    response = client.patch("/api/user/auth/my_page/update_interests", json={"interests": f"golf, {long_term}"},
+                            headers=headers)
+    assert response.status_code == 422
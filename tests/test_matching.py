@@ -0,0 +1,92 @@
+""" Поиск пользователей со схожими интересами """
+import pytest
+
+from project.matching import InterestIndex, parse_cursor, split_interests
+
+
+def _index(users: dict) -> InterestIndex:
+    index = InterestIndex()
+    for user_id, terms in users.items():
+        index.set_user(user_id, terms, name=f"User {user_id}")
+    return index
+
+
+def test_split_interests_normalizes_terms():
+    assert split_interests(" Music, books,music ,, BOOKS ") == ["music", "books"]
+
+
+def test_candidates_share_at_least_one_term():
+    index = _index({1: [10, 11], 2: [11], 3: [12], 4: [10, 12]})
+    assert index.candidates(1) == {2, 4}
+    assert index.candidates(3) == {4}
+
+
+def test_set_user_replaces_terms_and_remove_user_cleans_postings():
+    index = _index({1: [10, 11], 2: [11]})
+    index.set_user(1, [12])
+    assert index.candidates(2) == set()
+    assert 10 not in index.postings
+
+    index.remove_user(1)
+    assert len(index) == 1
+    assert 12 not in index.postings
+    assert 1 not in index.names
+
+
+def test_scoring_modes():
+    index = _index({1: [10, 11], 2: [10, 11, 12, 13], 3: [11], 4: [12]})
+    assert index.scores(1, "overlap") == {2: 2.0, 3: 1.0}
+    assert index.scores(1, "jaccard") == {2: 0.5, 3: 0.5}
+    cosine = index.scores(1, "cosine")
+    assert cosine[3] == pytest.approx(index.idf(11) / (index.idf(10) ** 2 + index.idf(11) ** 2) ** 0.5)
+    # Ограниченный список кандидатов даёт те же оценки
+    assert index.scores(1, "cosine", candidates=[2, 3, 4]) == pytest.approx(cosine)
+
+    with pytest.raises(ValueError):
+        index.scores(1, "dice")
+
+
+def test_top_k_breaks_ties_by_user_id_and_pages_with_cursor():
+    index = _index({1: [10], 5: [10], 3: [10], 4: [10, 11], 2: [10]})
+    page, cursor = index.top_k(1, limit=2)
+    assert page == [(2, 1.0), (3, 1.0)]
+
+    page, cursor = index.top_k(1, limit=2, cursor=cursor)
+    assert page == [(5, 1.0), (4, 0.5)]
+    assert cursor is None
+
+
+def test_bad_cursor():
+    with pytest.raises(ValueError):
+        parse_cursor("nope")
+
+
+def test_get_me_users_returns_users_with_common_interests(client, sign_up):
+    headers = sign_up("a@x.com", interests="music, books")
+    sign_up("b@x.com", name="Bob Ray", interests="music, golf")
+    sign_up("c@x.com", name="Cid Moe", interests="chess, go")
+
+    response = client.get("/api/user/auth/get_me_users", headers=headers)
+    assert response.status_code == 200
+    users = response.json()["users"]
+    assert [user["name"] for user in users] == ["Bob Ray"]
+    assert sorted(users[0]["interests"]) == ["golf", "music"]
+
+
+def test_get_me_users_pagination(client, sign_up):
+    headers = sign_up("a@x.com", interests="music, books")
+    for i, interests in enumerate(["music, books", "music, golf", "books, chess", "music, books, golf"]):
+        sign_up(f"u{i}@x.com", name=f"User N{i}", interests=interests)
+
+    names, cursor = [], None
+    while True:
+        params = {"limit": 2, "mode": "overlap", **({"cursor": cursor} if cursor else {})}
+        body = client.get("/api/user/auth/get_me_users", params=params, headers=headers).json()
+        names += [user["name"] for user in body["users"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert names == ["User N0", "User N3", "User N1", "User N2"]
+
+    response = client.get("/api/user/auth/get_me_users", params={"cursor": "nope"}, headers=headers)
+    assert response.status_code == 400
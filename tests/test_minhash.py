@@ -0,0 +1,57 @@
+""" MinHash-сигнатуры и LSH-кандидаты """
+import pytest
+
+from project.minhash import LSHIndex, MinHasher
+
+
+def test_signature_roundtrip():
+    hasher = MinHasher(num_perm=8)
+    signature = hasher.signature([3, 1, 2])
+    assert signature == hasher.signature([1, 2, 3])
+    assert hasher.from_bytes(hasher.to_bytes(signature)) == signature
+    # Сигнатура с другим числом перестановок считается устаревшей
+    assert MinHasher(num_perm=4).from_bytes(hasher.to_bytes(signature)) is None
+
+
+def test_candidates_share_a_band():
+    index = LSHIndex(bands=8, rows=2)
+    index.set_user(1, index.hasher.signature([1, 2, 3]))
+    index.set_user(2, index.hasher.signature([1, 2, 3]))
+    index.set_user(3, index.hasher.signature([100, 200, 300]))
+    assert index.candidates(1) == {2}
+
+    index.remove_user(2)
+    assert index.candidates(1) == set()
+    assert index.candidates(2) == set()
+
+
+@pytest.fixture
+def lsh(client):
+    from project.minhash import lsh_index
+
+    yield lsh_index
+    lsh_index.clear()
+
+
+def test_load_lsh_index_saves_missing_signatures_in_one_insert(client, sign_up, lsh):
+    from project import crud, instrumentation
+    from project.db import database
+
+    for i in range(3):
+        sign_up(f"u{i}@x.com", interests="music, books")
+
+    def inserts() -> int:
+        return sum(series[2] for (_, _, caller), series in instrumentation.query_duration.series.items()
+                   if caller == "crud._save_signatures")
+
+    before = inserts()
+    client.portal.call(crud.load_lsh_index, database)
+    assert inserts() - before == 1
+    assert len(lsh) == 3
+    rows = client.portal.call(database.fetch_all, "SELECT user_id FROM interest_signatures")
+    assert len(rows) == 3
+
+    # Повторная загрузка берёт сигнатуры из БД и ничего не пишет
+    client.portal.call(crud.load_lsh_index, database)
+    assert inserts() - before == 1
+    assert len(lsh) == 3
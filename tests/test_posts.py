@@ -0,0 +1,147 @@
+""" Посты пользователя: создание и изменение """
+import time
+
+import pytest
+
+POSTS = "/api/user/auth/update_posts"
+
+
+@pytest.fixture
+def author(client, sign_up):
+    return sign_up("a@x.com")
+
+
+def _my_posts(client, headers) -> list:
+    return client.get("/api/user/auth/my_page/posts/", headers=headers).json()
+
+
+def _create(client, headers, title: str, content: str = "text") -> int:
+    """ Создаёт пост и возвращает его id (ответ на создание id не содержит) """
+    response = client.post(f"{POSTS}/", json={"title": title, "content": content}, headers=headers)
+    assert response.status_code == 200, response.text
+    return int(_my_posts(client, headers)[0]["id"])
+
+
+def test_patch_mine_post_changes_content_by_title(client, author):
+    _create(client, author, "hello")
+    _create(client, author, "other")
+    response = client.patch(f"{POSTS}/patch_mine_post/hello", json={"content": "changed"}, headers=author)
+    assert response.status_code == 200
+    assert {post["title"]: post["content"] for post in _my_posts(client, author)} == {
+        "hello": "changed", "other": "text",
+    }
+
+
+def test_update_post_by_id_checks_version(client, author):
+    post_id = _create(client, author, "hello")
+    response = client.patch(f"{POSTS}/{post_id}", json={"title": "new", "version": 1}, headers=author)
+    assert response.status_code == 200
+    post = response.json()
+    assert (post["title"], post["content"], post["version"]) == ("new", "text", 2)
+
+    # Клиент видел версию 1, а пост уже изменён
+    response = client.patch(f"{POSTS}/{post_id}", json={"content": "late", "version": 1}, headers=author)
+    assert response.status_code == 409
+
+
+def test_update_post_of_other_user_is_not_found(client, sign_up, author):
+    post_id = _create(client, author, "hello")
+    other = sign_up("b@x.com", name="Bob Ray")
+    assert client.patch(f"{POSTS}/{post_id}", json={"content": "x"}, headers=other).status_code == 404
+    assert client.patch(f"{POSTS}/{post_id}", json={"content": "x", "version": 1}, headers=other).status_code == 404
+
+
+def test_long_title_is_rejected(client, author):
+    post_id = _create(client, author, "hello")
+    long_title = "x" * 101
+    assert client.post(f"{POSTS}/", json={"title": long_title}, headers=author).status_code == 422
+    assert client.patch(f"{POSTS}/{post_id}", json={"title": long_title}, headers=author).status_code == 422
+
+
+def test_batch_reports_result_for_each_item(client, author):
+    response = client.post(f"{POSTS}/batch", json=[
+        {"title": "one", "content": "a"}, {"title": "x" * 101}, {"title": "two", "content": "b"},
+    ], headers=author)
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["created"], body["failed"]) == (2, 1)
+    assert [result["status"] for result in body["results"]] == ["created", "error", "created"]
+    assert sorted(post["title"] for post in _my_posts(client, author)) == ["one", "two"]
+
+
+def test_batch_accepts_ndjson(client, author):
+    body = b'{"title": "one"}\n\nnot json\n{"title": "two"}'
+    response = client.post(f"{POSTS}/batch", content=body,
+                           headers={**author, "Content-Type": "application/x-ndjson"})
+    assert [result["status"] for result in response.json()["results"]] == ["created", "error", "created"]
+
+
+def test_batch_too_large_inserts_nothing(client, author, monkeypatch):
+    monkeypatch.setattr("project.main.POSTS_BATCH_MAX", 2)
+    monkeypatch.setattr("project.main.POSTS_BATCH_CHUNK", 1)
+    response = client.post(f"{POSTS}/batch", json=[{"title": str(i)} for i in range(3)], headers=author)
+    assert response.status_code == 413
+    assert _my_posts(client, author) == []
+
+
+def test_batch_body_is_read_before_transaction(client, author, monkeypatch):
+    from project import main
+    from project.recommendations import matches_worker
+    from project.streaming import iter_ndjson_lines
+
+    events = []
+
+    async def lines(chunks):
+        async for line in iter_ndjson_lines(chunks):
+            events.append("line")
+            yield line
+
+    transaction = main.database.transaction
+
+    def recording_transaction(*args, **kwargs):
+        events.append("transaction")
+        return transaction(*args, **kwargs)
+
+    # Пересчёт матчей после регистрации пишет в своей транзакции - дожидаемся его, чтобы считать только свои
+    deadline = time.monotonic() + 5
+    while (matches_worker.dirty or matches_worker.in_progress) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    monkeypatch.setattr(main, "iter_ndjson_lines", lines)
+    monkeypatch.setattr(main.database, "transaction", recording_transaction)
+    response = client.post(f"{POSTS}/batch", content=b'{"title": "one"}\n{"title": "two"}',
+                           headers={**author, "Content-Type": "application/x-ndjson"})
+    assert response.json()["created"] == 2
+    assert events == ["line", "line", "transaction"]
+
+
+def test_batch_body_must_be_array(client, author):
+    assert client.post(f"{POSTS}/batch", json={"title": "one"}, headers=author).status_code == 400
+
+
+def _pages(client, headers, path: str) -> list:
+    """ Заголовки постов всех страниц ленты по курсору X-Next-Before """
+    titles, before = [], None
+    while True:
+        params = {"limit": 2, **({"before": before} if before else {})}
+        response = client.get(path, params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        titles.append([post["title"] for post in response.json()])
+        before = response.headers.get("X-Next-Before")
+        if before is None:
+            return titles
+
+
+def test_posts_feeds_page_from_newest(client, sign_up, author):
+    client.post(f"{POSTS}/batch", json=[{"title": str(i)} for i in range(5)], headers=author)
+    # Посты одной пачки получают одинаковый created_at: порядок внутри него задаёт id
+    expected = [["4", "3"], ["2", "1"], ["0"]]
+    assert _pages(client, author, "/api/user/auth/my_page/posts/") == expected
+
+    sign_up("b@x.com", name="Bob Ray")
+    assert _pages(client, author, f"{POSTS}/get_posts/Ann Lee") == expected
+    assert _pages(client, author, f"{POSTS}/get_posts/Bob Ray") == [[]]
+
+
+def test_bad_posts_cursor(client, author):
+    response = client.get("/api/user/auth/my_page/posts/", params={"before": "nope"}, headers=author)
+    assert response.status_code == 400
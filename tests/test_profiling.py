@@ -0,0 +1,58 @@
+""" Профилирование запросов: функция-источник запроса, N+1 и медленные запросы """
+import logging
+
+import sqlalchemy
+
+from project import profiling, request_context
+from project.models.models import users_table as users
+
+
+def _caller():
+    return profiling.query_caller(1)
+
+
+def test_query_caller_names_module_and_function():
+    assert _caller() == "test_profiling._caller"
+
+
+def test_is_select():
+    assert profiling.is_select(users.select())
+    assert profiling.is_select(sqlalchemy.text("  select 1"))
+    assert profiling.is_select("SELECT 1")
+    assert not profiling.is_select(users.delete())
+    assert not profiling.is_select(sqlalchemy.text("DELETE FROM users"))
+
+
+def test_repeated_query_is_reported_once(monkeypatch, caplog):
+    monkeypatch.setattr(profiling, "DEBUG", True)
+    monkeypatch.setattr(profiling, "DB_N_PLUS_ONE_THRESHOLD", 2)
+    query = users.select().where(users.c.id == 1)
+
+    token = request_context.begin()
+    try:
+        with caplog.at_level(logging.WARNING, logger="project.profiling"):
+            for _ in range(5):
+                profiling.track_request_query("crud.get_user", query)
+            profiling.track_request_query("crud.other", query)
+        assert profiling.request_query_count() == 6
+    finally:
+        request_context.end(token)
+
+    warnings = [record for record in caplog.records if "Possible N+1" in record.getMessage()]
+    assert len(warnings) == 1
+    assert "crud.get_user" in warnings[0].getMessage()
+    # Вне HTTP-запроса запросы не считаются
+    profiling.track_request_query("crud.get_user", query)
+    assert profiling.request_query_count() == 0
+
+
+def test_slow_select_is_explained(client, sign_up, monkeypatch, caplog):
+    headers = sign_up("a@x.com")
+    monkeypatch.setattr(profiling, "DB_SLOW_QUERY_MS", 0)
+    monkeypatch.setattr(profiling, "DB_EXPLAIN_SAMPLE_RATE", 1.0)
+    with caplog.at_level(logging.WARNING, logger="project.profiling"):
+        client.get("/api/user/auth/my_page/posts/", headers=headers)
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith("Slow query") and "crud.get_post_cu" in message for message in messages)
+    assert any(message.startswith("EXPLAIN ANALYZE for a slow query in crud.get_post_cu") for message in messages)
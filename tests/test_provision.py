@@ -0,0 +1,58 @@
+""" Массовое создание пользователей (python -m project.provision) """
+import asyncio
+import json
+import os
+
+import pytest
+
+from project import provision
+
+
+def test_checkpoint_roundtrip(tmp_path):
+    path = str(tmp_path / "users.checkpoint")
+    assert provision.read_checkpoint(path) == 0
+    provision.write_checkpoint(path, 42)
+    assert provision.read_checkpoint(path) == 42
+
+
+def test_read_csv_records(tmp_path):
+    path = tmp_path / "users.csv"
+    path.write_text('email,name,password,interests,posts\n'
+                    'a@x.com,Ann Lee,pw,"music, books","[{""title"": ""hi""}]"\n')
+    assert list(provision.read_records(str(path), "csv")) == [{
+        "email": "a@x.com", "name": "Ann Lee", "password": "pw", "interests": "music, books",
+        "posts": [{"title": "hi"}],
+    }]
+
+
+@pytest.mark.parametrize("mode", [[], ["--insert"]], ids=["copy", "insert"])
+def test_provision_users(client, tmp_path, mode):
+    from project.db import database
+
+    path = tmp_path / "users.ndjson"
+    records = [{"email": f"u{i}@x.com", "name": f"User N{i}", "password": f"pw{i}", "interests": "Music, books",
+                "posts": [{"title": f"post {i}"}]} for i in range(5)]
+    path.write_text("\n".join(json.dumps(record) for record in records[:3]) + "\n")
+
+    def run():
+        asyncio.run(provision.main(provision.parse_args(
+            [str(path), "--batch-size", "2", "--workers", "1", "--database-url", os.environ["TEST_DATABASE_URL"]] + mode
+        )))
+
+    run()
+    assert provision.read_checkpoint(f"{path}.checkpoint") == 3
+    # Повторный запуск продолжает с чекпоинта: первые строки не читаются заново
+    path.write_text("\n".join(json.dumps(record) for record in records) + "\n")
+    run()
+
+    def count(sql: str) -> int:
+        return client.portal.call(database.fetch_val, sql)
+
+    assert count("SELECT count(*) FROM users") == 5
+    assert count("SELECT count(*) FROM tokens") == 5
+    assert count("SELECT count(*) FROM posts") == 5
+    assert count("SELECT count(*) FROM user_interests") == 10
+    assert count("SELECT count(DISTINCT interests) FROM interests") == 1
+
+    response = client.post("/auth", data={"username": "u3@x.com", "password": "pw3"})
+    assert response.status_code == 200
@@ -0,0 +1,92 @@
+""" Предрасчёт похожих пользователей """
+import asyncio
+import random
+import time
+
+import pytest
+
+from project.matching import InterestIndex
+from project import recommendations
+from project.recommendations import MatchesWorker, compute_all_matches, compute_matches
+
+
+def test_compute_all_matches_equals_per_user_matches():
+    rng = random.Random(3)
+    index = InterestIndex()
+    for user_id in range(1, 120):
+        index.set_user(user_id, rng.sample(range(40), rng.randint(1, 5)))
+
+    bulk = compute_all_matches(index, top_n=10, mode="jaccard")
+    single = compute_matches(index, list(index.terms_by_user), top_n=10, mode="jaccard")
+    assert bulk.keys() == single.keys()
+    for user_id, page in single.items():
+        assert [uid for uid, _ in bulk[user_id]] == [uid for uid, _ in page]
+        assert [score for _, score in bulk[user_id]] == pytest.approx([score for _, score in page])
+
+
+@pytest.mark.parametrize("mode", ["jaccard", "overlap", "cosine"])
+def test_snapshot_scores_match_index_and_ignore_later_changes(mode):
+    rng = random.Random(5)
+    index = InterestIndex()
+    for user_id in range(1, 60):
+        index.set_user(user_id, rng.sample(range(20), rng.randint(1, 4)))
+    expected = index.top_k(1, 10, mode=mode)[0]
+
+    snapshot = index.snapshot(1, mode)
+    for user_id in range(2, 30):
+        index.set_user(user_id, [99])
+    index.remove_user(30)
+    assert snapshot.top_k(1, 10, mode=mode)[0] == pytest.approx(expected)
+
+
+def test_user_is_pending_until_matches_are_saved(monkeypatch):
+    index = InterestIndex()
+    index.set_user(1, [1, 2])
+    index.set_user(2, [1])
+    worker = MatchesWorker(index)
+    pending_while_saving = []
+
+    async def save_matches(db, matches):
+        pending_while_saving.extend(worker.is_pending(user_id) for user_id in matches)
+        saved.set()
+
+    async def run():
+        worker.start(db=None)
+        worker.mark_dirty([1, 2])
+        await saved.wait()
+        await asyncio.sleep(0)
+        await worker.stop()
+
+    monkeypatch.setattr(recommendations, "save_matches", save_matches)
+    saved = asyncio.Event()
+    asyncio.run(run())
+    assert pending_while_saving == [True, True]
+    assert not worker.is_pending(1) and not worker.is_pending(2)
+
+
+def test_interests_changed_skips_frequent_terms_over_the_limit():
+    index = InterestIndex()
+    for user_id in range(2, 8):
+        index.set_user(user_id, [1])
+    index.set_user(8, [2])
+    index.set_user(9, [2])
+    worker = MatchesWorker(index, max_affected=3)
+
+    worker.interests_changed(1, old_terms=[3], new_terms=[1, 2])
+    # Редкий интерес 2 влез в лимит, частый интерес 1 (6 пользователей) - нет
+    assert worker.dirty == {1, 8, 9}
+
+
+def test_matches_are_precomputed_after_sign_up(client, sign_up):
+    headers = sign_up("a@x.com", interests="music, books")
+    sign_up("b@x.com", name="Bob Ray", interests="music, golf")
+
+    deadline = time.monotonic() + 5
+    while True:
+        body = client.get("/api/user/auth/get_me_users", headers=headers).json()
+        if body["computed_at"] is not None or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert body["computed_at"] is not None
+    assert not body["pending"]
+    assert [user["name"] for user in body["users"]] == ["Bob Ray"]
@@ -0,0 +1,102 @@
+""" Число запросов к БД на один запрос к API: пользователь по токену, его интересы и посты читаются
+не больше одного раза за запрос, сколько бы зависимостей их ни использовали """
+import pytest
+
+from project import request_context
+from project.db import database
+
+# (метод, путь, тело, число запросов к БД). Кеш токенов и версий перед запросом пуст (см. фикстуру db_queries),
+# поэтому каждый запрос читает пользователя по токену - ровно один раз
+ROUTES = [
+    # пользователь + версия данных для ETag
+    ("GET", "/api/user/auth/my_page", None, 2),
+    # пользователь + версия + интересы
+    ("GET", "/api/user/auth/my_page/interests", None, 3),
+    # пользователь + версия + первая страница постов
+    ("GET", "/api/user/auth/my_page/posts/", None, 3),
+    ("GET", "/api/user/auth/my_page/posts/?limit=1", None, 3),
+    # пользователь + предрасчитанные матчи
+    ("GET", "/api/user/auth/get_me_users", None, 2),
+    # пользователь + лента
+    ("GET", "/api/user/auth/timeline", None, 2),
+    # пользователь + посты по имени
+    ("GET", "/api/user/auth/update_posts/get_posts/Ann Lee", None, 2),
+    # пользователь + интересы (одни на get_current_user и get_mine_interests) + словарь интересов (2)
+    # + UPDATE interests + замена user_interests (2) + версия
+    ("PATCH", "/api/user/auth/my_page/update_interests", {"interests": "golf, ski"}, 8),
+    # пользователь + INSERT поста + версия + раскладка по лентам и обрезка лент
+    ("POST", "/api/user/auth/update_posts/", {"title": "t", "content": "c"}, 5),
+    # пользователь + UPDATE постов + версия
+    ("PATCH", "/api/user/auth/update_posts/patch_mine_post/hello", {"title": "hello", "content": "x"}, 3),
+    # пользователь + DELETE постов + версия
+    ("DELETE", "/api/user/auth/update_posts/delete", None, 3),
+    # пользователь + DELETE users (остальное удаляют каскады)
+    ("DELETE", "/api/user/auth/my_page/delete_my_page", None, 2),
+    # пользователь + поиск
+    ("GET", "/api/user/auth/update_posts/search?q=hello", None, 2),
+    # пользователь + INSERT всей пачки + версия после коммита + раскладка по лентам и обрезка лент
+    ("POST", "/api/user/auth/update_posts/batch", [{"title": "t"}, {"title": "u"}], 5),
+    # пользователь + UPDATE ... RETURNING + версия
+    ("PATCH", "/api/user/auth/update_posts/1", {"content": "x", "version": 1}, 3),
+    # токен только требуется, пользователь не читается: одна страница списка
+    ("GET", "/api/user/auth/get_all_users", None, 1),
+    # администратор + список
+    ("GET", "/api/admin/all_users", None, 2),
+    # администратор + курсор выгрузки
+    ("GET", "/api/admin/export", None, 2),
+    # администратор + UPDATE users + версия
+    ("PATCH", "/api/admin/users/2/active?is_active=false", None, 3),
+    # только администратор
+    ("GET", "/api/admin/metrics/hashing", None, 1),
+    ("GET", "/api/admin/metrics/db", None, 1),
+]
+
+
+@pytest.mark.parametrize("method, path, body, expected", ROUTES, ids=[f"{m} {p}" for m, p, _, _ in ROUTES])
+def test_route_query_count(client, sign_up, db_queries, method, path, body, expected):
+    headers = sign_up("a@x.com")
+    sign_up("b@x.com", name="Bob Ray", interests="music, golf")
+    client.post("/api/user/auth/update_posts/", json={"title": "hello", "content": "world"}, headers=headers)
+    if path.startswith("/api/admin/"):
+        client.portal.call(database.execute, "UPDATE users SET is_superuser = true WHERE email = 'a@x.com'")
+
+    assert db_queries(method, path, headers=headers, json=body) == expected
+
+
+def test_routes_cover_all_authenticated_endpoints():
+    """ В ROUTES есть каждый роут, которому нужен токен: новый роут без ожидаемого числа запросов не пропустить """
+    from fastapi.routing import APIRoute
+    from project.main import app, oauth2_scheme
+
+    def needs_token(dependant) -> bool:
+        return any(dependency.call is oauth2_scheme or needs_token(dependency) for dependency in dependant.dependencies)
+
+    routes = [route for route in app.routes if isinstance(route, APIRoute)]
+    expected = {(method, route.path) for route in routes if needs_token(route.dependant) for method in route.methods}
+    covered = {(method, route.path) for method, path, _, _ in ROUTES for route in routes
+               if method in route.methods and route.path_regex.match(path.split("?")[0])}
+    assert covered == expected
+
+
+def test_token_cache_removes_user_lookup(client, sign_up):
+    headers = sign_up("a@x.com")
+    client.get("/api/user/auth/my_page", headers=headers)
+
+    response = client.get("/api/user/auth/my_page", headers=headers)
+    assert response.headers["X-DB-Queries"] == "0"
+
+
+def test_memo_is_request_scoped():
+    assert request_context.is_missing(request_context.memo_get("key"))
+    token = request_context.begin()
+    try:
+        request_context.memo_set("key", 1)
+        assert request_context.memo_get("key") == 1
+        request_context.memo_forget("key")
+        assert request_context.is_missing(request_context.memo_get("key"))
+        request_context.memo_set("key", 2)
+    finally:
+        request_context.end(token)
+    # Вне запроса запоминать некуда
+    request_context.memo_set("key", 3)
+    assert request_context.is_missing(request_context.memo_get("key"))
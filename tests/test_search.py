@@ -0,0 +1,65 @@
+""" Полнотекстовый поиск по постам """
+from project.posts.search import CONTENT_WEIGHT, TITLE_WEIGHT, PostsSearchIndex, tokenize
+
+SEARCH = "/api/user/auth/update_posts/search"
+
+
+def _post(post_id: int, title: str, content: str = "") -> dict:
+    return {"id": post_id, "user_id": 1, "title": title, "content": content}
+
+
+def test_tokenize():
+    assert tokenize("Hello, World! hello_world 42") == ["hello", "world", "hello_world", "42"]
+    assert tokenize(None) == []
+
+
+def test_index_requires_all_words_and_ranks_title_higher():
+    index = PostsSearchIndex()
+    index.load([_post(1, "jazz", "music"), _post(2, "music jazz"), _post(3, "jazz")])
+    hits = index.search("Jazz music", limit=10)
+    assert [(hit["id"], hit["rank"]) for hit in hits] == [
+        (2, 2 * TITLE_WEIGHT), (1, TITLE_WEIGHT + CONTENT_WEIGHT),
+    ]
+    assert index.search("", limit=10) == []
+
+
+def test_index_pages_and_reindexes():
+    index = PostsSearchIndex()
+    index.load([_post(post_id, "jazz") for post_id in range(1, 5)])
+    first = index.search("jazz", limit=2)
+    after = (-first[-1]["rank"], first[-1]["id"])
+    assert [hit["id"] for hit in first + index.search("jazz", limit=2, after=after)] == [1, 2, 3, 4]
+    # Ранжируются только самые новые кандидаты
+    assert [hit["id"] for hit in index.search("jazz", limit=10, max_candidates=2)] == [3, 4]
+
+    index.add(_post(1, "blues"))
+    index.remove(2)
+    assert [hit["id"] for hit in index.search("jazz", limit=10)] == [3, 4]
+    assert [hit["id"] for hit in index.search("blues", limit=10)] == [1]
+
+
+def test_search_route(client, sign_up):
+    headers = sign_up("a@x.com")
+    client.post("/api/user/auth/update_posts/batch", json=[
+        {"title": "about cats", "content": "jazz is here"},
+        {"title": "jazz night", "content": "live music"},
+        {"title": "nothing", "content": "else"},
+    ], headers=headers)
+
+    response = client.get(SEARCH, params={"q": "jazz"}, headers=headers)
+    assert response.status_code == 200
+    hits = response.json()
+    assert [hit["title"] for hit in hits] == ["jazz night", "about cats"]
+    assert hits[0]["rank"] > hits[1]["rank"]
+
+    first = client.get(SEARCH, params={"q": "jazz", "limit": 1}, headers=headers)
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get(SEARCH, params={"q": "jazz", "limit": 1, "cursor": cursor}, headers=headers)
+    assert [hit["title"] for hit in first.json() + second.json()] == ["jazz night", "about cats"]
+
+    # Изменённый пост ищется по новому тексту
+    client.patch("/api/user/auth/update_posts/patch_mine_post/nothing", json={"content": "jazz"}, headers=headers)
+    titles = [hit["title"] for hit in client.get(SEARCH, params={"q": "jazz"}, headers=headers).json()]
+    assert sorted(titles) == ["about cats", "jazz night", "nothing"]
+
+    assert client.get(SEARCH, params={"q": "jazz", "cursor": "bad"}, headers=headers).status_code == 400
@@ -0,0 +1,69 @@
+""" Быстрая сериализация строк БД в JSON должна давать тот же ответ, что и FastAPI с response_model """
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+from project import schemas
+from project.serialization import RowSerializer, dumps
+
+EXPIRES = datetime(2026, 1, 2, 3, 4, 5, 678000)
+
+
+def test_dumps_datetime_like_jsonable_encoder():
+    value = {"at": EXPIRES, "n": 1}
+    assert json.loads(dumps(value)) == jsonable_encoder(value)
+
+
+def test_row_serializer_converts_fields():
+    row = {"id": 7, "email": "a@x.com", "name": "ann lee", "interests": "music, books", "extra": 1}
+    assert json.loads(schemas.user_base_serializer.dumps(row)) == {
+        "id": "7", "email": "a@x.com", "name": "ann lee", "interests": "music, books",
+    }
+
+
+def test_nested_schema_and_exclude_unset():
+    row = {"id": 1, "email": "a@x.com", "name": "ann lee", "is_active": True, "is_superuser": False,
+           "token": {"token": "t", "expires": EXPIRES, "token_type": "bearer"}}
+    expected = schemas.FullUser(**row, interests="music, books").dict(exclude_unset=True)
+    del expected["interests"]
+    assert json.loads(schemas.full_user_serializer.dumps(row)) == jsonable_encoder(expected)
+
+
+def test_debug_validates_rows(monkeypatch):
+    monkeypatch.setattr("project.serialization.DEBUG", True)
+    serializer = RowSerializer(schemas.PostsIn)
+    with pytest.raises(ValueError):
+        serializer.dumps_many([{"title": "x" * 101}])
+
+
+@pytest.fixture
+def two_users(client, sign_up):
+    headers = sign_up("a@x.com")
+    bob = sign_up("b@x.com", name="Bob Ray", interests="music, golf")
+    client.post("/api/user/auth/update_posts/", json={"title": "hello", "content": "world"}, headers=headers)
+    client.post("/api/user/auth/update_posts/", json={"title": "hi"}, headers=bob)
+    return headers
+
+
+@pytest.mark.parametrize("path", ["/api/user/auth/get_all_users", "/secret/auth/users/get_all_ui?user_id=1"])
+def test_fast_path_matches_response_model(client, two_users, monkeypatch, path):
+    responses = []
+    for fast in (True, False):
+        monkeypatch.setattr("project.main.FAST_JSON", fast)
+        response = client.get(path, headers=two_users)
+        assert response.status_code == 200
+        responses.append(response.json())
+    assert responses[0] == responses[1]
+    assert responses[0]
+
+
+@pytest.mark.parametrize("path", ["/api/user/auth/my_page/posts/", "/api/user/auth/update_posts/get_posts/Bob Ray"])
+def test_prebuilt_posts_page_matches_response_model(client, two_users, path):
+    """ Первая страница постов собирается в JSON заранее (и кешируется), следующие идут через response_model """
+    first = client.get(path, headers=two_users).json()
+    # Курсор "из будущего": та же страница, но обычным путём
+    other = client.get(path, params={"before": "2100-01-01T00:00:00,1"}, headers=two_users).json()
+    assert first == other
+    assert first
@@ -0,0 +1,40 @@
+""" Регистрация одним запросом (CTE): пользователь, интересы и токен """
+SIGN_UP = "/api/user/sign-up"
+
+
+def _body(email: str, interests: str = "music, books") -> dict:
+    return {"email": email, "name": "ann lee", "password": "pw", "repeating_password": "pw", "interests": interests}
+
+
+def test_sign_up_creates_user_interests_and_token(client):
+    response = client.post(SIGN_UP, json=_body("a@x.com", interests="Music,  books, music"))
+    assert response.status_code == 200, response.text
+    user = response.json()
+    assert (user["email"], user["name"], user["interests"]) == ("a@x.com", "Ann Lee", "music, books")
+    assert user["token"]["token"]
+
+    headers = {"Authorization": "Bearer a@x.com"}
+    assert client.get("/api/user/auth/my_page/interests", headers=headers).json()["interests"] == "music, books"
+
+
+def test_sign_up_is_one_query_when_terms_are_known(client):
+    client.post(SIGN_UP, json=_body("a@x.com"))
+    response = client.post(SIGN_UP, json=_body("b@x.com"))
+    assert response.status_code == 200
+    assert response.headers["X-DB-Queries"] == "1"
+
+
+def test_taken_email_changes_nothing(client):
+    from project.db import database
+
+    client.post(SIGN_UP, json=_body("a@x.com"))
+    response = client.post(SIGN_UP, json=_body("a@x.com", interests="golf, ski"))
+    assert response.status_code == 418
+    for table in ("users", "interests", "tokens"):
+        assert client.portal.call(database.fetch_val, f"SELECT count(*) FROM {table}") == 1
+    assert client.portal.call(database.fetch_val, "SELECT count(*) FROM user_interests") == 2
+
+
+def test_passwords_must_match(client):
+    response = client.post(SIGN_UP, json=dict(_body("a@x.com"), repeating_password="other"))
+    assert response.status_code == 422
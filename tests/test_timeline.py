@@ -0,0 +1,63 @@
+""" Домашняя лента: раскладка при публикации и подмешивание при чтении """
+from datetime import datetime
+
+from project.posts.timeline import merge_feeds
+
+TIMELINE = "/api/user/auth/timeline"
+POSTS = "/api/user/auth/update_posts/"
+
+
+def test_merge_feeds_orders_and_deduplicates():
+    day = datetime(2026, 1, 1)
+    first = [{"id": 3, "created_at": day}, {"id": 1, "created_at": day}]
+    second = [{"id": 3, "created_at": day}, {"id": 2, "created_at": day}]
+    assert [post["id"] for post in merge_feeds([first, second], limit=10)] == [3, 2, 1]
+    assert [post["id"] for post in merge_feeds([first, second], limit=2)] == [3, 2]
+
+
+def _titles(client, headers, **params) -> list:
+    response = client.get(TIMELINE, params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return [post["title"] for post in response.json()]
+
+
+def test_post_reaches_readers_with_common_interests(client, sign_up):
+    reader = sign_up("a@x.com", interests="music, books")
+    author = sign_up("b@x.com", name="Bob Ray", interests="music, golf")
+    stranger = sign_up("c@x.com", name="Cid Moe", interests="chess, go")
+
+    client.post(POSTS, json={"title": "hello"}, headers=author)
+    assert _titles(client, reader) == ["hello"]
+    assert _titles(client, stranger) == []
+    assert _titles(client, author) == []
+
+
+def test_timeline_is_trimmed(client, sign_up, monkeypatch):
+    monkeypatch.setattr("project.crud.TIMELINE_MAX_LENGTH", 2)
+    reader = sign_up("a@x.com")
+    author = sign_up("b@x.com", name="Bob Ray")
+    for title in ("one", "two", "three"):
+        client.post(POSTS, json={"title": title}, headers=author)
+    assert _titles(client, reader) == ["three", "two"]
+
+
+def test_batch_posts_reach_readers(client, sign_up, monkeypatch):
+    monkeypatch.setattr("project.crud.TIMELINE_MAX_LENGTH", 2)
+    reader = sign_up("a@x.com")
+    author = sign_up("b@x.com", name="Bob Ray")
+    client.post(POSTS + "batch", json=[{"title": "one"}, {"title": "two"}, {"title": "three"}], headers=author)
+    assert _titles(client, reader) == ["three", "two"]
+
+
+def test_popular_author_is_merged_on_read(client, sign_up, monkeypatch):
+    monkeypatch.setattr("project.crud.TIMELINE_FANOUT_MAX_DEGREE", 1)
+    readers = [sign_up("a@x.com"), sign_up("c@x.com", name="Cid Moe")]
+    author = sign_up("b@x.com", name="Bob Ray")
+    client.post(POSTS, json={"title": "one"}, headers=author)
+    client.post(POSTS, json={"title": "two"}, headers=author)
+
+    from project.posts import timeline
+    assert len(timeline.fanout_on_read_authors) == 1
+    for headers in readers:
+        assert _titles(client, headers) == ["two", "one"]
+        assert _titles(client, headers, limit=1) == ["two"]
@@ -0,0 +1,49 @@
+""" Списки пользователей: постраничный вывод и потоковая выгрузка """
+import json
+
+
+def _sign_up_many(sign_up, count: int) -> dict:
+    headers = sign_up("a@x.com")
+    for i in range(count):
+        sign_up(f"u{i}@x.com", name=f"User N{i}", interests="music, golf")
+    return headers
+
+
+def test_get_all_users_pages_by_id(client, sign_up):
+    headers = _sign_up_many(sign_up, 4)
+
+    emails, after = [], None
+    while True:
+        params = {"limit": 2, **({"after": after} if after is not None else {})}
+        response = client.get("/api/user/auth/get_all_users", params=params, headers=headers)
+        assert response.status_code == 200
+        emails += [user["email"] for user in response.json()]
+        after = response.headers.get("X-Next-After")
+        if after is None:
+            break
+    assert emails == ["a@x.com", "u0@x.com", "u1@x.com", "u2@x.com", "u3@x.com"]
+
+
+def test_get_all_users_stream(client, sign_up):
+    headers = _sign_up_many(sign_up, 3)
+    response = client.get("/api/user/auth/get_all_users", params={"stream": True}, headers=headers)
+    assert response.headers["content-type"] == "application/x-ndjson"
+    users = [json.loads(line) for line in response.text.splitlines()]
+    assert [user["email"] for user in users] == ["a@x.com", "u0@x.com", "u1@x.com", "u2@x.com"]
+    assert users[1] == {"id": users[1]["id"], "email": "u0@x.com", "name": "User N0", "interests": "music, golf"}
+
+
+def test_get_all_ui_excludes_user(client, sign_up):
+    _sign_up_many(sign_up, 2)
+    response = client.get("/secret/auth/users/get_all_ui", params={"user_id": 1, "limit": 1})
+    assert [user["email"] for user in response.json()] == ["u0@x.com"]
+    assert response.headers["X-Next-After"] == "2"
+
+    response = client.get("/secret/auth/users/get_all_ui", params={"user_id": 1, "stream": True})
+    assert [json.loads(line)["email"] for line in response.text.splitlines()] == ["u0@x.com", "u1@x.com"]
+
+
+def test_page_limit_is_checked(client, sign_up):
+    headers = sign_up("a@x.com")
+    response = client.get("/api/user/auth/get_all_users", params={"limit": 10_000}, headers=headers)
+    assert response.status_code == 400